@@ -6,28 +6,33 @@ Script para adicionar textos às imagens do e-book Genesis
 from PIL import Image, ImageDraw, ImageFont
 import json
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from ternarius_atlas.text_layout import wrap_text
+from ternarius_atlas.fonts import describe_font
+from ternarius_atlas.page_composer import blend_rectangle
+from ternarius_atlas.build_manifest import BuildManifest, hash_file, hash_inputs
+from ternarius_atlas.image_writer import ImageWriter
+
+# Layout (faz parte do manifesto: alterar estes valores refaz todas as páginas)
+TEXT_AREA_RATIO = 0.35
+PADDING = 30
+LINE_SPACING = 1.5
+TEXT_BACKGROUND = (255, 255, 255, 220)
 
 def add_text_to_image(base_image, text, page_number):
     """Adiciona texto a uma imagem de forma legível"""
-    result = base_image.copy().convert('RGBA')
+    result = base_image.convert('RGB') if base_image.mode != 'RGB' else base_image.copy()
     width, height = result.size
     
-    # Criar overlay com texto
-    overlay = Image.new('RGBA', result.size, (0, 0, 0, 0))
-    overlay_draw = ImageDraw.Draw(overlay)
-    
     # Área de texto na parte inferior (35% da imagem)
-    text_area_height = int(height * 0.35)
+    text_area_height = int(height * TEXT_AREA_RATIO)
     text_area_y = height - text_area_height
     
-    # Fundo semi-transparente branco para o texto
-    overlay_draw.rectangle(
-        [(0, text_area_y), (width, height)],
-        fill=(255, 255, 255, 220)
-    )
-    
-    # Composite overlay
-    result = Image.alpha_composite(result, overlay).convert('RGB')
+    # Fundo semi-transparente branco para o texto (só a área do texto é misturada)
+    blend_rectangle(result, (0, text_area_y, width, height), TEXT_BACKGROUND[:3], TEXT_BACKGROUND[3])
     draw = ImageDraw.Draw(result)
     
     # Fonte
@@ -37,29 +42,13 @@ def add_text_to_image(base_image, text, page_number):
         font = None
     
     # Quebrar texto em linhas
-    words = text.split()
-    lines = []
-    current_line = []
-    padding = 30
-    max_width = width - 2 * padding
-    
-    for word in words:
-        test_line = ' '.join(current_line + [word])
-        bbox = draw.textbbox((0, 0), test_line, font=font)
-        if bbox[2] - bbox[0] <= max_width:
-            current_line.append(word)
-        else:
-            if current_line:
-                lines.append(' '.join(current_line))
-            current_line = [word]
-    
-    if current_line:
-        lines.append(' '.join(current_line))
+    padding = PADDING
+    lines = wrap_text(text, width - 2 * padding, font)
     
     # Desenhar texto
     y_pos = text_area_y + padding
     bbox = draw.textbbox((0, 0), "Ay", font=font)
-    line_height = int((bbox[3] - bbox[1]) * 1.5)
+    line_height = int((bbox[3] - bbox[1]) * LINE_SPACING)
     
     # Limitar número de linhas
     max_lines = (text_area_height - 2 * padding - 30) // line_height
@@ -87,56 +76,83 @@ def add_title_to_cover(base_image, title):
     """Adiciona título à capa (imagem já tem o título, então retorna como está)"""
     return base_image
 
-# Carregar estrutura
-output_dir = "output/as_maravilhosas_historias_de_genesis"
-with open(os.path.join(output_dir, "structure.json"), 'r', encoding='utf-8') as f:
-    structure = json.load(f)
+def main():
+    """Adiciona os textos a todas as páginas do e-book"""
+    # Carregar estrutura
+    output_dir = "output/as_maravilhosas_historias_de_genesis"
+    with open(os.path.join(output_dir, "structure.json"), 'r', encoding='utf-8') as f:
+        structure = json.load(f)
 
-print("📝 Adicionando textos às imagens...")
+    manifest = BuildManifest(output_dir)
+    writer = ImageWriter()  # Salva cada página em segundo plano enquanto a próxima é desenhada
+    layout = [TEXT_AREA_RATIO, PADDING, LINE_SPACING, TEXT_BACKGROUND, describe_font(ImageFont.load_default())]
+    reused = 0
 
-for i, page in enumerate(structure['pages'], 1):
-    print(f"\n📄 Processando página {i}/{len(structure['pages'])}...")
-    
-    # Nome do arquivo base
-    base_filename = f"page_{i:03d}_"
-    
-    # Encontrar arquivo de imagem correspondente
-    image_files = [f for f in os.listdir(output_dir) if f.startswith(base_filename) and not f.endswith('_final.png')]
-    
-    if not image_files:
-        print(f"   ⚠️  Imagem não encontrada para página {i}")
-        continue
-    
-    image_path = os.path.join(output_dir, image_files[0])
-    base_image = Image.open(image_path)
-    
-    # Adicionar texto
-    if page['type'] == 'cover':
-        # Capa já tem título desenhado
-        final_image = add_title_to_cover(base_image, page['title'])
-    else:
-        # Juntar título e texto
-        full_text = ""
-        if page.get('title'):
-            full_text = f"{page['title']}\n\n"
-        full_text += page.get('text', '')
-        
-        final_image = add_text_to_image(base_image, full_text, i)
-    
-    # Salvar imagem final
-    final_filename = f"page_{i:03d}_final.png"
-    final_path = os.path.join(output_dir, final_filename)
-    final_image.save(final_path)
-    
-    print(f"   ✅ Salva: {final_filename}")
-
-print("\n" + "=" * 70)
-print("🎉 E-BOOK COMPLETO!")
-print("=" * 70)
-print(f"✅ {len(structure['pages'])} páginas finais geradas!")
-print(f"📁 Localização: {output_dir}/")
-print(f"\n📚 Arquivos finais:")
-for i in range(1, len(structure['pages']) + 1):
-    print(f"   • page_{i:03d}_final.png")
-
-print("\n✨ Processo concluído com sucesso! ✨")
+    print("📝 Adicionando textos às imagens...")
+
+    for i, page in enumerate(structure['pages'], 1):
+        print(f"\n📄 Processando página {i}/{len(structure['pages'])}...")
+
+        # Nome do arquivo base
+        base_filename = f"page_{i:03d}_"
+
+        # Encontrar arquivo de imagem correspondente
+        image_files = [f for f in os.listdir(output_dir) if f.startswith(base_filename) and '_final.' not in f]
+
+        if not image_files:
+            print(f"   ⚠️  Imagem não encontrada para página {i}")
+            continue
+
+        image_path = os.path.join(output_dir, image_files[0])
+        final_path = writer.path(os.path.join(output_dir, f"page_{i:03d}_final.png"))
+        final_filename = os.path.basename(final_path)
+
+        # Só refazer páginas cujo texto, imagem ou layout mudaram
+        inputs = hash_inputs(page['type'], page.get('title'), page.get('text'), i, hash_file(image_path), layout)
+        if manifest.is_current('pages', i, inputs, final_path):
+            print(f"   ♻️  Sem alterações: {final_filename}")
+            reused += 1
+            continue
+
+        base_image = Image.open(image_path)
+
+        # Adicionar texto
+        if page['type'] == 'cover':
+            # Capa já tem título desenhado
+            final_image = add_title_to_cover(base_image, page['title'])
+        else:
+            # Juntar título e texto
+            full_text = ""
+            if page.get('title'):
+                full_text = f"{page['title']}\n\n"
+            full_text += page.get('text', '')
+
+            final_image = add_text_to_image(base_image, full_text, i)
+
+        # Salvar imagem final (registrada no manifesto quando estiver no disco)
+        def record(path, page_number=i, page_inputs=inputs):
+            manifest.record('pages', page_number, page_inputs, path)
+            manifest.save()
+
+        writer.submit(final_image, final_path, callback=record)
+
+        print(f"   ✅ Salvando: {final_filename}")
+
+    writer.close()
+
+    print("\n" + "=" * 70)
+    print("🎉 E-BOOK COMPLETO!")
+    print("=" * 70)
+    print(f"✅ {len(structure['pages'])} páginas finais geradas!")
+    if reused:
+        print(f"♻️  {reused} páginas sem alterações foram reaproveitadas")
+    print(f"📁 Localização: {output_dir}/")
+    print(f"\n📚 Arquivos finais:")
+    for i in range(1, len(structure['pages']) + 1):
+        print(f"   • {os.path.basename(writer.path(f'page_{i:03d}_final.png'))}")
+
+    print("\n✨ Processo concluído com sucesso! ✨")
+
+
+if __name__ == "__main__":
+    main()
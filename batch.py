@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Geração de vários e-books sem interação (modo lote)
+
+Lê uma lista de temas (JSONL ou CSV com as colunas "theme" e "instructions")
+e gera todos os livros, compartilhando um único gerador de texto e um único
+gerador de imagens. O progresso fica salvo em um arquivo de estado, então uma
+execução interrompida continua de onde parou ao ser executada novamente.
+
+Uso:
+    python batch.py temas.jsonl
+    python batch.py temas.csv --jobs 3 --output output
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from ternarius_atlas.build_manifest import hash_inputs
+from ternarius_atlas.config import config
+from ternarius_atlas.tracing import tracer
+from main import InteractiveEbookGenerator
+
+
+STATE_FILENAME = "batch_state.json"
+
+
+def load_jobs(path: str) -> list:
+    """Lê os temas de um arquivo JSONL ou CSV"""
+    jobs = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    for row in rows:
+        theme = (row.get('theme') or row.get('tema') or '').strip()
+        if not theme:
+            continue
+        instructions = (row.get('instructions') or row.get('instrucoes') or '').strip()
+        jobs.append({
+            # The id only depends on the request, so reordering the file keeps progress
+            'id': hash_inputs(theme, instructions)[:16],
+            'theme': theme,
+            'instructions': instructions,
+        })
+    return jobs
+
+
+class BatchState:
+    """Progresso de cada livro, salvo a cada mudança"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.books = {}
+        self._lock = threading.RLock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.books = json.load(f).get('books', {})
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            return dict(self.books.get(job_id, {}))
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            self.books.setdefault(job_id, {}).update(fields)
+            data = json.dumps({'books': self.books}, ensure_ascii=False, indent=2)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+
+    def claim_folder(self, job_id: str, folder_name: str) -> str:
+        """Reserva um nome de pasta, adicionando um sufixo se outro livro já o usa"""
+        with self._lock:
+            taken = {book.get('folder_name') for other_id, book in self.books.items() if other_id != job_id}
+            candidate, suffix = folder_name, 2
+            while candidate in taken:
+                candidate = f"{folder_name}_{suffix}"
+                suffix += 1
+            self.update(job_id, folder_name=candidate)
+            return candidate
+
+
+class BatchRunner:
+    """Gera vários livros compartilhando os geradores de texto e imagem"""
+
+    def __init__(self, output_root: str = 'output', jobs: int = None, text_generator=None, image_generator=None):
+        self.output_root = output_root
+        self.jobs = jobs or config.BATCH_CONCURRENT_BOOKS
+        os.makedirs(output_root, exist_ok=True)
+        self.state = BatchState(os.path.join(output_root, STATE_FILENAME))
+
+        # One warm model handle and one image backend for every book
+        shared = InteractiveEbookGenerator(text_generator, image_generator, output_root)
+        self.text_generator = shared.text_generator
+        self.image_generator = shared.image_generator
+        shared.close()
+
+        # Books composite in parallel, so split the CPUs between them
+        self.composite_workers = max(1, config.COMPOSITE_WORKERS // self.jobs)
+
+    def run_book(self, job: dict) -> str:
+        """Gera (ou continua) um livro e retorna sua pasta"""
+        generator = InteractiveEbookGenerator(
+            text_generator=self.text_generator,
+            image_generator=self.image_generator,
+            output_root=self.output_root
+        )
+        generator.composite_workers = self.composite_workers
+        try:
+            book = self.state.get(job['id'])
+
+            folder = os.path.join(self.output_root, book['folder_name']) if book.get('folder_name') else None
+            if folder and os.path.exists(os.path.join(folder, 'structure.json')):
+                # The structure was approved in a previous run; the build manifest
+                # skips every image and page that was already finished
+                generator.load_structure(folder)
+            else:
+                generator.generate_structure(job['theme'], job['instructions'])
+                folder_name = self.state.claim_folder(
+                    job['id'], generator.sanitize_folder_name(generator.book_title)
+                )
+                generator.create_output_folder(folder_name)
+                self.state.update(job['id'], theme=job['theme'], title=generator.book_title, status='structure')
+
+            generator.generate_images(verbose=False)
+            self.state.update(job['id'], status='images')
+
+            generator.compose_final_pages(verbose=False)
+            generator.package_book(verbose=False)
+            self.state.update(job['id'], status='done', finished_at=time.time())
+            return generator.output_folder
+        finally:
+            # Each book has its own writer thread; stop it once the book is done
+            generator.close()
+
+    def run(self, jobs: list) -> int:
+        """Gera todos os livros pendentes e retorna quantos falharam"""
+        pending = [job for job in jobs if self.state.get(job['id']).get('status') != 'done']
+        skipped = len(jobs) - len(pending)
+
+        print(f"📚 {len(jobs)} livros na lista, {skipped} já concluídos, {len(pending)} pendentes")
+        print(f"⚙️  {self.jobs} livros em paralelo")
+
+        start_time = time.time()
+        completed = failed = 0
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {executor.submit(self.run_book, job): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    folder = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.state.update(job['id'], status='failed', error=str(e))
+                    print(f"❌ Falha em '{job['theme'][:50]}': {e}")
+                    continue
+
+                completed += 1
+                hours = (time.time() - start_time) / 3600
+                print(f"✅ [{completed + failed}/{len(pending)}] {folder} "
+                      f"({completed / hours:.1f} livros/hora)")
+
+        elapsed = time.time() - start_time
+        print("\n" + "=" * 70)
+        print(f"🎉 {completed} livros gerados em {elapsed / 60:.1f} min"
+              + (f" — {completed / (elapsed / 3600):.1f} livros/hora" if completed else ""))
+        if failed:
+            print(f"⚠️  {failed} livros falharam; execute novamente para tentar de novo")
+        return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerar vários e-books a partir de uma lista de temas")
+    parser.add_argument('themes', help="Arquivo JSONL ou CSV com os campos theme e instructions")
+    parser.add_argument('--output', default='output', help="Pasta onde os livros são criados")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help=f"Livros gerados em paralelo (padrão: {config.BATCH_CONCURRENT_BOOKS})")
+    parser.add_argument('--trace', action='store_true',
+                        help="Medir o tempo de cada etapa e salvar trace.json na pasta de saída")
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enabled = True
+
+    jobs = load_jobs(args.themes)
+    if not jobs:
+        print("❌ Erro: Nenhum tema encontrado no arquivo!")
+        return 1
+
+    runner = BatchRunner(args.output, args.jobs)
+    failed = runner.run(jobs)
+
+    if tracer.enabled:
+        # Spans of every book, interleaved as they ran
+        trace_path = tracer.export_chrome(os.path.join(args.output, 'trace.json'))
+        print("\n⏱️  Tempo por etapa:")
+        print(tracer.format_summary())
+        print(f"📁 Trace: {trace_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Operação cancelada. Execute novamente para continuar de onde parou.")
+        sys.exit(1)
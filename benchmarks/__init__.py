@@ -0,0 +1,3 @@
+"""
+Benchmark harness for Ternarius Atlas (see run_benchmarks.py)
+"""
@@ -0,0 +1,196 @@
+"""
+Benchmark cases for the composition and generation hot paths
+
+Each case is a setup function returning the callable to time and the number
+of work items one call handles. Setup (fonts, input images, stubs) is not
+timed.
+"""
+
+import atexit
+import contextlib
+import os
+import shutil
+import tempfile
+from typing import Callable, Dict, Tuple
+
+from PIL import Image, ImageDraw
+
+from .stubs import (
+    OfflineModel,
+    StubDiffusionPipeline,
+    book_structure,
+    sample_text,
+    structure_as_text,
+)
+
+
+# name -> (setup, default repeat)
+CASES: Dict[str, Tuple[Callable[..., Tuple[Callable[[], object], int]], int]] = {}
+
+PAGE_TEXT = sample_text(220, seed=7)
+
+
+def case(name: str, repeat: int = 20):
+    """Register a benchmark case"""
+    def register(setup):
+        CASES[name] = (setup, repeat)
+        return setup
+    return register
+
+
+def _background(width: int = 800, height: int = 1200) -> Image.Image:
+    return StubDiffusionPipeline().generate_image("fundo", width, height)
+
+
+def _temporary_folder() -> str:
+    folder = tempfile.mkdtemp(prefix='ternarius_bench_')
+    atexit.register(shutil.rmtree, folder, ignore_errors=True)
+    return folder
+
+
+@case('composer.wrap_text', repeat=200)
+def wrap_text(**options):
+    from ternarius_atlas.page_composer import PageComposer
+
+    composer = PageComposer()
+    draw = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+    return lambda: composer._wrap_text(PAGE_TEXT, 700, draw, composer.font), 1
+
+
+@case('composer.create_page', repeat=30)
+def create_page(**options):
+    from ternarius_atlas.page_composer import PageComposer
+
+    composer = PageComposer()
+    image = _background(400, 300)
+    return lambda: composer.create_page(PAGE_TEXT, image, page_number=3, title="Capítulo 1"), 1
+
+
+@case('composer.add_text_to_page', repeat=30)
+def add_text_to_page(**options):
+    from ternarius_atlas.page_composer import PageComposer
+
+    composer = PageComposer()
+    background = _background()
+    return lambda: composer.add_text_to_page(background, PAGE_TEXT, page_number=3), 1
+
+
+@case('composer.add_text_to_cover', repeat=30)
+def add_text_to_cover(**options):
+    from ternarius_atlas.page_composer import PageComposer
+
+    composer = PageComposer()
+    background = _background()
+    return lambda: composer.add_text_to_cover(background, "O Jardim das Cores"), 1
+
+
+@case('image_generator.generate_image', repeat=20)
+def generate_image(**options):
+    from ternarius_atlas.image_generator import ImageGenerator
+
+    generator = ImageGenerator()
+    prompt = sample_text(30, seed=3)
+    return lambda: generator.generate_image(prompt, 512, 512), 1
+
+
+@case('image_generator.generate_cover_image', repeat=20)
+def generate_cover_image(**options):
+    from ternarius_atlas.image_generator import ImageGenerator
+
+    generator = ImageGenerator()
+    return lambda: generator.generate_cover_image("O Jardim das Cores", "Natureza", 800, 1200), 1
+
+
+def _genesis_case(function_name: str):
+    @case(f'genesis.{function_name}', repeat=10)
+    def setup(**options):
+        import generate_genesis_images
+
+        function = getattr(generate_genesis_images, function_name)
+        return lambda: function(800, 1200), 1
+    return setup
+
+
+for _name in [
+    'generate_page_1_cover',
+    'generate_page_2_creation',
+    'generate_page_3_garden',
+    'generate_page_4_adam_eve',
+    'generate_page_5_noah_ark',
+    'generate_page_6_rainbow',
+    'generate_page_7_lessons',
+    'generate_page_8_ending',
+]:
+    _genesis_case(_name)
+
+
+@case('genesis.add_text_to_image', repeat=20)
+def genesis_add_text(**options):
+    import add_text_to_genesis
+
+    background = _background()
+    return lambda: add_text_to_genesis.add_text_to_image(background, PAGE_TEXT, 3), 1
+
+
+def _upscale_case(quality: str):
+    @case(f'upscaler.{quality}', repeat=20)
+    def setup(**options):
+        from ternarius_atlas.upscaler import Upscaler, native_size
+
+        upscaler = Upscaler(quality)
+        image = _background(*native_size(800, 1200))
+        return lambda: upscaler.upscale(image, (800, 1200)), 1
+    return setup
+
+
+for _quality in ('fast', 'balanced', 'quality'):
+    _upscale_case(_quality)
+
+
+def _parse_stream(text: str, chunk_size: int = 64):
+    from ternarius_atlas.structure_parser import StructureParser
+
+    def parse():
+        parser = StructureParser()
+        for i in range(0, len(text), chunk_size):
+            parser.feed(text[i:i + chunk_size])
+        parser.close()
+        return parser.structure
+    return parse
+
+
+@case('structure_parser.text', repeat=50)
+def parse_text(**options):
+    return _parse_stream(structure_as_text(book_structure(30))), 30
+
+
+@case('structure_parser.json', repeat=50)
+def parse_json(**options):
+    import json
+
+    return _parse_stream(json.dumps(book_structure(30), ensure_ascii=False)), 30
+
+
+@case('ebook.generate_ebook', repeat=3)
+def full_ebook(chapters: int = 5, pages_per_chapter: int = 2, llm_latency: float = 0.0,
+               diffusion_latency: float = 0.0, **options):
+    from ternarius_atlas import EbookGenerator
+    from ternarius_atlas.gemini_client import GeminiClient
+    from ternarius_atlas.image_backends import as_backend
+
+    generator = EbookGenerator(output_dir=_temporary_folder())
+    # Offline model behind the real client (quotas high enough to never wait)
+    client = GeminiClient(OfflineModel(latency=llm_latency), requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12)
+    generator.text_generator.client = client
+    generator.text_generator.model = client
+    generator.text_generator.cache = None
+    generator.image_generator = as_backend(StubDiffusionPipeline(latency=diffusion_latency))
+
+    # Cover, title page and every chapter page
+    pages = 2 + chapters * pages_per_chapter
+
+    def run():
+        # The progress output would dominate a fast run
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return generator.generate_ebook("Natureza", num_chapters=chapters, pages_per_chapter=pages_per_chapter)
+    return run, pages
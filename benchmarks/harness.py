@@ -0,0 +1,151 @@
+"""
+Timing, memory and baseline comparison helpers for the benchmarks
+"""
+
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, List, Optional
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident memory of the current process
+
+    Returns:
+        Peak RSS in MB, or None if the platform doesn't report it
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Value at a fraction of a sorted list (same rule as the API metrics)"""
+    return sorted_values[int(fraction * (len(sorted_values) - 1))]
+
+
+def measure(function: Callable[[], object], repeat: int = 10, warmup: int = 1, items: int = 1) -> dict:
+    """
+    Time repeated calls of a function
+
+    Args:
+        function: Zero-argument callable to time
+        repeat: Timed calls
+        warmup: Untimed calls made first (fill caches, load fonts)
+        items: Work items handled by one call (e.g. pages), for the throughput
+
+    Returns:
+        Dictionary with runs, p50/p95/mean/min latency in milliseconds and
+        throughput in items per second
+    """
+    for _ in range(warmup):
+        function()
+
+    gc.collect()
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        'runs': repeat,
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'mean_ms': round(total / repeat * 1000, 3),
+        'min_ms': round(timings[0] * 1000, 3),
+        'throughput_per_s': round(items * repeat / total, 3) if total else None,
+    }
+
+
+def environment() -> dict:
+    """Describe the machine and revision the results come from"""
+    from PIL import __version__ as pillow_version
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pillow': pillow_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.15, rss_tolerance: float = 0.10) -> List[dict]:
+    """
+    Find benchmarks that got slower or use more memory than a baseline
+
+    Args:
+        results: Current results (as written by the runner)
+        baseline: Baseline results in the same format
+        tolerance: Allowed relative increase of the p50 latency
+        rss_tolerance: Allowed relative increase of the peak RSS
+
+    Returns:
+        One dictionary per regression with the benchmark, metric, baseline
+        value, current value and relative change
+    """
+    regressions = []
+    for name, current in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if previous is None:
+            continue
+        for metric, allowed in (('p50_ms', tolerance), ('peak_rss_mb', rss_tolerance)):
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change > allowed:
+                regressions.append({
+                    'benchmark': name,
+                    'metric': metric,
+                    'baseline': before,
+                    'current': after,
+                    'change': round(change, 3),
+                })
+    return regressions
+
+
+def load_results(path: str) -> dict:
+    """Read results or a baseline written by save_results()"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(results: dict, path: str):
+    """Write results as JSON"""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmarks dos caminhos críticos de composição e geração
+
+Mede latência (p50/p95), vazão e pico de memória (RSS) de cada caso em
+benchmarks/cases.py e grava o resultado em JSON. Cada caso roda num processo
+separado, então o pico de memória de um caso não contamina os outros. O texto
+e as imagens vêm de stubs offline (benchmarks/stubs.py): nada acessa a rede
+nem a GPU.
+
+Uso:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --only composer --repeat 50
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, ROOT)
+
+# The Gemini SDK is configured but never called by the offline stubs
+os.environ.setdefault('GEMINI_API_KEY', 'offline_benchmark')
+
+from benchmarks.harness import compare, environment, load_results, measure, peak_rss_mb, save_results
+
+
+DEFAULT_OUTPUT = os.path.join(ROOT, 'benchmarks', 'results.json')
+
+
+def run_case(name: str, repeat: int = None, warmup: int = 1, **options) -> dict:
+    """Executa um caso no processo atual e retorna suas métricas"""
+    from benchmarks.cases import CASES
+
+    setup, default_repeat = CASES[name]
+    function, items = setup(**options)
+    result = measure(function, repeat or default_repeat, warmup, items)
+    result['items_per_call'] = items
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def run_isolated(name: str, args) -> dict:
+    """Executa um caso num processo novo (pico de memória só deste caso)"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--warmup', str(args.warmup),
+               '--llm-latency', str(args.llm_latency), '--diffusion-latency', str(args.diffusion_latency)]
+    if args.repeat:
+        command += ['--repeat', str(args.repeat)]
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'falhou')
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def select_cases(only: list) -> list:
+    """Nomes dos casos escolhidos (por prefixo), na ordem de registro"""
+    from benchmarks.cases import CASES
+
+    names = list(CASES)
+    if only:
+        names = [name for name in names if any(name.startswith(prefix) for prefix in only)]
+    return names
+
+
+def print_table(results: dict):
+    """Mostra os resultados em forma de tabela"""
+    print(f"\n{'benchmark':42} {'p50 ms':>10} {'p95 ms':>10} {'itens/s':>10} {'RSS MB':>8}")
+    print("-" * 84)
+    for name, result in results['benchmarks'].items():
+        if 'error' in result:
+            print(f"{name:42} ❌ {result['error']}")
+            continue
+        print(f"{name:42} {result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} "
+              f"{result['throughput_per_s'] or 0:>10.1f} {result['peak_rss_mb'] or 0:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Ternarius Atlas")
+    parser.add_argument('--only', action='append', default=[], metavar='PREFIXO',
+                        help="Rodar só os casos que começam com este prefixo (pode repetir)")
+    parser.add_argument('--repeat', type=int, default=None, help="Execuções medidas por caso")
+    parser.add_argument('--warmup', type=int, default=1, help="Execuções de aquecimento (não medidas)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Arquivo JSON com os resultados")
+    parser.add_argument('--baseline', help="Comparar com um resultado salvo e falhar se houver regressão")
+    parser.add_argument('--save-baseline', metavar='ARQUIVO', help="Salvar os resultados como nova baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Aumento relativo permitido do p50 antes de acusar regressão (padrão: 0.15)")
+    parser.add_argument('--rss-tolerance', type=float, default=0.10,
+                        help="Aumento relativo permitido do pico de memória (padrão: 0.10)")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Rodar tudo num só processo (mais rápido; o RSS passa a ser acumulado)")
+    parser.add_argument('--llm-latency', type=float, default=0.0,
+                        help="Latência simulada por chamada ao LLM no e-book completo, em segundos")
+    parser.add_argument('--diffusion-latency', type=float, default=0.0,
+                        help="Latência simulada por imagem no e-book completo, em segundos")
+    parser.add_argument('--list', action='store_true', help="Listar os casos e sair")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    options = {'llm_latency': args.llm_latency, 'diffusion_latency': args.diffusion_latency}
+
+    if args.child:
+        print(json.dumps(run_case(args.child, args.repeat, args.warmup, **options)))
+        return 0
+
+    names = select_cases(args.only)
+    if args.list:
+        print('\n'.join(names))
+        return 0
+    if not names:
+        print("❌ Erro: Nenhum caso corresponde aos prefixos informados!")
+        return 1
+
+    results = {'environment': environment(), 'settings': dict(options, warmup=args.warmup), 'benchmarks': {}}
+    print(f"⏱️  Rodando {len(names)} benchmarks...")
+    for name in names:
+        try:
+            if args.in_process:
+                result = run_case(name, args.repeat, args.warmup, **options)
+            else:
+                result = run_isolated(name, args)
+        except Exception as e:
+            result = {'error': str(e)}
+        results['benchmarks'][name] = result
+        print(f"   {'❌' if 'error' in result else '✅'} {name}")
+
+    print_table(results)
+    save_results(results, args.output)
+    print(f"\n📁 Resultados: {args.output}")
+
+    if args.save_baseline:
+        save_results(results, args.save_baseline)
+        print(f"📌 Baseline salva: {args.save_baseline}")
+
+    failed = any('error' in result for result in results['benchmarks'].values())
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.tolerance, args.rss_tolerance)
+        if regressions:
+            print(f"\n⚠️  {len(regressions)} regressões em relação a {args.baseline}:")
+            for regression in regressions:
+                print(f"   • {regression['benchmark']} {regression['metric']}: "
+                      f"{regression['baseline']} → {regression['current']} (+{regression['change']:.0%})")
+            return 1
+        print(f"\n✅ Nenhuma regressão em relação a {args.baseline}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
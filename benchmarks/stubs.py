@@ -0,0 +1,162 @@
+"""
+Offline stand-ins for the Gemini model and the diffusion pipeline
+
+Both are deterministic, so every benchmark run processes the same texts and
+images, and neither touches the network or a GPU. Optional latencies
+simulate the time spent waiting for the real services.
+"""
+
+import json
+import random
+import re
+import time
+
+from PIL import Image
+
+from ternarius_atlas.gradients import linear_gradient
+
+
+WORDS = (
+    "a luz do dia chegou ao jardim e as crianças correram entre as árvores "
+    "enquanto os pássaros cantavam sobre o rio que brilhava com as cores do "
+    "céu cada flor guardava uma pequena história de coragem amizade e "
+    "esperança que o vento levava para longe das montanhas azuis"
+).split()
+
+
+def sample_text(words: int, seed: int = 0) -> str:
+    """
+    Build a deterministic Portuguese-looking text
+
+    Args:
+        words: Number of words
+        seed: Seed selecting the words
+
+    Returns:
+        Text with sentences of 8 to 16 words
+    """
+    rng = random.Random(seed)
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 16))
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence[0].upper() + sentence[1:] + '.')
+        words -= length
+    return ' '.join(sentences)
+
+
+def book_structure(pages: int = 30) -> dict:
+    """Detailed structure of a deterministic book"""
+    return {
+        'title': 'O Jardim das Cores',
+        'description': sample_text(20, seed=1),
+        'total_pages': pages,
+        'pages': [
+            {
+                'type': 'cover' if i == 0 else ('chapter' if i % 5 == 1 else 'content'),
+                'title': f"Página {i + 1}",
+                'text': '' if i == 0 else sample_text(60, seed=i),
+                'illustration_description': sample_text(25, seed=1000 + i),
+            }
+            for i in range(pages)
+        ],
+    }
+
+
+def structure_as_text(structure: dict) -> str:
+    """Render a structure in the legacy line-based response format"""
+    lines = [
+        f"TÍTULO: {structure['title']}",
+        f"DESCRIÇÃO: {structure['description']}",
+        f"TOTAL_PÁGINAS: {structure['total_pages']}",
+    ]
+    for i, page in enumerate(structure['pages'], 1):
+        lines += [
+            f"---PÁGINA {i}---",
+            f"TIPO: {page['type']}",
+            f"TÍTULO: {page['title']}",
+            f"TEXTO: {page['text']}",
+            f"ILUSTRAÇÃO: {page['illustration_description']}",
+        ]
+    return '\n'.join(lines)
+
+
+class OfflineResponse:
+    """Response (or stream chunk) with the attributes the pipeline reads"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class OfflineModel:
+    """Deterministic replacement for the Gemini model"""
+
+    def __init__(self, latency: float = 0.0, chunk_size: int = 64):
+        """
+        Args:
+            latency: Seconds to wait before answering each request
+            chunk_size: Characters per chunk of a streamed answer
+        """
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        self.calls += 1
+        text = self.respond(str(prompt))
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return (OfflineResponse(text[i:i + self.chunk_size]) for i in range(0, len(text), self.chunk_size))
+        return OfflineResponse(text)
+
+    def respond(self, prompt: str) -> str:
+        """Answer a prompt of the text generator"""
+        if 'seguintes capítulos' in prompt:
+            titles = re.findall(r'^\s*\d+\. (.+)$', prompt, re.MULTILINE)
+            pages = int(re.search(r'ter (\d+) páginas', prompt).group(1))
+            return json.dumps({'chapters': [
+                {
+                    'title': title,
+                    'pages': [sample_text(250, seed=sum(map(ord, title)) * 10 + i) for i in range(pages)],
+                    'illustration_prompt': sample_text(30, seed=len(title)),
+                }
+                for title in titles
+            ]}, ensure_ascii=False)
+        if 'Capítulo:' in prompt:
+            pages = int(re.search(r'dividido em (\d+) páginas', prompt).group(1))
+            return json.dumps({'pages': [sample_text(250, seed=i) for i in range(pages)]}, ensure_ascii=False)
+        if 'Crie uma estrutura' in prompt:
+            chapters = int(re.search(r'com (\d+) capítulos', prompt).group(1))
+            lines = ["TÍTULO: O Jardim das Cores"]
+            lines += [f"CAPÍTULO {i}: Capítulo {i}" for i in range(1, chapters + 1)]
+            return '\n'.join(lines)
+        if 'TOTAL_PÁGINAS' in prompt or '"pages"' in prompt:
+            return json.dumps(book_structure(), ensure_ascii=False)
+        return sample_text(30, seed=len(prompt))
+
+
+class StubDiffusionPipeline:
+    """Image generator producing textured images instead of running a model"""
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency: Seconds to wait per image, standing in for inference
+        """
+        self.latency = latency
+        self.images = 0
+
+    def generate_image(self, prompt: str, width: int = 512, height: int = 512) -> Image.Image:
+        self.images += 1
+        if self.latency:
+            time.sleep(self.latency)
+        # Noise keeps the image realistic for PNG encoding and compositing
+        seed = sum(map(ord, prompt)) % 97
+        base = linear_gradient(width, height, [(200 + seed // 2, 180, 220), (120, 160 + seed // 3, 200)])
+        noise = Image.frombytes('L', (width, height), random.Random(seed).randbytes(width * height)).convert('RGB')
+        return Image.blend(base, noise, 0.15)
+
+    def generate_cover_image(self, title: str, theme: str, width: int = 800, height: int = 1200) -> Image.Image:
+        return self.generate_image(f"{title} {theme}", width, height)
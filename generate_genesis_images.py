@@ -6,6 +6,12 @@ Script para gerar as imagens do e-book Genesis
 from PIL import Image, ImageDraw, ImageFont
 import json
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from ternarius_atlas.gradients import linear_gradient
+from ternarius_atlas.text_layout import wrap_text
 
 # Cores pastéis
 PASTEL_COLORS = {
@@ -21,36 +27,11 @@ PASTEL_COLORS = {
 
 def create_pastel_gradient(width, height, color1, color2):
     """Cria um gradiente entre duas cores"""
-    image = Image.new('RGB', (width, height))
-    draw = ImageDraw.Draw(image)
-    
-    for y in range(height):
-        ratio = y / height
-        r = int(color1[0] * (1 - ratio) + color2[0] * ratio)
-        g = int(color1[1] * (1 - ratio) + color2[1] * ratio)
-        b = int(color1[2] * (1 - ratio) + color2[2] * ratio)
-        draw.line([(0, y), (width, y)], fill=(r, g, b))
-    
-    return image
+    return linear_gradient(width, height, [color1, color2])
 
 def draw_text_wrapped(draw, text, position, max_width, font, fill=(0, 0, 0)):
     """Desenha texto com quebra de linha"""
-    words = text.split()
-    lines = []
-    current_line = []
-    
-    for word in words:
-        test_line = ' '.join(current_line + [word])
-        bbox = draw.textbbox((0, 0), test_line, font=font)
-        if bbox[2] - bbox[0] <= max_width:
-            current_line.append(word)
-        else:
-            if current_line:
-                lines.append(' '.join(current_line))
-            current_line = [word]
-    
-    if current_line:
-        lines.append(' '.join(current_line))
+    lines = wrap_text(text, max_width, font)
     
     x, y = position
     for line in lines:
@@ -592,11 +573,8 @@ def generate_page_8_ending(width, height):
     
     return img
 
-# Gerar todas as páginas
-width, height = 800, 1200
-output_dir = "output/as_maravilhosas_historias_de_genesis"
-
-pages = [
+# Páginas do e-book e as funções que as desenham
+PAGES = [
     ("page_001_cover.png", generate_page_1_cover),
     ("page_002_creation.png", generate_page_2_creation),
     ("page_003_garden.png", generate_page_3_garden),
@@ -607,12 +585,22 @@ pages = [
     ("page_008_ending.png", generate_page_8_ending)
 ]
 
-print("🎨 Gerando imagens do e-book...")
-for filename, generator_func in pages:
-    print(f"   Gerando {filename}...")
-    img = generator_func(width, height)
-    img.save(os.path.join(output_dir, filename))
-    print(f"   ✅ {filename} salva!")
 
-print("\n✨ Todas as imagens foram geradas com sucesso!")
-print(f"📁 Localização: {output_dir}/")
+def main():
+    """Gera todas as páginas"""
+    width, height = 800, 1200
+    output_dir = "output/as_maravilhosas_historias_de_genesis"
+    
+    print("🎨 Gerando imagens do e-book...")
+    for filename, generator_func in PAGES:
+        print(f"   Gerando {filename}...")
+        img = generator_func(width, height)
+        img.save(os.path.join(output_dir, filename))
+        print(f"   ✅ {filename} salva!")
+    
+    print("\n✨ Todas as imagens foram geradas com sucesso!")
+    print(f"📁 Localização: {output_dir}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,21 +5,35 @@ Otimizado para NVIDIA RTX 3050 (8GB VRAM)
 """
 
 import torch
-from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+from diffusers import StableDiffusionPipeline
 from PIL import Image
 import json
 import os
 import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from ternarius_atlas.sd_worker import SDWorkerClient, ensure_worker
+from ternarius_atlas.image_writer import ImageWriter
+from ternarius_atlas.tracing import StepTimer, span, tracer
+from ternarius_atlas.tiled_vae import MemoryBoundedPipeline, memory_bounded_enabled
+from ternarius_atlas.upscaler import Upscaler, native_size
+from ternarius_atlas.prompt_cache import CachedPromptPipeline
+from ternarius_atlas.schedulers import SchedulerProfiles, page_render_profile, unwrap_pipeline
+from ternarius_atlas.config import Config
+
 # Configurações otimizadas para RTX 3050
 CONFIG = {
     "model": "runwayml/stable-diffusion-v1-5",  # Modelo rápido e eficiente
-    "num_inference_steps": 30,  # 30 = rápido, 50 = melhor qualidade
-    "guidance_scale": 7.5,
+    "render_profile": None,  # draft, standard ou final (None = "render_profile" do structure.json ou TERNARIUS_RENDER_PROFILE)
     "width": 800,
     "height": 1200,
     "negative_prompt": "ugly, blurry, low quality, distorted, deformed, text, watermark, signature",
+    "use_worker": True,  # Manter o modelo carregado num worker entre execuções
+    "native_resolution": Config.SD_NATIVE_RESOLUTION,  # Gerar em 512x768 e ampliar para 800x1200 (~2.4x menos UNet)
+    "upscale_quality": Config.UPSCALE_QUALITY,  # fast, balanced ou quality (TERNARIUS_UPSCALE_QUALITY)
+    "memory_budget_mb": None,  # Pico de RAM na CPU (None = TERNARIUS_SD_MEMORY_BUDGET_MB ou 75% da RAM)
 }
 
 
@@ -61,9 +75,7 @@ def load_pipeline():
             safety_checker=None,  # Remover safety checker para velocidade
         )
         
-        # Usar scheduler otimizado
-        pipe.scheduler = DPMSolverMultistepScheduler.from_config(pipe.scheduler.config)
-        
+        # O scheduler, os passos e o guidance vêm do perfil de renderização (schedulers.py)
         pipe = pipe.to(device)
         
         # Otimizações para RTX 3050 (8GB VRAM)
@@ -85,6 +97,15 @@ def load_pipeline():
             pipe.enable_vae_slicing()
             print("   ✅ VAE slicing ativado")
         
+        # Na CPU, a página inteira (800x1200) decodificada de uma vez estoura a RAM
+        if memory_bounded_enabled(device):
+            pipe = MemoryBoundedPipeline(pipe, budget_mb=CONFIG['memory_budget_mb'])
+            budget = f"{pipe.budget / 1024**3:.1f} GB" if pipe.budget else "desconhecido"
+            print(f"   ✅ Modo de memória limitada (VAE em blocos, orçamento {budget})")
+        
+        # O negative prompt é o mesmo em todas as imagens: o CLIP roda uma vez só
+        pipe = CachedPromptPipeline(pipe)
+        
         print("\n✅ Pipeline carregado com sucesso!")
         return pipe
     
@@ -93,25 +114,90 @@ def load_pipeline():
         return None
 
 
-def generate_image(pipe, prompt, negative_prompt=None, seed=None):
-    """Gera uma imagem com Stable Diffusion"""
+def get_pipeline():
+    """Retorna o worker persistente (modelo já carregado) ou carrega o pipeline localmente"""
+    if CONFIG['use_worker']:
+        try:
+            return ensure_worker(factory="generate_images_sd:load_pipeline")
+        except RuntimeError as e:
+            print(f"\n⚠️  {e}")
+            print("   Carregando o modelo neste processo...")
+    return load_pipeline()
+
+
+_upscaler = None
+_profiles = None
+
+
+def generate_image(pipe, prompt, negative_prompt=None, seed=None, profile=None):
+    """
+    Gera uma imagem com Stable Diffusion no tamanho da página
+    
+    Com CONFIG['native_resolution'], a UNet roda na resolução nativa do
+    modelo (512x768) e a imagem é ampliada na CPU até CONFIG['width'] x
+    CONFIG['height']; o tempo retornado inclui o upscale.
+    
+    O perfil (draft, standard ou final) escolhe juntos o scheduler, os
+    passos e o guidance; sem perfil, vale CONFIG['render_profile'].
+    """
+    global _upscaler
+    
+    page_size = (CONFIG['width'], CONFIG['height'])
+    size = native_size(*page_size) if CONFIG['native_resolution'] else page_size
+    
+    start_time = time.time()
+    image, _ = _generate_at(pipe, prompt, negative_prompt, seed, *size, profile=profile or CONFIG['render_profile'] or Config.RENDER_PROFILE)
+    
+    if image.size != page_size:
+        if _upscaler is None:
+            _upscaler = Upscaler(CONFIG['upscale_quality'])
+        image = _upscaler.upscale(image, page_size)
+    
+    return image, time.time() - start_time
+
+
+def _generate_at(pipe, prompt, negative_prompt, seed, width, height, profile=None):
+    """Roda o pipeline (local ou no worker) num tamanho e perfil específicos"""
+    global _profiles
+    
+    if isinstance(pipe, SDWorkerClient):
+        # O worker troca o scheduler do próprio pipeline
+        return pipe.generate(
+            prompt,
+            negative_prompt=negative_prompt or CONFIG['negative_prompt'],
+            width=width,
+            height=height,
+            seed=seed,
+            profile=profile,
+        )
+    
+    if _profiles is None or _profiles.pipe is not unwrap_pipeline(pipe):
+        _profiles = SchedulerProfiles(pipe)
+    settings = _profiles.apply(profile)
     
     if seed is not None:
         generator = torch.Generator("cuda" if torch.cuda.is_available() else "cpu").manual_seed(seed)
     else:
         generator = None
     
+    # Com o tracing ligado, cada passo de denoising vira um span
+    extra = {}
+    if tracer.enabled:
+        extra['callback_on_step_end'] = StepTimer()
+    
     start_time = time.time()
     
-    with torch.inference_mode():
+    with span('image.diffusion', profile=profile, steps=settings['num_inference_steps'], size=[width, height]), torch.inference_mode():
+        if extra:
+            extra['callback_on_step_end'].start()
         image = pipe(
             prompt=prompt,
             negative_prompt=negative_prompt or CONFIG['negative_prompt'],
-            num_inference_steps=CONFIG['num_inference_steps'],
-            guidance_scale=CONFIG['guidance_scale'],
-            width=CONFIG['width'],
-            height=CONFIG['height'],
+            width=width,
+            height=height,
             generator=generator,
+            **settings,
+            **extra,
         ).images[0]
     
     elapsed = time.time() - start_time
@@ -136,7 +222,7 @@ def generate_from_structure(structure_path, output_folder):
     os.makedirs(output_folder, exist_ok=True)
     
     # Carregar pipeline
-    pipe = load_pipeline()
+    pipe = get_pipeline()
     if pipe is None:
         return False
     
@@ -145,11 +231,16 @@ def generate_from_structure(structure_path, output_folder):
     print("=" * 70)
     
     total_time = 0
+    # Salvar em segundo plano enquanto a próxima imagem é gerada
+    writer = ImageWriter()
     
     for i, page in enumerate(structure['pages'], 1):
         print(f"\n📄 Página {i}/{len(structure['pages'])}")
         print(f"   Tipo: {page['type']}")
         
+        # Perfil da página > CONFIG > "render_profile" do livro > TERNARIUS_RENDER_PROFILE
+        profile = page_render_profile(page, structure, CONFIG['render_profile'])
+        
         # Melhorar prompt para estilo infantil com tons pastéis
         enhanced_prompt = f"Children's book illustration, soft pastel colors, watercolor style, gentle and calm, {page['illustration_description']}"
         
@@ -157,17 +248,18 @@ def generate_from_structure(structure_path, output_folder):
         
         # Gerar imagem
         print(f"   🎨 Gerando... ", end='', flush=True)
-        image, elapsed = generate_image(pipe, enhanced_prompt, seed=42+i)
+        image, elapsed = generate_image(pipe, enhanced_prompt, seed=42+i, profile=profile)
         total_time += elapsed
         
-        print(f"[{elapsed:.1f}s]")
+        print(f"[{elapsed:.1f}s, {profile}]")
         
         # Salvar
-        filename = f"page_{i:03d}_sd.png"
-        filepath = os.path.join(output_folder, filename)
-        image.save(filepath)
+        filepath = writer.path(os.path.join(output_folder, f"page_{i:03d}_sd.png"))
+        writer.submit(image, filepath)
         
-        print(f"   ✅ Salva: {filename}")
+        print(f"   ✅ Salvando: {os.path.basename(filepath)}")
+    
+    writer.close()
     
     avg_time = total_time / len(structure['pages'])
     
@@ -179,6 +271,12 @@ def generate_from_structure(structure_path, output_folder):
     print(f"⏱️  Tempo médio por imagem: {avg_time:.1f}s")
     print(f"📁 Localização: {output_folder}/")
     
+    # TERNARIUS_TRACE=1: tempo de cada passo de denoising e de cada gravação
+    if tracer.enabled:
+        trace_path = tracer.export_chrome(os.path.join(output_folder, "trace_sd.json"))
+        print(tracer.format_summary())
+        print(f"📁 Trace: {trace_path}")
+    
     return True
 
 
@@ -210,15 +308,16 @@ def main():
         print("❌ Prompt vazio.")
         return 1
     
-    pipe = load_pipeline()
+    pipe = get_pipeline()
     if pipe is None:
         return 1
     
     print("\n🎨 Gerando imagem...")
     image, elapsed = generate_image(pipe, prompt)
     
-    filename = "output_sd.png"
-    image.save(filename)
+    with ImageWriter() as writer:
+        filename = writer.path("output_sd.png")
+        writer.submit(image, filename)
     
     print(f"\n✅ Imagem gerada em {elapsed:.1f}s")
     print(f"📁 Salva em: {filename}")
@@ -6,6 +6,7 @@ Main script to run Ternarius Atlas E-book Generator - Interactive Mode
 import sys
 import os
 import json
+import argparse
 from pathlib import Path
 
 # Add src to path for imports
@@ -13,23 +14,72 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from ternarius_atlas import EbookGenerator
 from ternarius_atlas.text_generator import TextGenerator
-from ternarius_atlas.image_generator import ImageGenerator
+from ternarius_atlas.structure_parser import StructureParser
 from ternarius_atlas.page_composer import PageComposer
 from ternarius_atlas.config import config
-from PIL import Image
+from ternarius_atlas.image_backends import as_backend, available_backends, backend_class, create_backend
+from ternarius_atlas.build_manifest import BuildManifest, hash_file, hash_inputs
+from ternarius_atlas.compositing import compose_pages, make_page_spec
+from ternarius_atlas.packager import write_epub, write_pdf
+from ternarius_atlas.image_writer import ImageWriter
+from ternarius_atlas.tracing import traced, tracer
+from ternarius_atlas.schedulers import page_render_profile
 
 
 class InteractiveEbookGenerator:
     """Interactive e-book generator with step-by-step confirmation"""
     
-    def __init__(self):
-        self.text_generator = TextGenerator()
-        self.image_generator = ImageGenerator()
+    def __init__(self, text_generator: TextGenerator = None, image_generator=None, output_root: str = 'output',
+                 image_backend: str = None):
+        """
+        Args:
+            text_generator: Shared text generator (created on first use if not provided)
+            image_generator: Shared image backend, or any object with
+                generate_image() (created on first use if not provided)
+            output_root: Folder where each book gets its own subfolder
+            image_backend: Backend created when no generator is given
+                (uses config.IMAGE_BACKEND if not provided)
+        """
+        # AI clients are created on first use, so resuming a book whose pages
+        # are all up to date never loads the Gemini SDK or the image model
+        self._text_generator = text_generator
+        self._image_generator = as_backend(image_generator) if image_generator is not None else None
+        self.image_backend = image_backend or config.IMAGE_BACKEND
         self.page_composer = PageComposer(config)
+        self.composite_workers = config.COMPOSITE_WORKERS
+        # Images are encoded on a background thread while the next one is generated
+        self.image_writer = ImageWriter()
+        self.output_root = output_root
         self.book_structure = None
         self.book_title = None
         self.output_folder = None
-        
+    
+    @property
+    def text_generator(self) -> TextGenerator:
+        """Text generator, created on first use"""
+        if self._text_generator is None:
+            self._text_generator = TextGenerator()
+        return self._text_generator
+    
+    @property
+    def image_generator(self):
+        """Image backend, created on first use"""
+        if self._image_generator is None:
+            # The worker backend keeps the model loaded across runs and
+            # re-generation requests; the placeholder backend needs no model
+            self._image_generator = create_backend(self.image_backend)
+        return self._image_generator
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+    
+    def close(self):
+        """Save the queued images and stop the image writer thread"""
+        self.image_writer.close()
+    
     def sanitize_folder_name(self, title: str) -> str:
         """Convert book title to valid folder name"""
         # Remove special characters and replace spaces with underscores
@@ -37,6 +87,50 @@ class InteractiveEbookGenerator:
         sanitized = sanitized.replace(' ', '_').lower()
         return sanitized[:50]  # Limit length
     
+    @traced('book.structure')
+    def generate_structure(self, theme: str, instructions: str = "", on_page=None) -> dict:
+        """
+        Generate the book structure without asking for approval
+        
+        Args:
+            theme: Book theme
+            instructions: Additional instructions
+            on_page: Optional callback(page_number, page) called as each page is streamed
+            
+        Returns:
+            Book structure
+        """
+        full_prompt = f"{theme}\n\nInstruções adicionais: {instructions}" if instructions else theme
+        parser = StructureParser()
+        try:
+            for i, page in enumerate(self.text_generator.stream_detailed_ebook_structure(full_prompt, parser), 1):
+                if on_page:
+                    on_page(i, page)
+            structure = parser.structure
+        except Exception as e:
+            print(f"⚠️  Geração interrompida ({e}); tentando novamente sem streaming...")
+            structure = self.text_generator.generate_detailed_ebook_structure(full_prompt)
+        
+        self.book_structure = structure
+        self.book_title = structure['title']
+        return structure
+    
+    def create_output_folder(self, folder_name: str = None) -> str:
+        """
+        Create the book folder and save structure.json in it
+        
+        Args:
+            folder_name: Folder name (derived from the book title if not provided)
+            
+        Returns:
+            Path of the book folder
+        """
+        folder_name = folder_name or self.sanitize_folder_name(self.book_title)
+        self.output_folder = os.path.join(self.output_root, folder_name)
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.save_structure()
+        return self.output_folder
+    
     def step1_generate_structure(self, theme: str, instructions: str = ""):
         """Step 1: Generate book structure and get user approval"""
         print("\n" + "=" * 70)
@@ -47,12 +141,12 @@ class InteractiveEbookGenerator:
             print(f"📝 Instruções adicionais: {instructions}")
         print("\n⏳ Gerando estrutura do livro com IA...")
         
-        # Generate structure using AI
-        full_prompt = f"{theme}\n\nInstruções adicionais: {instructions}" if instructions else theme
-        structure = self.text_generator.generate_detailed_ebook_structure(full_prompt)
-        
-        self.book_structure = structure
-        self.book_title = structure['title']
+        # Show pages as they are written
+        structure = self.generate_structure(
+            theme,
+            instructions,
+            on_page=lambda i, page: print(f"   📄 Página {i} recebida ({page['type']}): {page['title'][:60]}")
+        )
         
         # Display structure to user
         print("\n" + "=" * 70)
@@ -83,15 +177,7 @@ class InteractiveEbookGenerator:
         while True:
             response = input("\n✅ Está de acordo com essa estrutura? (s/n): ").strip().lower()
             if response in ['s', 'sim', 'yes', 'y']:
-                # Create output folder
-                folder_name = self.sanitize_folder_name(self.book_title)
-                self.output_folder = os.path.join('output', folder_name)
-                os.makedirs(self.output_folder, exist_ok=True)
-                
-                # Save structure to JSON
-                structure_path = os.path.join(self.output_folder, 'structure.json')
-                with open(structure_path, 'w', encoding='utf-8') as f:
-                    json.dump(structure, f, ensure_ascii=False, indent=2)
+                self.create_output_folder()
                 
                 print(f"\n✅ Estrutura aprovada! Pasta criada: {self.output_folder}")
                 return True
@@ -101,37 +187,165 @@ class InteractiveEbookGenerator:
             else:
                 print("⚠️  Por favor, responda 's' para sim ou 'n' para não.")
     
-    def step2_generate_images(self):
-        """Step 2: Generate all images without text"""
-        if not self.book_structure:
-            print("❌ Erro: Execute a Etapa 1 primeiro!")
+    def save_structure(self):
+        """Save the book structure to structure.json in the output folder"""
+        structure_path = os.path.join(self.output_folder, 'structure.json')
+        with open(structure_path, 'w', encoding='utf-8') as f:
+            json.dump(self.book_structure, f, ensure_ascii=False, indent=2)
+    
+    def load_structure(self, folder: str) -> bool:
+        """Load the structure of a previous run to rebuild only what changed"""
+        structure_path = os.path.join(folder, 'structure.json')
+        if not os.path.exists(structure_path):
+            print(f"❌ Erro: {structure_path} não encontrado!")
             return False
         
-        print("\n" + "=" * 70)
-        print("🎨 ETAPA 2: GERAÇÃO DAS IMAGENS")
-        print("=" * 70)
-        print(f"📊 Gerando {len(self.book_structure['pages'])} imagens...")
+        with open(structure_path, 'r', encoding='utf-8') as f:
+            self.book_structure = json.load(f)
+        self.book_title = self.book_structure['title']
+        self.output_folder = folder
+        print(f"📂 Estrutura carregada: {self.book_title} ({len(self.book_structure['pages'])} páginas)")
+        return True
+    
+    def _image_backend_name(self) -> str:
+        """Fingerprint of the image backend hashed into the image inputs, without creating it"""
+        if self._image_generator is not None:
+            return self._image_generator.fingerprint
+        return backend_class(self.image_backend).fingerprint
+    
+    def _supports_profiles(self) -> bool:
+        """Whether the image backend renders with draft/standard/final profiles"""
+        if self._image_generator is not None:
+            return self._image_generator.capabilities.profiles
+        return backend_class(self.image_backend).capabilities.profiles
+    
+    def _page_profile(self, page: dict, profile: str = None) -> str:
+        """
+        Render profile of a page, or None if the generator has no profiles
+        
+        Args:
+            page: Page entry of the structure
+            profile: Profile used instead of the book's (the page's own still wins)
+        """
+        if not self._supports_profiles():
+            return None
+        return page_render_profile(page, self.book_structure, profile)
+    
+    def _image_inputs(self, page: dict, profile: str = None) -> str:
+        """Hash everything that determines the image of a page"""
+        parts = [
+            'image',
+            page['illustration_description'],
+            page.get('seed'),
+            config.DEFAULT_PAGE_WIDTH,
+            config.DEFAULT_PAGE_HEIGHT,
+            self._image_backend_name()
+        ]
+        # A draft is replaced once the page is rendered with the final profile
+        if profile:
+            parts.append(profile)
+        return hash_inputs(*parts)
+    
+    def _image_path(self, page_number: int) -> str:
+        """Path of the generated image of a page"""
+        return self.image_writer.path(os.path.join(self.output_folder, f"image_{page_number:03d}.png"))
+    
+    def _final_page_path(self, page_number: int) -> str:
+        """Path of the final page (image with text)"""
+        return self.image_writer.path(os.path.join(self.output_folder, f"page_{page_number:03d}_final.png"))
+    
+    def _generate_page_image(self, manifest: BuildManifest, page_number: int, page: dict, profile: str = None) -> str:
+        """
+        Generate the image of a page and queue it for saving
+        
+        The page is recorded in the manifest once its file is written; call
+        self.image_writer.flush() before relying on it.
+        
+        Args:
+            manifest: The book's build manifest
+            page_number: Page number (1-based)
+            page: Page entry of the structure
+            profile: Resolved render profile (None if the generator has no profiles)
+        """
+        image = self.image_generator.generate(
+            page['illustration_description'],
+            width=config.DEFAULT_PAGE_WIDTH,
+            height=config.DEFAULT_PAGE_HEIGHT,
+            seed=page.get('seed'),
+            profile=profile
+        )
+        
+        image_path = self._image_path(page_number)
+        inputs = self._image_inputs(page, profile)
+        
+        def record(path):
+            manifest.record('images', page_number, inputs, path)
+            manifest.save()
+        
+        self.image_writer.submit(image, image_path, callback=record)
+        return image_path
+    
+    @traced('book.images')
+    def generate_images(self, verbose: bool = True, profile: str = None) -> BuildManifest:
+        """
+        Generate the images of every page whose illustration or profile changed
         
+        Args:
+            verbose: Print progress for each page
+            profile: Render profile used instead of the book's (e.g. drafts
+                for review); pages with their own "render_profile" keep it
+            
+        Returns:
+            The book's build manifest
+        """
         self.book_structure['images'] = []
+        manifest = BuildManifest(self.output_folder)
+        reused = 0
         
         for i, page in enumerate(self.book_structure['pages'], 1):
-            print(f"\n🎨 Gerando imagem {i}/{len(self.book_structure['pages'])}...")
-            print(f"   📝 Descrição: {page['illustration_description'][:80]}...")
+            image_path = self._image_path(i)
+            image_filename = os.path.basename(image_path)
+            page_profile = self._page_profile(page, profile)
             
-            # Generate image
-            image = self.image_generator.generate_image(
-                page['illustration_description'],
-                width=config.DEFAULT_PAGE_WIDTH,
-                height=config.DEFAULT_PAGE_HEIGHT
-            )
+            # Pages whose prompt and profile didn't change keep their image
+            if manifest.is_current('images', i, self._image_inputs(page, page_profile), image_path):
+                self.book_structure['images'].append(image_path)
+                reused += 1
+                continue
+            
+            if verbose:
+                print(f"\n🎨 Gerando imagem {i}/{len(self.book_structure['pages'])}...")
+                print(f"   📝 Descrição: {page['illustration_description'][:80]}...")
             
-            # Save image
-            image_filename = f"image_{i:03d}.png"
-            image_path = os.path.join(self.output_folder, image_filename)
-            image.save(image_path)
+            self._generate_page_image(manifest, i, page, page_profile)
             
             self.book_structure['images'].append(image_path)
-            print(f"   ✅ Salva: {image_filename}")
+            if verbose:
+                print(f"   ✅ Pronta: {image_filename}")
+        
+        # Wait for the last images to be written (and recorded)
+        self.image_writer.flush()
+        
+        if reused and verbose:
+            print(f"\n♻️  {reused} imagens sem alterações foram reaproveitadas")
+        
+        return manifest
+    
+    def step2_generate_images(self):
+        """Step 2: Generate all images without text"""
+        if not self.book_structure:
+            print("❌ Erro: Execute a Etapa 1 primeiro!")
+            return False
+        
+        print("\n" + "=" * 70)
+        print("🎨 ETAPA 2: GERAÇÃO DAS IMAGENS")
+        print("=" * 70)
+        # Pages are reviewed as quick drafts and rendered in full after approval
+        review_profile = config.REVIEW_RENDER_PROFILE if self._supports_profiles() else None
+        print(f"📊 Gerando {len(self.book_structure['pages'])} imagens"
+              + (f" (rascunhos '{review_profile}' para revisão)..." if review_profile else "..."))
+        
+        manifest = self.generate_images(verbose=True, profile=review_profile)
         
         print("\n" + "=" * 70)
         print(f"✅ Todas as {len(self.book_structure['images'])} imagens foram geradas!")
@@ -142,6 +356,9 @@ class InteractiveEbookGenerator:
             response = input("\n✅ As imagens estão boas ou deseja alterar alguma? (boas/alterar): ").strip().lower()
             if response in ['boas', 'b', 'boa', 'sim', 's', 'yes', 'y']:
                 print("\n✅ Imagens aprovadas!")
+                if review_profile:
+                    print("\n🖼️  Renderizando as versões finais...")
+                    self.generate_images(verbose=True)
                 return True
             elif response in ['alterar', 'a', 'modificar', 'm', 'nao', 'não', 'n', 'no']:
                 page_num = input("   Qual número da página deseja alterar? (ou 'cancelar'): ").strip()
@@ -155,13 +372,15 @@ class InteractiveEbookGenerator:
                             self.book_structure['pages'][page_idx]['illustration_description'] = new_description
                             print(f"\n🎨 Regenerando imagem {page_num}...")
                             
-                            image = self.image_generator.generate_image(
-                                new_description,
-                                width=config.DEFAULT_PAGE_WIDTH,
-                                height=config.DEFAULT_PAGE_HEIGHT
+                            page = self.book_structure['pages'][page_idx]
+                            self._generate_page_image(
+                                manifest,
+                                page_idx + 1,
+                                page,
+                                self._page_profile(page, review_profile)
                             )
-                            image_path = self.book_structure['images'][page_idx]
-                            image.save(image_path)
+                            self.image_writer.flush()
+                            self.save_structure()
                             print(f"   ✅ Imagem {page_num} atualizada!")
                     else:
                         print(f"   ⚠️  Número de página inválido. Escolha entre 1 e {len(self.book_structure['pages'])}")
@@ -170,6 +389,52 @@ class InteractiveEbookGenerator:
             else:
                 print("⚠️  Por favor, responda 'boas' ou 'alterar'.")
     
+    @traced('book.compose')
+    def compose_final_pages(self, verbose: bool = True) -> list:
+        """
+        Add text to the image of every page whose text, image or layout changed
+        
+        Args:
+            verbose: Print progress for each page
+            
+        Returns:
+            Paths of all final pages, in page order
+        """
+        final_pages = []
+        manifest = BuildManifest(self.output_folder)
+        layout = self.page_composer.layout_fingerprint()
+        specs = []
+        page_inputs = {}
+        
+        for i, page in enumerate(self.book_structure['pages'], 1):
+            final_path = self._final_page_path(i)
+            image_path = self.book_structure['images'][i-1]
+            final_pages.append(final_path)
+            
+            # A page depends on its text, its image and the layout settings
+            image_hash = manifest.output_hash('images', i) or hash_file(image_path)
+            inputs = hash_inputs(
+                'page', page['type'], page.get('title'), page.get('text'), i, image_hash, layout
+            )
+            if not manifest.is_current('pages', i, inputs, final_path):
+                page_inputs[i] = inputs
+                specs.append(make_page_spec(page, i, image_path, final_path))
+        
+        reused = len(final_pages) - len(specs)
+        
+        # Pages are composited in parallel processes and saved as they finish
+        for done, (spec, final_path) in enumerate(compose_pages(specs, self.composite_workers), 1):
+            page_number = spec['page_number']
+            manifest.record('pages', page_number, page_inputs[page_number], final_path)
+            manifest.save()
+            if verbose:
+                print(f"   ✅ [{done}/{len(specs)}] Salva: {os.path.basename(final_path)}")
+        
+        if reused and verbose:
+            print(f"\n♻️  {reused} páginas sem alterações foram reaproveitadas")
+        
+        return final_pages
+    
     def step3_add_text_to_images(self):
         """Step 3: Add text to images"""
         if not self.book_structure or not self.book_structure.get('images'):
@@ -181,39 +446,7 @@ class InteractiveEbookGenerator:
         print("=" * 70)
         print(f"📊 Processando {len(self.book_structure['pages'])} páginas...")
         
-        final_pages = []
-        
-        for i, page in enumerate(self.book_structure['pages'], 1):
-            print(f"\n📝 Processando página {i}/{len(self.book_structure['pages'])}...")
-            
-            # Load base image
-            image_path = self.book_structure['images'][i-1]
-            base_image = Image.open(image_path)
-            
-            # Add text to image
-            if page['type'] == 'cover':
-                final_image = self.page_composer.add_text_to_cover(
-                    base_image,
-                    page['title']
-                )
-            else:
-                text = page.get('title', '')
-                if 'text' in page:
-                    text = f"{text}\n\n{page['text']}" if text else page['text']
-                
-                final_image = self.page_composer.add_text_to_page(
-                    base_image,
-                    text,
-                    page_number=i
-                )
-            
-            # Save final page
-            final_filename = f"page_{i:03d}_final.png"
-            final_path = os.path.join(self.output_folder, final_filename)
-            final_image.save(final_path)
-            final_pages.append(final_path)
-            
-            print(f"   ✅ Salva: {final_filename}")
+        final_pages = self.compose_final_pages(verbose=True)
         
         print("\n" + "=" * 70)
         print("🎉 E-BOOK COMPLETO!")
@@ -225,32 +458,114 @@ class InteractiveEbookGenerator:
             print(f"   • {os.path.basename(page)}")
         
         return True
-
-
-def main():
-    """Main function to run the interactive e-book generator"""
-    
-    print("=" * 70)
-    print("🌟 Bem-vindo ao Ternarius Atlas - Gerador de E-books com IA 🌟")
-    print("=" * 70)
-    print("\n📖 Sistema Interativo de Geração de E-books")
-    print("   Processo em 3 etapas com confirmação em cada passo\n")
-    
-    # Get theme and instructions from user
-    theme = input("📝 Digite o tema do e-book: ").strip()
     
-    if not theme:
-        print("❌ Erro: Tema não pode ser vazio!")
-        return 1
-    
-    instructions = input("📋 Instruções adicionais (opcional, Enter para pular): ").strip()
+    @traced('book.package')
+    def package_book(self, formats: list = None, verbose: bool = True) -> dict:
+        """
+        Package the final pages into a PDF and/or an EPUB
+        
+        The PDF holds the final pages; the EPUB holds each page's image with
+        its text as XHTML. A package is only rebuilt when a page changed.
+        
+        Args:
+            formats: Packages to build, "pdf" and/or "epub" (uses config.PACKAGE_FORMATS)
+            verbose: Print the path of each package
+            
+        Returns:
+            Dictionary mapping each format to its file path
+        """
+        formats = formats or config.PACKAGE_FORMATS
+        manifest = BuildManifest(self.output_folder)
+        pages = self.book_structure['pages']
+        images = self.book_structure['images']
+        final_pages = [self._final_page_path(i) for i in range(1, len(pages) + 1)]
+        file_name = self.sanitize_folder_name(self.book_title)
+        packages = {}
+        
+        for package_format in formats:
+            output_path = os.path.join(self.output_folder, f"{file_name}.{package_format}")
+            settings = (config.PACKAGE_IMAGE_FORMAT, config.PACKAGE_IMAGE_QUALITY)
+            if package_format == 'pdf':
+                page_hashes = [manifest.output_hash('pages', i) or hash_file(path)
+                               for i, path in enumerate(final_pages, 1)]
+                inputs = hash_inputs('pdf', self.book_title, page_hashes, config.PACKAGE_DPI, settings)
+            elif package_format == 'epub':
+                page_hashes = [manifest.output_hash('images', i) or hash_file(path)
+                               for i, path in enumerate(images, 1)]
+                texts = [(page['type'], page.get('title'), page.get('text')) for page in pages]
+                inputs = hash_inputs('epub', self.book_title, page_hashes, texts, config.EPUB_LANGUAGE, settings)
+            else:
+                print(f"⚠️  Formato desconhecido: {package_format}")
+                continue
+            
+            packages[package_format] = output_path
+            if manifest.is_current('packages', package_format, inputs, output_path):
+                if verbose:
+                    print(f"♻️  {os.path.basename(output_path)} sem alterações")
+                continue
+            
+            # Pages are read one at a time, so memory doesn't grow with the book
+            if package_format == 'pdf':
+                write_pdf(final_pages, output_path, title=self.book_title)
+            else:
+                write_epub(
+                    ({'image_path': image, 'type': page['type'], 'title': page.get('title'), 'text': page.get('text')}
+                     for page, image in zip(pages, images)),
+                    output_path,
+                    title=self.book_title
+                )
+            manifest.record('packages', package_format, inputs, output_path)
+            manifest.save()
+            if verbose:
+                print(f"   ✅ Salvo: {os.path.basename(output_path)}")
+        
+        return packages
     
-    # Create interactive generator
-    generator = InteractiveEbookGenerator()
+    def step4_package_book(self):
+        """Step 4: Package the book as PDF and EPUB"""
+        if not self.book_structure or not self.book_structure.get('images'):
+            print("❌ Erro: Execute as Etapas 1, 2 e 3 primeiro!")
+            return False
+        
+        print("\n" + "=" * 70)
+        print("📦 ETAPA 4: EMPACOTANDO O E-BOOK")
+        print("=" * 70)
+        
+        packages = self.package_book(verbose=True)
+        for package_format, path in packages.items():
+            size = os.path.getsize(path) / (1024 * 1024)
+            print(f"📚 {package_format.upper()}: {path} ({size:.1f} MB)")
+        
+        return True
     
-    # Step 1: Generate and approve structure
-    if not generator.step1_generate_structure(theme, instructions):
-        return 1
+    def export_trace(self) -> str:
+        """Save the recorded spans as trace.json and print the time per stage"""
+        trace_path = tracer.export_chrome(os.path.join(self.output_folder or '.', 'trace.json'))
+        print("\n⏱️  Tempo por etapa:")
+        print(tracer.format_summary())
+        print(f"📁 Trace: {trace_path} (abra em chrome://tracing ou ui.perfetto.dev)")
+        return trace_path
+
+
+def run_steps(generator: InteractiveEbookGenerator, args) -> int:
+    """Run the interactive steps, from the structure to the packages"""
+    if args.resume:
+        # Reuse the (possibly edited) structure.json of a previous run
+        if not generator.load_structure(args.resume):
+            return 1
+    else:
+        # Get theme and instructions from user
+        theme = input("📝 Digite o tema do e-book: ").strip()
+        
+        if not theme:
+            print("❌ Erro: Tema não pode ser vazio!")
+            return 1
+        
+        instructions = input("📋 Instruções adicionais (opcional, Enter para pular): ").strip()
+        
+        # Step 1: Generate and approve structure
+        if not generator.step1_generate_structure(theme, instructions):
+            return 1
     
     # Step 2: Generate and approve images
     if not generator.step2_generate_images():
@@ -260,6 +575,13 @@ def main():
     if not generator.step3_add_text_to_images():
         return 1
     
+    # Step 4: Package as PDF and EPUB
+    if not generator.step4_package_book():
+        return 1
+    
+    if tracer.enabled:
+        generator.export_trace()
+    
     print("\n" + "=" * 70)
     print("✨ Processo concluído com sucesso! ✨")
     print("=" * 70)
@@ -267,6 +589,37 @@ def main():
     return 0
 
 
+def main():
+    """Main function to run the interactive e-book generator"""
+    parser = argparse.ArgumentParser(description="Gerador interativo de e-books")
+    parser.add_argument('--resume', metavar='PASTA',
+                        help="Reabrir um livro existente e refazer apenas as páginas alteradas")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processos usados para compor as páginas (padrão: número de CPUs)")
+    parser.add_argument('--trace', action='store_true',
+                        help="Medir o tempo de cada etapa e salvar trace.json na pasta do livro")
+    parser.add_argument('--image-backend', choices=available_backends(), default=None,
+                        help="Backend de imagens (padrão: TERNARIUS_IMAGE_BACKEND ou placeholder)")
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enabled = True
+    
+    print("=" * 70)
+    print("🌟 Bem-vindo ao Ternarius Atlas - Gerador de E-books com IA 🌟")
+    print("=" * 70)
+    print("\n📖 Sistema Interativo de Geração de E-books")
+    print("   Processo em 3 etapas com confirmação em cada passo\n")
+    
+    # Create interactive generator
+    generator = InteractiveEbookGenerator(image_backend=args.image_backend)
+    if args.workers:
+        generator.composite_workers = args.workers
+    
+    # The image writer thread is stopped however the flow ends
+    with generator:
+        return run_steps(generator, args)
+
+
 if __name__ == "__main__":
     try:
         sys.exit(main())
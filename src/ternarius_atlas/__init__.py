@@ -2,8 +2,28 @@
 Ternarius Atlas - E-book Generator with AI Integration
 """
 
+import importlib
+
 __version__ = "0.1.0"
 
-from .ebook_generator import EbookGenerator
+# Public names and the module providing them. Modules are imported on first
+# access (PEP 562), so importing the package never loads the Gemini SDK.
+_LAZY_ATTRIBUTES = {
+    "EbookGenerator": ".ebook_generator",
+}
 
 __all__ = ["EbookGenerator"]
+
+
+def __getattr__(name):
+    """Import public classes on first access"""
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
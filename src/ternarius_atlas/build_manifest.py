@@ -0,0 +1,153 @@
+"""
+Build manifest for incremental rebuilds
+
+The manifest lives next to structure.json and records, for every page of
+every build stage, a hash of the page inputs and of the file produced from
+them. A page only needs to be rebuilt when its inputs changed or its output
+file is missing or was modified.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def hash_inputs(*parts) -> str:
+    """
+    Hash any JSON-serializable build inputs
+
+    Args:
+        *parts: Values that determine the output (texts, sizes, config, ...)
+
+    Returns:
+        Hex digest of the inputs
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """
+    Hash the contents of a file
+
+    Args:
+        path: File to hash
+
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """Track page inputs and outputs so unchanged pages can be skipped"""
+
+    def __init__(self, folder: str):
+        """
+        Load the manifest of a book folder (empty if it doesn't exist yet)
+
+        Args:
+            folder: Book output folder (the one holding structure.json)
+        """
+        self.path = os.path.join(folder, MANIFEST_FILENAME)
+        self.stages = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.stages = json.load(f).get('stages', {})
+            except (OSError, ValueError):
+                # A corrupt manifest only means everything gets rebuilt
+                self.stages = {}
+
+    def is_current(self, stage: str, key, inputs_hash: str, output_path: Optional[str] = None) -> bool:
+        """
+        Check whether a page output is up to date
+
+        Args:
+            stage: Build stage name (e.g. 'images', 'pages')
+            key: Page identifier within the stage
+            inputs_hash: Hash of the current inputs (from hash_inputs)
+            output_path: Path the output is expected at; a page recorded at
+                another path (e.g. a different image format) is rebuilt
+
+        Returns:
+            True if the recorded inputs match and the output file is unchanged
+        """
+        entry = self.stages.get(stage, {}).get(str(key))
+        if not entry or entry['inputs'] != inputs_hash:
+            return False
+        if output_path is not None and entry['output'] != output_path:
+            return False
+
+        output = entry['output']
+        try:
+            stat = os.stat(output)
+        except OSError:
+            return False
+
+        if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+            return True
+
+        # Touched but maybe not changed: fall back to the content hash
+        if stat.st_size != entry['size'] or hash_file(output) != entry['output_hash']:
+            return False
+
+        with self._lock:
+            entry['mtime'] = stat.st_mtime
+        return True
+
+    def record(self, stage: str, key, inputs_hash: str, output_path: str):
+        """
+        Record the output built from a set of inputs
+
+        Args:
+            stage: Build stage name
+            key: Page identifier within the stage
+            inputs_hash: Hash of the inputs used
+            output_path: File that was written
+        """
+        stat = os.stat(output_path)
+        entry = {
+            'inputs': inputs_hash,
+            'output': output_path,
+            'output_hash': hash_file(output_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
+        with self._lock:
+            self.stages.setdefault(stage, {})[str(key)] = entry
+
+    def output_hash(self, stage: str, key) -> Optional[str]:
+        """
+        Get the recorded hash of a page output
+
+        Args:
+            stage: Build stage name
+            key: Page identifier within the stage
+
+        Returns:
+            Hash of the output file, or None if the page was never recorded
+        """
+        entry = self.stages.get(stage, {}).get(str(key))
+        return entry['output_hash'] if entry else None
+
+    def save(self):
+        """Write the manifest atomically"""
+        # Held while writing too: pages may be recorded from writer threads
+        with self._lock:
+            data = json.dumps({'stages': self.stages}, ensure_ascii=False, indent=2)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
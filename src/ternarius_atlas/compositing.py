@@ -0,0 +1,124 @@
+"""
+Page compositing across processes
+
+Adding text to a page (image decode, overlay, text drawing and PNG encoding)
+is CPU-bound Pillow work, so pages are composited in a process pool. Workers
+receive plain page specs (paths and texts, never PIL images) and send back the
+path of the finished page.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, List, Tuple
+from PIL import Image
+
+from .config import Config
+from .image_writer import save_image
+from .page_composer import PageComposer
+from .tracing import span, tracer
+
+
+# One composer per process, so fonts are loaded once per worker
+_composer = None
+
+
+def _get_composer() -> PageComposer:
+    """Return the page composer of the current process"""
+    global _composer
+    if _composer is None:
+        _composer = PageComposer()
+    return _composer
+
+
+def make_page_spec(page: dict, page_number: int, image_path: str, output_path: str) -> dict:
+    """
+    Build the picklable description of a page to composite
+
+    Args:
+        page: Page entry from structure.json
+        page_number: Page number to print on the page
+        image_path: Base image of the page
+        output_path: Where the final page is saved
+
+    Returns:
+        Page spec for compose_page()
+    """
+    return {
+        'type': page['type'],
+        'title': page.get('title', ''),
+        'text': page.get('text'),
+        'page_number': page_number,
+        'image_path': image_path,
+        'output_path': output_path,
+    }
+
+
+def compose_page(spec: dict) -> str:
+    """
+    Composite one page and save it
+
+    Args:
+        spec: Page spec from make_page_spec()
+
+    Returns:
+        Path of the saved page
+    """
+    composer = _get_composer()
+
+    with span('compose.page', page=spec['page_number']), Image.open(spec['image_path']) as base_image:
+        if spec['type'] == 'cover':
+            final_image = composer.add_text_to_cover(base_image, spec['title'])
+        else:
+            text = spec['title'] or ''
+            if spec['text'] is not None:
+                text = f"{text}\n\n{spec['text']}" if text else spec['text']
+
+            final_image = composer.add_text_to_page(
+                base_image,
+                text,
+                page_number=spec['page_number']
+            )
+
+    # Already off the main process, so the page is encoded right here
+    return save_image(final_image, spec['output_path'])
+
+
+def _compose_page_traced(spec: dict) -> Tuple[str, List[tuple]]:
+    """Composite a page in a worker process and return the spans it recorded"""
+    tracer.enabled = True
+    path = compose_page(spec)
+    return path, tracer.take_events()
+
+
+def compose_pages(specs: List[dict], workers: int = None) -> Iterator[Tuple[dict, str]]:
+    """
+    Composite pages, yielding each one as soon as it is saved
+
+    Args:
+        specs: Page specs from make_page_spec()
+        workers: Number of processes (uses Config.COMPOSITE_WORKERS if not
+            provided; 1 composites in the current process)
+
+    Yields:
+        Tuples of (page spec, saved path), in completion order
+    """
+    workers = workers or Config.COMPOSITE_WORKERS
+    workers = max(1, min(workers, len(specs)))
+
+    if workers == 1:
+        for spec in specs:
+            yield spec, compose_page(spec)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if not tracer.enabled:
+            futures = {executor.submit(compose_page, spec): spec for spec in specs}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+            return
+
+        # Worker spans travel back with the result
+        futures = {executor.submit(_compose_page_traced, spec): spec for spec in specs}
+        for future in as_completed(futures):
+            path, events = future.result()
+            tracer.add_events(events)
+            yield futures[future], path
@@ -13,30 +13,114 @@ load_dotenv()
 class Config:
     """Configuration class for the e-book generator"""
     
-    def __init__(self):
-        self.gemini_api_key = os.getenv("GEMINI_API_KEY")
-        if not self.gemini_api_key:
+    @property
+    def gemini_api_key(self) -> str:
+        """
+        Gemini API key, resolved only when an AI client needs it
+        
+        Returns:
+            The API key
+            
+        Raises:
+            ValueError: If GEMINI_API_KEY is not set
+        """
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
             raise ValueError(
                 "GEMINI_API_KEY não encontrada. "
                 "Por favor, crie um arquivo .env baseado no .env.example "
                 "e adicione sua chave da API do Google Gemini."
             )
+        return api_key
     
     # Default settings for e-book generation
     DEFAULT_PAGE_WIDTH = 800
     DEFAULT_PAGE_HEIGHT = 1200
     DEFAULT_FONT_SIZE = 24
     DEFAULT_TITLE_FONT_SIZE = 36
+    DEFAULT_FONT_FAMILY = "DejaVuSans"
+    FONT_FALLBACK_FAMILIES = ["Arial", "LiberationSans"]
+    FONT_DIRS = ["fonts"]  # Extra directories searched for font files
     DEFAULT_TEXT_COLOR = (0, 0, 0)  # Black
     DEFAULT_BACKGROUND_COLOR = (255, 255, 255)  # White
     DEFAULT_PADDING = 50
     DEFAULT_LINE_SPACING = 1.5
     
     # AI generation settings
+    STRUCTURED_OUTPUT = True  # Ask for JSON responses (the text format stays as fallback)
     MAX_TOKENS_PER_PAGE = 500
+    BATCH_CHAPTERS = True  # Write several chapters (and their image prompts) per request
+    BATCH_TOKEN_BUDGET = int(os.getenv("TERNARIUS_BATCH_TOKEN_BUDGET", "8192"))  # Output tokens per batched request
+    ILLUSTRATION_PROMPT_TOKENS = 100  # Expected size of one image prompt
     TEMPERATURE = 0.7
     IMAGE_SIZE = "512x512"
+    
+    # Pipeline settings
+    MAX_CONCURRENT_CHAPTERS = 4  # Chapters processed in parallel (1 = sequential)
+    BATCH_CONCURRENT_BOOKS = 2  # Books generated in parallel by batch.py
+    COMPOSITE_WORKERS = int(os.getenv("TERNARIUS_COMPOSITE_WORKERS", os.cpu_count() or 1))  # Page compositing processes (1 = in-process)
+    TRACE_ENABLED = os.getenv("TERNARIUS_TRACE") == "1"  # Record per-stage spans (trace.json + summary table)
+    
+    # Gemini quota settings (defaults match the free tier of gemini-2.5-flash)
+    GEMINI_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "10"))
+    GEMINI_TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "250000"))
+    GEMINI_EXPECTED_OUTPUT_TOKENS = 2048  # Reserved per request until the real usage is known
+    GEMINI_MAX_RETRIES = 5  # Retries on 429/5xx errors
+    GEMINI_BACKOFF_BASE = 1.0  # Seconds, doubled on every retry (with jitter)
+    GEMINI_BACKOFF_MAX = 60.0
+    GEMINI_INITIAL_CONCURRENCY = 2  # Requests in flight, adapted to throttling
+    GEMINI_MAX_CONCURRENCY = 8
+    
+    # Image output settings
+    IMAGE_PROFILE = os.getenv("TERNARIUS_IMAGE_PROFILE", "fast_png")  # fast_png, archival_png, webp_lossless or jpeg
+    IMAGE_WRITER_QUEUE = 4  # Images waiting to be encoded before the generator blocks
+    IMAGE_FSYNC = os.getenv("TERNARIUS_IMAGE_FSYNC") == "1"  # Flush every image to disk (crash-safe, slower)
+    
+    # Book packaging settings
+    PACKAGE_FORMATS = ["pdf", "epub"]  # Packages built after the final pages
+    PACKAGE_DPI = 150  # Pixels per inch of the PDF pages
+    PACKAGE_IMAGE_FORMAT = os.getenv("TERNARIUS_PACKAGE_IMAGE_FORMAT") or None  # "jpeg"/"webp" recompress, None keeps images lossless
+    PACKAGE_IMAGE_QUALITY = 85
+    EPUB_LANGUAGE = "pt-BR"
+    
+    # LLM response cache settings
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_PATH = os.path.join(".cache", "responses.sqlite3")
+    RESPONSE_CACHE_TTL = 30 * 24 * 3600  # Seconds (None = never expires)
+    RESPONSE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+    RESPONSE_CACHE_READ_ONLY = os.getenv("TERNARIUS_CACHE_READ_ONLY") == "1"  # Reproducible rebuilds
+    
+    # Stable Diffusion worker settings
+    USE_SD_WORKER = os.getenv("TERNARIUS_SD_WORKER") == "1"  # Use the warm worker for images
+    SD_WORKER_ADDRESS = ("127.0.0.1", 50515)
+    SD_WORKER_AUTHKEY = os.getenv("TERNARIUS_SD_WORKER_AUTHKEY", "").encode() or None  # Override of the key file below
+    SD_WORKER_AUTHKEY_FILE = os.path.join(".cache", "sd_worker.key")  # Random key created on first start (mode 0600)
+    SD_WORKER_FACTORY = "generate_images_sd:load_pipeline"  # Function that loads the pipeline
+    SD_WORKER_LOG = os.path.join(".cache", "sd_worker.log")
+    
+    # Image backend (see image_backends.py)
+    IMAGE_BACKEND = os.getenv("TERNARIUS_IMAGE_BACKEND") or ("worker" if USE_SD_WORKER else "placeholder")  # placeholder, diffusers or worker
+    SD_NEGATIVE_PROMPT = "ugly, blurry, low quality, distorted, deformed, text, watermark, signature"
+    SD_BATCH_SIZE = int(os.getenv("TERNARIUS_SD_BATCH_SIZE", "4"))  # Prompts per pipeline call in the diffusers backend
+    SD_MAX_SIZE = (2048, 2048)  # Largest image the diffusion backends return
+    
+    # Stable Diffusion memory settings (CPU generation)
+    SD_MEMORY_BOUNDED = os.getenv("TERNARIUS_SD_MEMORY_BOUNDED", "auto")  # "auto" = only on CPU, "1" = always, "0" = never
+    SD_MEMORY_BUDGET_MB = int(os.getenv("TERNARIUS_SD_MEMORY_BUDGET_MB", "0")) or None  # Peak RSS (None = 75% of RAM)
+    SD_VAE_TILE_OVERLAP = 64  # Pixels shared by neighbouring VAE tiles (blended to hide seams)
+    PROMPT_EMBED_CACHE_SIZE = 64  # Text-encoder outputs kept per pipeline (~240 KB each in fp32)
+    
+    # Native-resolution generation and upscaling
+    SD_NATIVE_RESOLUTION = os.getenv("TERNARIUS_SD_NATIVE_RESOLUTION", "1") == "1"  # Generate small, upscale to the page
+    SD_NATIVE_SHORT_SIDE = 512  # Shorter side of the generated image (512x768 for an 800x1200 page)
+    UPSCALE_QUALITY = os.getenv("TERNARIUS_UPSCALE_QUALITY", "balanced")  # fast, balanced or quality
+    UPSCALE_ONNX_MODEL = os.getenv("TERNARIUS_UPSCALE_ONNX_MODEL") or None  # Super-resolution model for "quality"
+    
+    # Render profiles (scheduler + steps + guidance, see schedulers.py)
+    RENDER_PROFILE = os.getenv("TERNARIUS_RENDER_PROFILE", "final")  # draft, standard or final
+    REVIEW_RENDER_PROFILE = "draft"  # Used while pages are reviewed in main.py
+    LCM_LORA_PATH = os.getenv("TERNARIUS_LCM_LORA_PATH") or None  # Local LCM-LoRA weights for few-step drafts
 
 
-# Global config instance
+# Global config instance (creating it never requires the API key)
 config = Config()
@@ -3,13 +3,17 @@ Main E-book Generator class that orchestrates the entire generation process
 """
 
 import os
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 from PIL import Image
 
 from .config import config, Config
 from .text_generator import TextGenerator
-from .image_generator import ImageGenerator
+from .image_backends import create_backend
 from .page_composer import PageComposer
+from .image_writer import ImageWriter
+from .packager import write_epub, write_pdf
+from .tracing import span, tracer
 
 
 class EbookGenerator:
@@ -17,18 +21,21 @@ class EbookGenerator:
     Main class to generate complete e-books from a theme
     """
     
-    def __init__(self, output_dir: str = "output"):
+    def __init__(self, output_dir: str = "output", image_backend: Optional[str] = None):
         """
         Initialize the e-book generator
         
         Args:
             output_dir: Directory where e-book pages will be saved
+            image_backend: Image backend name (uses Config.IMAGE_BACKEND if not provided)
         """
         self.output_dir = output_dir
         self.config = config
         self.text_generator = TextGenerator()
-        self.image_generator = ImageGenerator()
+        self.image_generator = create_backend(image_backend)
         self.page_composer = PageComposer(self.config)
+        # Pages are encoded on a background thread while the next ones render
+        self.image_writer = ImageWriter()
         
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
@@ -39,7 +46,10 @@ class EbookGenerator:
         num_chapters: int = 3,
         pages_per_chapter: int = 2,
         include_images: bool = True,
-        author: str = "Gerado por IA com Ternarius Atlas"
+        author: str = "Gerado por IA com Ternarius Atlas",
+        max_workers: Optional[int] = None,
+        batch_chapters: Optional[bool] = None,
+        package_formats: Optional[List[str]] = None
     ) -> List[str]:
         """
         Generate a complete e-book from a theme
@@ -50,6 +60,13 @@ class EbookGenerator:
             pages_per_chapter: Number of pages per chapter
             include_images: Whether to include AI-generated images
             author: Author name to display
+            max_workers: Maximum number of chapters processed at the same time
+                (uses Config.MAX_CONCURRENT_CHAPTERS if not provided, 1 = sequential)
+            batch_chapters: Write several chapters and their image prompts per
+                request, packed up to Config.BATCH_TOKEN_BUDGET (uses
+                Config.BATCH_CHAPTERS if not provided)
+            package_formats: Packages built from the pages, "pdf" and/or
+                "epub" (uses Config.PACKAGE_FORMATS if not provided, [] = none)
             
         Returns:
             List of file paths to generated page images
@@ -72,81 +89,224 @@ class EbookGenerator:
         
         # Step 2: Generate cover page
         print("\n🎨 Etapa 2: Gerando capa do e-book...")
-        cover_image = self.image_generator.generate_cover_image(
-            ebook_title, 
-            theme,
-            self.config.DEFAULT_PAGE_WIDTH,
-            self.config.DEFAULT_PAGE_HEIGHT
-        )
+        with span('ebook.cover'):
+            cover_image = self.image_generator.generate_cover_image(
+                ebook_title, 
+                theme,
+                self.config.DEFAULT_PAGE_WIDTH,
+                self.config.DEFAULT_PAGE_HEIGHT
+            )
         
-        cover_path = os.path.join(self.output_dir, "page_000_cover.png")
-        cover_image.save(cover_path)
+        cover_path = self.image_writer.path(os.path.join(self.output_dir, "page_000_cover.png"))
+        self.image_writer.submit(cover_image, cover_path)
         generated_pages.append(cover_path)
         print(f"✅ Capa salva: {cover_path}")
         
         # Step 3: Generate title page
         print("\n📄 Etapa 3: Gerando página de título...")
-        title_page = self.page_composer.create_title_page(ebook_title, author)
-        title_path = os.path.join(self.output_dir, "page_001_title.png")
-        title_page.save(title_path)
+        with span('ebook.title_page'):
+            title_page = self.page_composer.create_title_page(ebook_title, author)
+        title_path = self.image_writer.path(os.path.join(self.output_dir, "page_001_title.png"))
+        self.image_writer.submit(title_page, title_path)
         generated_pages.append(title_path)
         print(f"✅ Página de título salva: {title_path}")
         
         # Step 4: Generate chapters
-        page_counter = 2
+        # Chapters don't depend on each other, so their LLM calls and images
+        # are produced concurrently; page numbers are assigned afterwards in
+        # chapter order so the output stays deterministic.
+        max_workers = max_workers or self.config.MAX_CONCURRENT_CHAPTERS
+        if batch_chapters is None:
+            batch_chapters = self.config.BATCH_CHAPTERS
+        print(f"\n📖 Etapa 4: Gerando {len(chapters)} capítulos ({max_workers} em paralelo)...")
         
-        for chapter_idx, chapter_title in enumerate(chapters, 1):
-            print(f"\n📖 Etapa 4.{chapter_idx}: Gerando capítulo {chapter_idx}: {chapter_title}")
+        with span('ebook.chapters', chapters=len(chapters)), ThreadPoolExecutor(max_workers=max_workers) as executor:
+            chapter_contents = [None] * len(chapters)
+            if batch_chapters:
+                # A few large requests instead of two small ones per chapter
+                batches = self.text_generator.plan_chapter_batches(chapters, pages_per_chapter)
+                print(f"   📦 {len(chapters)} capítulos em {len(batches)} requisições")
+                batch_results = executor.map(
+                    lambda titles: self.text_generator.generate_chapters_batch(theme, titles, pages_per_chapter),
+                    batches
+                )
+                chapter_contents = [content for batch in batch_results for content in batch]
             
-            # Generate chapter content
-            print(f"   ⏳ Gerando conteúdo do capítulo...")
-            chapter_pages = self.text_generator.generate_chapter_content(
-                theme, 
-                chapter_title, 
-                pages_per_chapter
-            )
+            chapter_results = list(executor.map(
+                lambda args: self._generate_chapter(theme, *args, pages_per_chapter, include_images),
+                zip(range(1, len(chapters) + 1), chapters, chapter_contents)
+            ))
             
-            # Generate pages for this chapter
-            for page_idx, page_content in enumerate(chapter_pages, 1):
-                print(f"   📄 Processando página {page_idx}/{len(chapter_pages)}...")
-                
-                # Optionally generate an image for the page
-                page_image = None
-                if include_images and page_idx == 1:  # Add image to first page of each chapter
-                    print(f"      🎨 Gerando imagem ilustrativa...")
-                    image_prompt = self.text_generator.generate_image_prompt(
-                        theme, 
-                        chapter_title, 
-                        page_content
-                    )
-                    page_image = self.image_generator.generate_image(image_prompt, 400, 300)
-                
-                # Compose the page
-                page = self.page_composer.create_page(
-                    text=page_content,
-                    image=page_image,
-                    page_number=page_counter,
-                    title=chapter_title if page_idx == 1 else ""
-                )
-                
-                # Save the page
-                page_filename = f"page_{page_counter:03d}_ch{chapter_idx}_p{page_idx}.png"
-                page_path = os.path.join(self.output_dir, page_filename)
-                page.save(page_path)
-                generated_pages.append(page_path)
-                print(f"   ✅ Página salva: {page_filename}")
-                
-                page_counter += 1
+            page_specs = []
+            page_counter = 2
+            for chapter_idx, (chapter_title, chapter_pages) in enumerate(zip(chapters, chapter_results), 1):
+                for page_idx, (page_content, page_image) in enumerate(chapter_pages, 1):
+                    page_specs.append({
+                        'text': page_content,
+                        'image': page_image,
+                        'page_number': page_counter,
+                        'title': chapter_title if page_idx == 1 else "",
+                        'filename': f"page_{page_counter:03d}_ch{chapter_idx}_p{page_idx}.png"
+                    })
+                    page_counter += 1
+            
+            # Compose and save pages (results come back in page-number order)
+            generated_pages.extend(executor.map(self._compose_chapter_page, page_specs))
+        
+        # Every page must be on disk before packaging or returning; the
+        # writer thread is stopped too (it restarts if another book is made)
+        with span('ebook.flush'):
+            self.image_writer.close()
+        
+        # Step 5: Package the pages
+        if package_formats is None:
+            package_formats = self.config.PACKAGE_FORMATS
+        if package_formats:
+            print(f"\n📦 Etapa 5: Empacotando ({', '.join(package_formats)})...")
+            with span('ebook.package'):
+                self.package_ebook(generated_pages, ebook_title, author, package_formats)
         
         # Summary
         print("\n" + "=" * 60)
         print(f"🎉 E-book gerado com sucesso!")
         print(f"📚 Total de páginas: {len(generated_pages)}")
         print(f"📁 Diretório de saída: {self.output_dir}")
+        
+        client = getattr(self.text_generator, 'client', None)
+        if client is not None:
+            stats = client.metrics.summary()
+            if 'p50' in stats:
+                print(f"📈 API: {stats['calls']} chamadas, p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s, "
+                      f"{stats['retries']} novas tentativas ({stats['throttled']} por limite de cota)")
+        if tracer.enabled:
+            trace_path = tracer.export_chrome(os.path.join(self.output_dir, "trace.json"))
+            print(f"⏱️  Tempo por etapa (trace completo em {trace_path}):")
+            print(tracer.format_summary())
         print("=" * 60)
         
         return generated_pages
     
+    def _generate_chapter(
+        self,
+        theme: str,
+        chapter_idx: int,
+        chapter_title: str,
+        content: Optional[dict],
+        pages_per_chapter: int,
+        include_images: bool
+    ) -> List[Tuple[str, Optional[Image.Image]]]:
+        """
+        Generate the text and optional illustration for every page of a chapter
+        
+        Args:
+            theme: The main theme of the e-book
+            chapter_idx: Index of the chapter (1-based)
+            chapter_title: Title of the chapter
+            content: Pages and illustration prompt already written by a batched
+                request, or None to generate them here
+            pages_per_chapter: Number of pages to generate
+            include_images: Whether to illustrate the first page
+            
+        Returns:
+            List of (page content, page image or None) tuples
+        """
+        with span('ebook.chapter', chapter=chapter_idx):
+            if content is not None:
+                chapter_pages = content['pages']
+            else:
+                print(f"   ⏳ Capítulo {chapter_idx}: gerando conteúdo de '{chapter_title}'...")
+                chapter_pages = self.text_generator.generate_chapter_content(
+                    theme, 
+                    chapter_title, 
+                    pages_per_chapter
+                )
+            
+            results = []
+            for page_idx, page_content in enumerate(chapter_pages, 1):
+                # Optionally generate an image for the page
+                page_image = None
+                if include_images and page_idx == 1:  # Add image to first page of each chapter
+                    print(f"   🎨 Capítulo {chapter_idx}: gerando imagem ilustrativa...")
+                    image_prompt = content['illustration_prompt'] if content is not None else ''
+                    if not image_prompt:
+                        image_prompt = self.text_generator.generate_image_prompt(
+                            theme, 
+                            chapter_title, 
+                            page_content
+                        )
+                    page_image = self.image_generator.generate(image_prompt, 400, 300)
+            
+                results.append((page_content, page_image))
+            
+            print(f"   ✅ Capítulo {chapter_idx} pronto ({len(results)} páginas)")
+            return results
+    
+    def _compose_chapter_page(self, spec: dict) -> str:
+        """
+        Compose a single chapter page and queue it for saving
+        
+        Args:
+            spec: Page specification with text, image, page_number, title and filename
+            
+        Returns:
+            Path where the page image is saved
+        """
+        with span('compose.page', page=spec['page_number']):
+            page = self.page_composer.create_page(
+                text=spec['text'],
+                image=spec['image'],
+                page_number=spec['page_number'],
+                title=spec['title']
+            )
+        
+        page_path = self.image_writer.path(os.path.join(self.output_dir, spec['filename']))
+        self.image_writer.submit(page, page_path)
+        print(f"   ✅ Página pronta: {os.path.basename(page_path)}")
+        return page_path
+    
+    def package_ebook(
+        self,
+        page_paths: List[str],
+        title: str,
+        author: Optional[str] = None,
+        formats: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Package generated pages into a PDF and/or an EPUB
+        
+        Pages are streamed into the files one at a time. The EPUB holds the
+        composed pages as images, with the first one as its cover.
+        
+        Args:
+            page_paths: Composed page images, in order
+            title: Title of the e-book stored in the metadata (the files are
+                always named ebook.pdf and ebook.epub)
+            author: Author name stored in the metadata
+            formats: "pdf" and/or "epub" (uses Config.PACKAGE_FORMATS if not provided)
+            
+        Returns:
+            List of paths to the generated packages
+        """
+        packages = []
+        for package_format in formats or self.config.PACKAGE_FORMATS:
+            output_path = os.path.join(self.output_dir, f"ebook.{package_format}")
+            if package_format == 'pdf':
+                write_pdf(page_paths, output_path, title=title, author=author)
+            elif package_format == 'epub':
+                write_epub(
+                    ({'image_path': path, 'type': 'cover' if i == 0 else 'content'}
+                     for i, path in enumerate(page_paths)),
+                    output_path,
+                    title=title,
+                    author=author
+                )
+            else:
+                print(f"⚠️  Formato desconhecido: {package_format}")
+                continue
+            packages.append(output_path)
+            print(f"✅ Pacote salvo: {output_path}")
+        return packages
+    
     def generate_quick_ebook(self, theme: str) -> List[str]:
         """
         Generate a quick/demo e-book with minimal configuration
@@ -0,0 +1,171 @@
+"""
+Process-wide font registry that loads each font once and shares it
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from PIL import ImageFont
+
+from .config import Config
+
+
+# Font file names per family and weight, tried in order
+FONT_FILES = {
+    'dejavusans': {
+        'regular': ['DejaVuSans.ttf'],
+        'bold': ['DejaVuSans-Bold.ttf'],
+    },
+    'arial': {
+        'regular': ['arial.ttf', 'Arial.ttf'],
+        'bold': ['arialbd.ttf', 'Arial Bold.ttf'],
+    },
+    'liberationsans': {
+        'regular': ['LiberationSans-Regular.ttf'],
+        'bold': ['LiberationSans-Bold.ttf'],
+    },
+}
+
+
+class FontRegistry:
+    """Load TrueType fonts by family, size and weight exactly once"""
+
+    def __init__(
+        self,
+        default_family: str = None,
+        fallback_families: Optional[List[str]] = None,
+        font_dirs: Optional[List[str]] = None
+    ):
+        """
+        Initialize the font registry
+
+        Args:
+            default_family: Family used when none is requested
+            fallback_families: Families tried, in order, when a family is missing
+            font_dirs: Extra directories searched before the system font paths
+        """
+        self.default_family = default_family or Config.DEFAULT_FONT_FAMILY
+        self.fallback_families = Config.FONT_FALLBACK_FAMILIES if fallback_families is None else fallback_families
+        self.font_dirs = Config.FONT_DIRS if font_dirs is None else font_dirs
+        self._fonts: Dict[Tuple[str, int, str], ImageFont.ImageFont] = {}
+        self._sources: Dict[Tuple[str, int, str], str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, size: int, weight: str = 'regular', family: str = None):
+        """
+        Get a shared font instance
+
+        Args:
+            size: Font size in pixels
+            weight: 'regular' or 'bold'
+            family: Font family (uses the default family if not provided)
+
+        Returns:
+            Font object, falling back to Pillow's default font if no TrueType
+            font of the requested family (or its fallbacks) is available
+        """
+        key = ((family or self.default_family).lower(), size, weight)
+        font = self._fonts.get(key)
+        if font is not None:
+            return font
+
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is None:
+                font, source = self._load(key[0], size, weight)
+                self._fonts[key] = font
+                self._sources[key] = source
+            return font
+
+    def fingerprint(self) -> str:
+        """
+        Describe the fonts loaded so far (family, size, weight and source file)
+
+        Returns:
+            Stable text that changes whenever a different font file is used
+        """
+        with self._lock:
+            return ';'.join(
+                f"{family}:{size}:{weight}={self._sources[(family, size, weight)]}"
+                for family, size, weight in sorted(self._sources)
+            )
+
+    def _load(self, family: str, size: int, weight: str):
+        """Walk the fallback chain and return (font, source description)"""
+        families = [family] + [f.lower() for f in self.fallback_families if f.lower() != family]
+
+        for candidate in families:
+            for filename in self._candidate_files(candidate, weight):
+                try:
+                    return ImageFont.truetype(filename, size), filename
+                except (OSError, IOError):
+                    continue
+
+        try:
+            return ImageFont.load_default(size), f"default:{size}"
+        except (TypeError, AttributeError, ImportError):
+            # Older Pillow without FreeType default font
+            return ImageFont.load_default(), "default"
+
+    def _candidate_files(self, family: str, weight: str) -> List[str]:
+        """List font files to try for a family, extra directories first"""
+        names = FONT_FILES.get(family, {}).get(weight)
+        if names is None:
+            # Unknown family: treat it as a font file name
+            names = [family if family.endswith(('.ttf', '.otf')) else family + '.ttf']
+
+        files = [os.path.join(directory, name) for directory in self.font_dirs for name in names]
+        # Bare names are resolved by Pillow against the system font directories
+        return files + names
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> FontRegistry:
+    """Return the process-wide font registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = FontRegistry()
+    return _registry
+
+
+def describe_font(font) -> str:
+    """
+    Identify a font by name, style, size and source file
+
+    Args:
+        font: Font object
+
+    Returns:
+        Text that changes whenever a different font or font file is used
+    """
+    try:
+        family, style = font.getname()
+    except (AttributeError, TypeError):
+        family, style = type(font).__name__, ''
+    path = getattr(font, 'path', None)
+    if not isinstance(path, str):
+        # Built-in fonts are loaded from memory
+        path = 'builtin'
+    elif os.path.exists(path):
+        path = f"{path}@{os.path.getsize(path)}"
+    return f"{family} {style} {getattr(font, 'size', '')} {path}"
+
+
+def get_font(size: int, weight: str = 'regular', family: str = None):
+    """
+    Get a shared font from the process-wide registry
+
+    Args:
+        size: Font size in pixels
+        weight: 'regular' or 'bold'
+        family: Font family (uses Config.DEFAULT_FONT_FAMILY if not provided)
+
+    Returns:
+        Font object
+    """
+    return get_registry().get(size, weight, family)
@@ -0,0 +1,379 @@
+"""
+Quota-aware client layer around the Gemini model
+
+Wraps any object exposing generate_content() (a GenerativeModel or a fake in
+tests) with:
+
+- a token-bucket limiter for requests per minute and tokens per minute
+- retries with jittered exponential backoff on 429 and 5xx errors
+- AIMD adaptive concurrency: the number of requests in flight grows by one per
+  window of successful calls and is halved whenever the API throttles
+- per-call latency metrics
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Iterator, List, Optional
+
+from .config import Config
+from .tracing import span
+
+
+# HTTP status codes worth retrying, and the ones that mean "slow down"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+
+
+def status_code(error: Exception) -> Optional[int]:
+    """
+    Extract the HTTP status code of an API error
+
+    Args:
+        error: Exception raised by the model (google.api_core errors carry an
+            integer ``code``)
+
+    Returns:
+        Status code, or None if the error doesn't carry one
+    """
+    for attribute in ('code', 'status_code'):
+        code = getattr(error, attribute, None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously"""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Initialize a full bucket
+
+        Args:
+            per_minute: Tokens granted per minute (also the burst capacity)
+            clock: Monotonic clock (injectable for tests)
+            sleep: Sleep function (injectable for tests)
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Take tokens, waiting until enough are available
+
+        Args:
+            amount: Tokens to take (capped at the bucket capacity)
+
+        Returns:
+            Seconds spent waiting
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float):
+        """
+        Correct a previous estimate (negative amounts return tokens)
+
+        The bucket may go into debt, which delays the next callers.
+
+        Args:
+            amount: Extra tokens actually used
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the number of calls in flight"""
+
+    def __init__(self, initial: int = 2, minimum: int = 1, maximum: int = 8):
+        """
+        Initialize the limiter
+
+        Args:
+            initial: Starting concurrency limit
+            minimum: Lowest limit after repeated throttling
+            maximum: Highest limit reached by additive increase
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        """
+        Free a slot and adapt the limit
+
+        Args:
+            throttled: Whether the call was rejected for exceeding the quota
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                # Multiplicative decrease
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                # Additive increase: about +1 after a full window of successes
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class CallMetrics:
+    """Latency and retry statistics of the calls made through a client"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float = None, retries: int = 0, throttled: int = 0,
+               waited: float = 0.0, failed: bool = False):
+        """Record the outcome of one logical call (including its retries)"""
+        with self._lock:
+            self.calls += 1
+            self.retries += retries
+            self.throttled += throttled
+            self.wait_time += waited
+            if failed:
+                self.failures += 1
+            elif latency is not None:
+                self.latencies.append(latency)
+
+    def summary(self) -> dict:
+        """
+        Summarize the recorded calls
+
+        Returns:
+            Dictionary with call counts and p50/p95/max latency in seconds
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            summary = {
+                'calls': self.calls,
+                'failures': self.failures,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'wait_time': round(self.wait_time, 3),
+            }
+        if latencies:
+            summary['p50'] = latencies[int(0.50 * (len(latencies) - 1))]
+            summary['p95'] = latencies[int(0.95 * (len(latencies) - 1))]
+            summary['max'] = latencies[-1]
+        return summary
+
+
+class GeminiClient:
+    """Rate-limited, retrying wrapper exposing the model's generate_content()"""
+
+    def __init__(
+        self,
+        model,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        max_retries: int = None,
+        backoff_base: float = None,
+        backoff_max: float = None,
+        initial_concurrency: int = None,
+        max_concurrency: int = None,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Initialize the client
+
+        Args:
+            model: Object with a generate_content(prompt, **kwargs) method
+            requests_per_minute: Request quota (uses Config.GEMINI_REQUESTS_PER_MINUTE)
+            tokens_per_minute: Token quota (uses Config.GEMINI_TOKENS_PER_MINUTE)
+            max_retries: Retries after a 429/5xx error (uses Config.GEMINI_MAX_RETRIES)
+            backoff_base: First backoff ceiling in seconds (uses Config.GEMINI_BACKOFF_BASE)
+            backoff_max: Largest backoff ceiling in seconds (uses Config.GEMINI_BACKOFF_MAX)
+            initial_concurrency: Starting number of calls in flight
+            max_concurrency: Largest number of calls in flight
+            sleep: Sleep function (injectable for tests)
+        """
+        self.model = model
+        self.max_retries = Config.GEMINI_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = backoff_base if backoff_base is not None else Config.GEMINI_BACKOFF_BASE
+        self.backoff_max = backoff_max if backoff_max is not None else Config.GEMINI_BACKOFF_MAX
+        self._sleep = sleep
+
+        self.requests = TokenBucket(requests_per_minute or Config.GEMINI_REQUESTS_PER_MINUTE, sleep=sleep)
+        self.tokens = TokenBucket(tokens_per_minute or Config.GEMINI_TOKENS_PER_MINUTE, sleep=sleep)
+        self.concurrency = AdaptiveConcurrency(
+            initial=initial_concurrency or Config.GEMINI_INITIAL_CONCURRENCY,
+            maximum=max_concurrency or Config.GEMINI_MAX_CONCURRENCY
+        )
+        self.metrics = CallMetrics()
+
+    def __getattr__(self, name):
+        # Everything else (count_tokens, model_name, ...) goes to the model
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    @staticmethod
+    def estimate_tokens(prompt) -> int:
+        """
+        Estimate the tokens of a request before sending it
+
+        Args:
+            prompt: Prompt text
+
+        Returns:
+            Prompt tokens (about 4 characters per token) plus the expected output
+        """
+        return len(str(prompt)) // 4 + Config.GEMINI_EXPECTED_OUTPUT_TOKENS
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Full-jitter exponential backoff
+
+        Args:
+            attempt: Retry number (0 for the first retry)
+
+        Returns:
+            Seconds to wait before retrying
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        """
+        Call the model within the quotas, retrying throttled and failed calls
+
+        Args:
+            prompt: Prompt to send
+            stream: Return an iterator of chunks instead of a full response
+            **kwargs: Forwarded to the model's generate_content
+
+        Returns:
+            The model response (an iterator of chunks when streaming)
+        """
+        if stream:
+            return self._stream(prompt, **kwargs)
+        return self._call(lambda: self.model.generate_content(prompt, **kwargs), prompt)
+
+    def _call(self, request: Callable[[], object], prompt, keep_slot: bool = False):
+        """
+        Run a request with rate limiting, retries and metrics
+
+        Args:
+            request: Function performing one attempt
+            prompt: Prompt sent (for the token estimate)
+            keep_slot: On success, keep the concurrency slot and the token
+                estimate; the caller releases the slot and settles the tokens
+
+        Returns:
+            The response, or (response, token estimate) with keep_slot
+        """
+        estimate = self.estimate_tokens(prompt)
+        retries = throttled = 0
+        waited = 0.0
+
+        while True:
+            with span('gemini.quota_wait'):
+                waited += self.requests.acquire()
+                waited += self.tokens.acquire(estimate)
+                self.concurrency.acquire()
+
+            start_time = time.monotonic()
+            try:
+                with span('gemini.request', attempt=retries):
+                    response = request()
+            except Exception as e:
+                code = status_code(e)
+                is_throttle = code in THROTTLE_STATUS
+                self.concurrency.release(throttled=is_throttle)
+                if code not in RETRYABLE_STATUS or retries >= self.max_retries:
+                    self.metrics.record(retries=retries, throttled=throttled + is_throttle,
+                                        waited=waited, failed=True)
+                    raise
+                throttled += is_throttle
+                delay = self.backoff_delay(retries)
+                retries += 1
+                with span('gemini.backoff'):
+                    self._sleep(delay)
+                waited += delay
+                continue
+
+            latency = time.monotonic() - start_time
+            self.metrics.record(latency, retries, throttled, waited)
+            if keep_slot:
+                return response, estimate
+            self.concurrency.release()
+            self._settle_tokens(response, estimate)
+            return response
+
+    def _stream(self, prompt, **kwargs) -> Iterator:
+        """
+        Stream a response, retrying only until the first chunk arrives
+
+        Once chunks were handed to the caller a retry would duplicate text,
+        so errors after that point are raised. The recorded latency is the
+        time to the first chunk; the concurrency slot is held until the stream
+        is exhausted or closed, and the tokens are settled from the usage of
+        the last chunk.
+        """
+        stream_iter = None
+
+        def open_stream():
+            nonlocal stream_iter
+            stream_iter = iter(self.model.generate_content(prompt, stream=True, **kwargs))
+            # Errors usually surface on the first chunk, so fetch it under the retry loop
+            return next(stream_iter, None)
+
+        first, estimate = self._call(open_stream, prompt, keep_slot=True)
+        last = first
+        throttled = False
+        try:
+            if first is None:
+                return
+            yield first
+            for last in stream_iter:
+                yield last
+        except Exception as e:
+            throttled = status_code(e) in THROTTLE_STATUS
+            raise
+        finally:
+            self.concurrency.release(throttled=throttled)
+            self._settle_tokens(last, estimate)
+
+    def _settle_tokens(self, response, estimate: int):
+        """Replace the token estimate by the usage reported by the API"""
+        usage = getattr(response, 'usage_metadata', None)
+        total = getattr(usage, 'total_token_count', None)
+        if isinstance(total, int) and total > 0:
+            self.tokens.adjust(total - estimate)
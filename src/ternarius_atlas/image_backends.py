@@ -0,0 +1,491 @@
+"""
+Pluggable image backends
+
+Every image source implements the ImageBackend interface:
+
+    generate(prompt, width, height, seed=None, profile=None) -> PIL Image
+    generate_many(requests) -> list of PIL Images, in order
+    agenerate / agenerate_many: the same, awaitable
+
+and describes what it can do in its BackendCapabilities (batching, largest
+image, seeding, render profiles). Backends are registered by name:
+
+    placeholder  gradient with the prompt text, no model (default)
+    diffusers    Stable Diffusion pipeline loaded in this process
+    worker       Stable Diffusion in the persistent worker (sd_worker.py)
+
+Config.IMAGE_BACKEND selects the backend used by EbookGenerator and main.py.
+torch and diffusers are only imported by the diffusion backends.
+"""
+
+import asyncio
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from PIL import Image
+
+from .config import Config
+from .tracing import span
+
+
+class BackendCapabilities:
+    """What an image backend supports"""
+
+    def __init__(
+        self,
+        batching: bool = False,
+        max_batch_size: int = 1,
+        max_size: Optional[Tuple[int, int]] = None,
+        seeding: bool = False,
+        profiles: bool = False
+    ):
+        """
+        Args:
+            batching: Several prompts run in a single model call
+            max_batch_size: Prompts per model call
+            max_size: Largest (width, height) the backend returns (None = no limit)
+            seeding: The same seed reproduces the same image
+            profiles: Accepts render profiles (draft/standard/final)
+        """
+        self.batching = batching
+        self.max_batch_size = max_batch_size if batching else 1
+        self.max_size = max_size
+        self.seeding = seeding
+        self.profiles = profiles
+
+    def __repr__(self):
+        return (
+            f"BackendCapabilities(batching={self.batching}, max_batch_size={self.max_batch_size}, "
+            f"max_size={self.max_size}, seeding={self.seeding}, profiles={self.profiles})"
+        )
+
+
+# Request fields accepted by generate_many, with their defaults
+REQUEST_DEFAULTS = {
+    'width': 512,
+    'height': 512,
+    'seed': None,
+    'profile': None,
+    'negative_prompt': None,
+}
+
+
+def normalize_request(request: Union[str, dict]) -> dict:
+    """
+    Complete a generate_many request with the default fields
+
+    Args:
+        request: Prompt text, or dict with 'prompt' and optionally 'width',
+            'height', 'seed', 'profile' and 'negative_prompt'
+
+    Returns:
+        Request dict with every field set
+    """
+    if isinstance(request, str):
+        request = {'prompt': request}
+    if 'prompt' not in request:
+        raise ValueError("Requisição de imagem sem 'prompt'")
+    return dict(REQUEST_DEFAULTS, **request)
+
+
+class ImageBackend(ABC):
+    """
+    Interface of an image backend
+
+    Subclasses implement generate(); generate_many() and the async methods
+    fall back to it. Backends with batching override generate_many().
+    """
+
+    name = None  # Registry name (set by register_backend)
+    # Identifies the backend in build manifests; the placeholder and worker
+    # keep the generator class names hashed before backends existed, so
+    # existing books don't regenerate their images
+    fingerprint = None
+    capabilities = BackendCapabilities()
+
+    @abstractmethod
+    def generate(
+        self,
+        prompt: str,
+        width: int = 512,
+        height: int = 512,
+        seed: Optional[int] = None,
+        profile: Optional[str] = None
+    ) -> Image.Image:
+        """
+        Generate one image
+
+        Args:
+            prompt: Description of the image
+            width: Width of the image
+            height: Height of the image
+            seed: Random seed (ignored by backends without seeding)
+            profile: Render profile (ignored by backends without profiles)
+
+        Returns:
+            PIL Image of the requested size
+        """
+
+    def generate_many(self, requests: Sequence[Union[str, dict]]) -> List[Image.Image]:
+        """
+        Generate several images
+
+        Args:
+            requests: Prompts, or dicts as accepted by normalize_request
+
+        Returns:
+            Images in the order of the requests
+        """
+        images = []
+        for request in map(normalize_request, requests):
+            images.append(self.generate(
+                request['prompt'], request['width'], request['height'],
+                seed=request['seed'], profile=request['profile']
+            ))
+        return images
+
+    async def agenerate(self, prompt: str, width: int = 512, height: int = 512,
+                        seed: Optional[int] = None, profile: Optional[str] = None) -> Image.Image:
+        """Awaitable generate(), run on a worker thread"""
+        return await asyncio.to_thread(self.generate, prompt, width, height, seed, profile)
+
+    async def agenerate_many(self, requests: Sequence[Union[str, dict]]) -> List[Image.Image]:
+        """Awaitable generate_many(), run on a worker thread"""
+        return await asyncio.to_thread(self.generate_many, list(requests))
+
+    def generate_cover_image(self, title: str, theme: str, width: int = 800, height: int = 1200) -> Image.Image:
+        """
+        Typographic cover of a book (drawn, not generated by the model)
+
+        Args:
+            title: Title of the e-book
+            theme: Theme of the e-book
+            width: Width of the cover
+            height: Height of the cover
+
+        Returns:
+            PIL Image object
+        """
+        return _placeholder_generator().generate_cover_image(title, theme, width, height)
+
+    def check_size(self, width: int, height: int):
+        """
+        Reject sizes the backend can't produce
+
+        Raises:
+            ValueError: If the size exceeds capabilities.max_size
+        """
+        max_size = self.capabilities.max_size
+        if max_size and (width > max_size[0] or height > max_size[1]):
+            raise ValueError(
+                f"{width}x{height} excede o tamanho máximo do backend '{self.name}' "
+                f"({max_size[0]}x{max_size[1]})"
+            )
+
+
+_BACKENDS: Dict[str, type] = {}
+
+
+def register_backend(name: str) -> Callable[[type], type]:
+    """
+    Class decorator adding an ImageBackend to the registry
+
+    Args:
+        name: Name used in Config.IMAGE_BACKEND
+    """
+    def decorator(cls):
+        cls.name = name
+        _BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def available_backends() -> List[str]:
+    """Names of the registered backends"""
+    return sorted(_BACKENDS)
+
+
+def backend_class(name: Optional[str] = None) -> type:
+    """
+    Registered backend class
+
+    Args:
+        name: Backend name (uses Config.IMAGE_BACKEND if not provided)
+
+    Raises:
+        ValueError: If no backend has this name
+    """
+    name = name or Config.IMAGE_BACKEND
+    if name not in _BACKENDS:
+        raise ValueError(f"Backend de imagens desconhecido: {name} (use {', '.join(available_backends())})")
+    return _BACKENDS[name]
+
+
+def create_backend(name: Optional[str] = None, **options) -> ImageBackend:
+    """
+    Create an image backend
+
+    Args:
+        name: Backend name (uses Config.IMAGE_BACKEND if not provided)
+        **options: Arguments of the backend's constructor
+
+    Returns:
+        The backend (models are loaded on the first image)
+    """
+    return backend_class(name)(**options)
+
+
+def as_backend(generator) -> ImageBackend:
+    """
+    Use an image generator as a backend
+
+    Args:
+        generator: An ImageBackend, or any object with a
+            generate_image(prompt, width, height) method
+
+    Returns:
+        The backend itself, or an adapter around the generator
+    """
+    if isinstance(generator, ImageBackend):
+        return generator
+    return GeneratorBackend(generator)
+
+
+_placeholder = None
+_placeholder_lock = threading.Lock()
+
+
+def _placeholder_generator():
+    """Shared placeholder ImageGenerator (loads the Gemini SDK on first use)"""
+    global _placeholder
+    with _placeholder_lock:
+        if _placeholder is None:
+            from .image_generator import ImageGenerator
+            _placeholder = ImageGenerator()
+        return _placeholder
+
+
+@register_backend('placeholder')
+class PlaceholderBackend(ImageBackend):
+    """Gradient images showing the prompt, for layout work without a model"""
+
+    fingerprint = 'ImageGenerator'
+    capabilities = BackendCapabilities()
+
+    def generate(self, prompt, width=512, height=512, seed=None, profile=None):
+        return _placeholder_generator().generate_image(prompt, width, height)
+
+
+class GeneratorBackend(ImageBackend):
+    """Adapter for objects with the older generate_image(prompt, width, height) API"""
+
+    def __init__(self, generator):
+        """
+        Args:
+            generator: Object with generate_image(); it may set a class
+                attribute supports_profiles to accept a profile argument
+        """
+        self.generator = generator
+        self.name = self.fingerprint = type(generator).__name__
+        self.capabilities = BackendCapabilities(profiles=getattr(generator, 'supports_profiles', False))
+
+    def generate(self, prompt, width=512, height=512, seed=None, profile=None):
+        extra = {'profile': profile} if profile and self.capabilities.profiles else {}
+        return self.generator.generate_image(prompt, width=width, height=height, **extra)
+
+    def generate_cover_image(self, title, theme, width=800, height=1200):
+        if hasattr(self.generator, 'generate_cover_image'):
+            return self.generator.generate_cover_image(title, theme, width, height)
+        return super().generate_cover_image(title, theme, width, height)
+
+
+class DiffusionBackend(ImageBackend):
+    """
+    Shared parts of the Stable Diffusion backends
+
+    Images are generated at the model's native resolution and upscaled to
+    the requested size (see upscaler.py).
+    """
+
+    capabilities = BackendCapabilities(max_size=Config.SD_MAX_SIZE, seeding=True, profiles=True)
+
+    def __init__(self, native_resolution: Optional[bool] = None, upscale_quality: Optional[str] = None,
+                 negative_prompt: Optional[str] = None):
+        """
+        Args:
+            native_resolution: Generate small and upscale (uses Config.SD_NATIVE_RESOLUTION)
+            upscale_quality: 'fast', 'balanced' or 'quality' (uses Config.UPSCALE_QUALITY)
+            negative_prompt: Default negative prompt (uses Config.SD_NEGATIVE_PROMPT)
+        """
+        from .upscaler import Upscaler
+
+        self.native_resolution = Config.SD_NATIVE_RESOLUTION if native_resolution is None else native_resolution
+        self.upscaler = Upscaler(upscale_quality)
+        self.negative_prompt = negative_prompt or Config.SD_NEGATIVE_PROMPT
+
+    def generation_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Size the UNet runs at for an image of this size"""
+        from .upscaler import native_size
+
+        if self.native_resolution:
+            return native_size(width, height)
+        return (width // 8) * 8, (height // 8) * 8
+
+    def generate(self, prompt, width=512, height=512, seed=None, profile=None):
+        return self.generate_many([{
+            'prompt': prompt, 'width': width, 'height': height, 'seed': seed, 'profile': profile
+        }])[0]
+
+
+def _add_project_root_to_path():
+    """Make the pipeline factories in the project root importable"""
+    from .sd_worker import PROJECT_ROOT
+
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+
+
+@register_backend('diffusers')
+class DiffusersBackend(DiffusionBackend):
+    """Stable Diffusion pipeline loaded in this process, with batched calls"""
+
+    fingerprint = 'diffusers'
+    capabilities = BackendCapabilities(
+        batching=True,
+        max_batch_size=Config.SD_BATCH_SIZE,
+        max_size=Config.SD_MAX_SIZE,
+        seeding=True,
+        profiles=True
+    )
+
+    def __init__(self, pipe=None, factory: Optional[str] = None, **options):
+        """
+        Args:
+            pipe: Loaded pipeline (loaded with the factory on first use if not provided)
+            factory: Pipeline factory "module:function" (uses Config.SD_WORKER_FACTORY)
+            **options: native_resolution, upscale_quality and negative_prompt
+        """
+        super().__init__(**options)
+        self.factory = factory or Config.SD_WORKER_FACTORY
+        self._pipe = pipe
+        self._profiles = None
+        # One pipeline can't run two calls at once (chapters and books run in threads)
+        self._lock = threading.Lock()
+
+    @property
+    def pipe(self):
+        """Pipeline, loaded on first use"""
+        if self._pipe is None:
+            from .sd_worker import load_factory
+
+            _add_project_root_to_path()
+            self._pipe = load_factory(self.factory)()
+            if self._pipe is None:
+                raise RuntimeError(f"Pipeline do Stable Diffusion não carregou ({self.factory})")
+        return self._pipe
+
+    def _run(self, jobs: List[dict], width: int, height: int, profile: Optional[str]) -> List[Image.Image]:
+        """One pipeline call for jobs sharing size and profile"""
+        import torch
+        from .schedulers import SchedulerProfiles, unwrap_pipeline
+
+        generate_width, generate_height = self.generation_size(width, height)
+        with self._lock:
+            pipe = self.pipe
+            if self._profiles is None:
+                self._profiles = SchedulerProfiles(pipe)
+            settings = self._profiles.apply(profile)
+
+            generators = None
+            if any(job['seed'] is not None for job in jobs):
+                device = str(getattr(unwrap_pipeline(pipe), 'device', 'cpu'))
+                generators = [
+                    torch.Generator(device).manual_seed(
+                        job['seed'] if job['seed'] is not None else int(torch.randint(0, 2**31 - 1, (1,)))
+                    )
+                    for job in jobs
+                ]
+
+            with span('image.diffusion', backend=self.name, batch=len(jobs), profile=profile,
+                      size=[generate_width, generate_height]), torch.inference_mode():
+                result = pipe(
+                    prompt=[job['prompt'] for job in jobs],
+                    negative_prompt=[job['negative_prompt'] or self.negative_prompt for job in jobs],
+                    width=generate_width,
+                    height=generate_height,
+                    generator=generators,
+                    **settings
+                )
+
+        return [self.upscaler.upscale(image.convert('RGB'), (width, height)) for image in result.images]
+
+    def generate_many(self, requests):
+        jobs = list(map(normalize_request, requests))
+        images = [None] * len(jobs)
+
+        # Jobs with the same size and profile share pipeline calls, in order
+        groups = {}
+        for index, job in enumerate(jobs):
+            job['width'] = (job['width'] // 8) * 8
+            job['height'] = (job['height'] // 8) * 8
+            self.check_size(job['width'], job['height'])
+            job['profile'] = job['profile'] or Config.RENDER_PROFILE
+            groups.setdefault((job['width'], job['height'], job['profile']), []).append(index)
+
+        size = self.capabilities.max_batch_size
+        for (width, height, profile), indices in groups.items():
+            for start in range(0, len(indices), size):
+                chunk = indices[start:start + size]
+                for index, image in zip(chunk, self._run([jobs[i] for i in chunk], width, height, profile)):
+                    images[index] = image
+        return images
+
+
+@register_backend('worker')
+class WorkerBackend(DiffusionBackend):
+    """Stable Diffusion in the persistent worker process (model stays loaded)"""
+
+    fingerprint = 'SDWorkerClient'
+
+    def __init__(self, client=None, factory: Optional[str] = None, **options):
+        """
+        Args:
+            client: Connected SDWorkerClient (the worker is started on first
+                use if not provided)
+            factory: Pipeline factory used if the worker has to be started
+            **options: native_resolution, upscale_quality and negative_prompt
+        """
+        super().__init__(**options)
+        self.factory = factory
+        self._client = client
+        # Chapters call the backend from several threads; only one may start the worker
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Client of the running worker, started on first use"""
+        with self._client_lock:
+            if self._client is None:
+                from .sd_worker import ensure_worker
+                self._client = ensure_worker(self.factory)
+            return self._client
+
+    def generate_many(self, requests):
+        # The worker runs one job at a time, so requests are sent in order
+        images = []
+        for job in map(normalize_request, requests):
+            width, height = (job['width'] // 8) * 8, (job['height'] // 8) * 8
+            self.check_size(width, height)
+            generate_width, generate_height = self.generation_size(width, height)
+            image, _ = self.client.generate(
+                job['prompt'],
+                negative_prompt=job['negative_prompt'] or self.negative_prompt,
+                width=generate_width,
+                height=generate_height,
+                seed=job['seed'],
+                profile=job['profile'] or Config.RENDER_PROFILE
+            )
+            images.append(self.upscaler.upscale(image, (width, height)))
+        return images
@@ -2,12 +2,15 @@
 Image generation module using Google Gemini AI
 """
 
-import google.generativeai as genai
 from PIL import Image
 import io
 import time
 from typing import Optional
 from .config import config
+from .fonts import get_font
+from .gradients import linear_gradient
+from .text_layout import wrap_text
+from .tracing import traced
 
 
 class ImageGenerator:
@@ -15,6 +18,9 @@ class ImageGenerator:
     
     def __init__(self):
         """Initialize the image generator with Gemini API"""
+        # Imported here so the package can be used without loading the SDK
+        import google.generativeai as genai
+        
         genai.configure(api_key=config.gemini_api_key)
         # Note: Google Gemini Pro Vision is for image analysis, not generation
         # Image generation functionality uses placeholder images
@@ -24,6 +30,7 @@ class ImageGenerator:
         except (AttributeError, ValueError) as e:
             self.model = None
     
+    @traced('image.generate')
     def generate_image(self, prompt: str, width: int = 512, height: int = 512) -> Optional[Image.Image]:
         """
         Generate an image based on the prompt
@@ -42,26 +49,18 @@ class ImageGenerator:
         
         try:
             # Create a placeholder image with gradient background
-            img = Image.new('RGB', (width, height), color=(240, 240, 250))
+            img = linear_gradient(width, height, [(240, 240, 250), (190, 190, 200)])
             
             # Add some visual interest
-            from PIL import ImageDraw, ImageFont
+            from PIL import ImageDraw
             draw = ImageDraw.Draw(img)
             
-            # Draw a gradient-like effect
-            for i in range(height):
-                color_value = int(240 - (i / height) * 50)
-                draw.rectangle([(0, i), (width, i+1)], fill=(color_value, color_value, color_value + 10))
-            
             # Add text showing it's an AI-generated placeholder
-            try:
-                # Try to use a basic font
-                font = ImageFont.load_default()
-            except (OSError, IOError, ImportError):
-                font = None
+            font = get_font(config.DEFAULT_FONT_SIZE)
             
             # Draw prompt text (truncated if too long)
-            text = f"Ilustração:\n{prompt[:100]}"
+            prompt_lines = wrap_text(prompt[:100], width - 40, font)
+            text = "Ilustração:\n" + "\n".join(prompt_lines)
             if font:
                 # Calculate text position
                 text_bbox = draw.textbbox((0, 0), text, font=font)
@@ -82,6 +81,7 @@ class ImageGenerator:
             # Return a simple colored placeholder
             return Image.new('RGB', (width, height), color=(200, 220, 240))
     
+    @traced('image.cover')
     def generate_cover_image(self, title: str, theme: str, width: int = 800, height: int = 1200) -> Image.Image:
         """
         Generate a cover image for the e-book
@@ -95,19 +95,12 @@ class ImageGenerator:
         Returns:
             PIL Image object
         """
-        # Create an attractive cover image
-        img = Image.new('RGB', (width, height), color=(30, 60, 100))
+        # Create an attractive cover image with a gradient background
+        img = linear_gradient(width, height, [(30, 60, 100), (130, 140, 220)])
         
-        from PIL import ImageDraw, ImageFont
+        from PIL import ImageDraw
         draw = ImageDraw.Draw(img)
         
-        # Draw a gradient background
-        for i in range(height):
-            r = int(30 + (i / height) * 100)
-            g = int(60 + (i / height) * 80)
-            b = int(100 + (i / height) * 120)
-            draw.rectangle([(0, i), (width, i+1)], fill=(r, g, b))
-        
         # Draw decorative elements
         for i in range(5):
             x = int(width * 0.1 + i * width * 0.15)
@@ -115,33 +108,13 @@ class ImageGenerator:
             size = 50
             draw.ellipse([(x, y), (x + size, y + size)], fill=(255, 255, 255, 50))
         
-        try:
-            # Use default font
-            title_font = ImageFont.load_default()
-            theme_font = ImageFont.load_default()
-        except (OSError, IOError, ImportError):
-            title_font = None
-            theme_font = None
+        title_font = get_font(config.DEFAULT_TITLE_FONT_SIZE, 'bold')
+        theme_font = get_font(config.DEFAULT_FONT_SIZE)
         
         # Draw title
         if title_font:
-            # Word wrap title
-            words = title.split()
-            lines = []
-            current_line = []
-            
-            for word in words:
-                test_line = ' '.join(current_line + [word])
-                bbox = draw.textbbox((0, 0), test_line, font=title_font)
-                if bbox[2] - bbox[0] < width - 100:
-                    current_line.append(word)
-                else:
-                    if current_line:
-                        lines.append(' '.join(current_line))
-                    current_line = [word]
-            
-            if current_line:
-                lines.append(' '.join(current_line))
+            # Word wrap title (lines strictly narrower than width - 100)
+            lines = wrap_text(title, width - 100, title_font, strict=True)
             
             # Draw title lines
             y_offset = height // 3
@@ -0,0 +1,475 @@
+"""
+Book packaging: multi-page PDF and EPUB
+
+Pages are written one at a time straight to the output file, so packaging a
+book only keeps one page image in memory no matter how many pages it has.
+Identical images (same file contents) are stored once and referenced by every
+page that uses them. Embedded images can optionally be recompressed to JPEG
+or WebP to shrink the packages.
+"""
+
+import hashlib
+import io
+import time
+import uuid
+import zipfile
+import zlib
+from typing import Iterable, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+from .build_manifest import hash_file
+from .config import Config
+from .tracing import traced
+
+
+# Lossy formats the embedded images can be recompressed to
+IMAGE_FORMATS = ['jpeg', 'webp']
+
+_MEDIA_TYPES = {
+    'PNG': ('image/png', 'png'),
+    'JPEG': ('image/jpeg', 'jpg'),
+    'WEBP': ('image/webp', 'webp'),
+    'GIF': ('image/gif', 'gif'),
+}
+
+
+def _check_image_format(image_format: Optional[str]) -> Optional[str]:
+    """Validate a recompression format (None keeps the images as they are)"""
+    if image_format is not None:
+        image_format = image_format.lower()
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format} (use one of {IMAGE_FORMATS})")
+    return image_format
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """Convert an image to RGB or grayscale, dropping transparency"""
+    if image.mode in ('RGB', 'L'):
+        return image
+    return image.convert('RGB')
+
+
+def _recompress(image: Image.Image, image_format: str, quality: int) -> bytes:
+    """Encode an image as JPEG or WebP"""
+    buffer = io.BytesIO()
+    if image_format == 'webp':
+        image.save(buffer, 'WEBP', quality=quality, method=4)
+    else:
+        _flatten(image).save(buffer, 'JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _pdf_string(text: str) -> bytes:
+    """Encode a PDF text string (UTF-16 for non-ASCII text)"""
+    if all(32 <= ord(char) < 127 for char in text):
+        escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        return b'(' + escaped.encode('ascii') + b')'
+    return b'<FEFF' + text.encode('utf-16-be').hex().upper().encode('ascii') + b'>'
+
+
+class PdfWriter:
+    """Write a PDF with one full-page image per page, streaming to disk"""
+
+    def __init__(
+        self,
+        path: str,
+        title: Optional[str] = None,
+        author: Optional[str] = None,
+        dpi: Optional[int] = None,
+        image_format: Optional[str] = None,
+        quality: Optional[int] = None
+    ):
+        """
+        Open the output file and write the PDF header
+
+        Args:
+            path: Output PDF path
+            title: Document title stored in the PDF metadata
+            author: Document author stored in the PDF metadata
+            dpi: Pixels per inch used to size the pages (uses Config.PACKAGE_DPI)
+            image_format: 'jpeg' to embed recompressed JPEGs (WebP is not
+                supported by PDF and is embedded as JPEG too); None keeps PNG
+                pages lossless (uses Config.PACKAGE_IMAGE_FORMAT)
+            quality: JPEG quality (uses Config.PACKAGE_IMAGE_QUALITY)
+        """
+        self.path = path
+        self.title = title
+        self.author = author
+        self.dpi = dpi or Config.PACKAGE_DPI
+        self.image_format = _check_image_format(
+            image_format if image_format is not None else Config.PACKAGE_IMAGE_FORMAT
+        )
+        self.quality = quality or Config.PACKAGE_IMAGE_QUALITY
+        self.pages = 0
+
+        self._file = open(path, 'wb')
+        self._offsets = {}  # object number -> byte offset
+        self._next_object = 3  # 1 is the catalog and 2 the page tree
+        self._page_objects: List[int] = []
+        self._images = {}  # file hash -> (object number, width, height)
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def _allocate(self) -> int:
+        number = self._next_object
+        self._next_object += 1
+        return number
+
+    def _write_object(self, number: int, entries: bytes, stream: Optional[bytes] = None):
+        """Write a dictionary object (with an optional stream) at the end of the file"""
+        self._offsets[number] = self._file.tell()
+        self._file.write(b'%d 0 obj\n' % number)
+        if stream is None:
+            self._file.write(b'<< ' + entries + b' >>\nendobj\n')
+        else:
+            self._file.write(b'<< ' + entries + b' /Length %d >>\nstream\n' % len(stream))
+            self._file.write(stream)
+            self._file.write(b'\nendstream\nendobj\n')
+
+    def _encode_image(self, path: str) -> Tuple[bytes, bytes, int, int]:
+        """Return the stream, extra dictionary entries and size of an image"""
+        with Image.open(path) as image:
+            width, height = image.size
+            if self.image_format is None and image.format == 'JPEG' and image.mode in ('RGB', 'L'):
+                # JPEG files are embedded as they are
+                with open(path, 'rb') as f:
+                    data = f.read()
+                color_space = b'/DeviceGray' if image.mode == 'L' else b'/DeviceRGB'
+                return data, b'/Filter /DCTDecode /ColorSpace ' + color_space, width, height
+
+            image = _flatten(image)
+            color_space = b'/DeviceGray' if image.mode == 'L' else b'/DeviceRGB'
+            if self.image_format is not None:
+                data = _recompress(image, 'jpeg', self.quality)
+                return data, b'/Filter /DCTDecode /ColorSpace ' + color_space, width, height
+
+            data = zlib.compress(image.tobytes(), 6)
+            return data, b'/Filter /FlateDecode /ColorSpace ' + color_space, width, height
+
+    def _add_image(self, path: str) -> Tuple[int, int, int]:
+        """Embed an image once and return its object number and size"""
+        key = hash_file(path)
+        if key not in self._images:
+            data, entries, width, height = self._encode_image(path)
+            number = self._allocate()
+            self._write_object(
+                number,
+                b'/Type /XObject /Subtype /Image /Width %d /Height %d /BitsPerComponent 8 %s'
+                % (width, height, entries),
+                data
+            )
+            self._images[key] = (number, width, height)
+        return self._images[key]
+
+    def add_page(self, image_path: str):
+        """
+        Append a page showing an image
+
+        Args:
+            image_path: Image filling the page (the page size follows the
+                image size and the DPI)
+        """
+        image_number, width, height = self._add_image(image_path)
+        page_width = width * 72.0 / self.dpi
+        page_height = height * 72.0 / self.dpi
+
+        content_number = self._allocate()
+        self._write_object(
+            content_number,
+            b'',
+            b'q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q' % (page_width, page_height)
+        )
+
+        page_number = self._allocate()
+        self._write_object(
+            page_number,
+            b'/Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+            b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R'
+            % (page_width, page_height, image_number, content_number)
+        )
+        self._page_objects.append(page_number)
+        self.pages += 1
+
+    def close(self):
+        """Write the page tree, metadata and cross-reference table"""
+        if self._file.closed:
+            return
+
+        kids = b' '.join(b'%d 0 R' % number for number in self._page_objects)
+        self._write_object(2, b'/Type /Pages /Kids [%s] /Count %d' % (kids, len(self._page_objects)))
+        self._write_object(1, b'/Type /Catalog /Pages 2 0 R')
+
+        info = [b'/Producer ' + _pdf_string('Ternarius Atlas')]
+        if self.title:
+            info.append(b'/Title ' + _pdf_string(self.title))
+        if self.author:
+            info.append(b'/Author ' + _pdf_string(self.author))
+        info_number = self._allocate()
+        self._write_object(info_number, b' '.join(info))
+
+        xref_offset = self._file.tell()
+        self._file.write(b'xref\n0 %d\n0000000000 65535 f \n' % self._next_object)
+        for number in range(1, self._next_object):
+            self._file.write(b'%010d 00000 n \n' % self._offsets[number])
+        self._file.write(
+            b'trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (self._next_object, info_number, xref_offset)
+        )
+        self._file.close()
+
+
+_CONTAINER_XML = """<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+_STYLESHEET = """body { margin: 0; padding: 0 1em; font-family: serif; line-height: 1.5; }
+section { text-align: center; }
+img { max-width: 100%; max-height: 70vh; }
+h1 { font-size: 1.4em; margin: 0.8em 0 0.4em; }
+p { text-align: left; text-indent: 1.2em; margin: 0 0 0.6em; }
+"""
+
+
+class EpubWriter:
+    """Write an EPUB 3 book with XHTML text and image assets, streaming to disk"""
+
+    def __init__(
+        self,
+        path: str,
+        title: str,
+        author: Optional[str] = None,
+        language: Optional[str] = None,
+        image_format: Optional[str] = None,
+        quality: Optional[int] = None
+    ):
+        """
+        Open the output archive and write the fixed EPUB files
+
+        Args:
+            path: Output EPUB path
+            title: Book title
+            author: Book author
+            language: Book language (uses Config.EPUB_LANGUAGE)
+            image_format: 'jpeg' or 'webp' to recompress the images; None
+                keeps them as they are (uses Config.PACKAGE_IMAGE_FORMAT)
+            quality: Recompression quality (uses Config.PACKAGE_IMAGE_QUALITY)
+        """
+        self.path = path
+        self.title = title
+        self.author = author
+        self.language = language or Config.EPUB_LANGUAGE
+        self.image_format = _check_image_format(
+            image_format if image_format is not None else Config.PACKAGE_IMAGE_FORMAT
+        )
+        self.quality = quality or Config.PACKAGE_IMAGE_QUALITY
+        self.pages = 0
+
+        self._items = []  # (id, href, media type, properties)
+        self._toc = []  # (href, title)
+        self._images = {}  # file hash -> href
+        self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        # The mimetype must be the first entry, uncompressed
+        self._zip.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        self._zip.writestr('META-INF/container.xml', _CONTAINER_XML)
+        self._zip.writestr('OEBPS/style.css', _STYLESHEET)
+        self._items.append(('style', 'style.css', 'text/css', ''))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def _add_image(self, path: str, cover: bool) -> str:
+        """Store an image once and return its href inside OEBPS"""
+        key = hash_file(path)
+        if key in self._images:
+            return self._images[key]
+
+        with Image.open(path) as image:
+            if self.image_format is not None:
+                data = _recompress(image, self.image_format, self.quality)
+                media_type, extension = _MEDIA_TYPES['WEBP' if self.image_format == 'webp' else 'JPEG']
+            else:
+                data = None
+                media_type, extension = _MEDIA_TYPES.get(image.format, _MEDIA_TYPES['PNG'])
+                if image.format not in _MEDIA_TYPES:
+                    data = io.BytesIO()
+                    image.save(data, 'PNG')
+                    data = data.getvalue()
+
+        href = f"images/{key[:16]}.{extension}"
+        if data is None:
+            # Already compressed, so stored as is and copied from disk in blocks
+            self._zip.write(path, f"OEBPS/{href}", compress_type=zipfile.ZIP_STORED)
+        else:
+            self._zip.writestr(f"OEBPS/{href}", data, compress_type=zipfile.ZIP_STORED)
+        self._items.append((f"img-{key[:16]}", href, media_type, 'cover-image' if cover else ''))
+        self._images[key] = href
+        return href
+
+    def add_page(self, image_path: Optional[str] = None, title: str = '', text: str = '', cover: bool = False):
+        """
+        Append a page with an optional illustration, heading and text
+
+        Args:
+            image_path: Illustration of the page
+            title: Page heading (also used in the table of contents)
+            text: Page text; blank lines separate paragraphs
+            cover: Whether the illustration is the book cover
+        """
+        self.pages += 1
+        href = f"page_{self.pages:03d}.xhtml"
+
+        body = []
+        if image_path:
+            image_href = self._add_image(image_path, cover)
+            alt = escape(title or self.title, {'"': '&quot;'})
+            body.append(f'<img src="{image_href}" alt="{alt}"/>')
+        if title:
+            body.append(f"<h1>{escape(title)}</h1>")
+        for paragraph in (text or '').split('\n\n'):
+            paragraph = ' '.join(paragraph.split())
+            if paragraph:
+                body.append(f"<p>{escape(paragraph)}</p>")
+
+        self._zip.writestr(f"OEBPS/{href}", self._xhtml(title or self.title, '\n'.join(body)))
+        self._items.append((f"page-{self.pages:03d}", href, 'application/xhtml+xml', ''))
+        if title:
+            self._toc.append((href, title))
+
+    def _xhtml(self, title: str, body: str) -> str:
+        """Wrap a page body in an XHTML document"""
+        return f"""<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="{self.language}" lang="{self.language}">
+<head>
+<meta charset="utf-8"/>
+<title>{escape(title)}</title>
+<link rel="stylesheet" type="text/css" href="style.css"/>
+</head>
+<body>
+<section>
+{body}
+</section>
+</body>
+</html>
+"""
+
+    def close(self):
+        """Write the navigation document and the package document"""
+        if self._zip.fp is None:
+            return
+
+        if not self._toc and self.pages:
+            self._toc.append(("page_001.xhtml", self.title))
+        links = '\n'.join(f'<li><a href="{href}">{escape(title)}</a></li>' for href, title in self._toc)
+        nav = self._xhtml(self.title, f'<nav epub:type="toc" id="toc">\n<h1>{escape(self.title)}</h1>\n<ol>\n{links}\n</ol>\n</nav>')
+        self._zip.writestr('OEBPS/nav.xhtml', nav)
+
+        manifest = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+        for item_id, href, media_type, properties in self._items:
+            extra = f' properties="{properties}"' if properties else ''
+            manifest.append(f'<item id="{item_id}" href="{href}" media-type="{media_type}"{extra}/>')
+        spine = '\n    '.join(
+            f'<itemref idref="{item_id}"/>' for item_id, _, media_type, _ in self._items
+            if media_type == 'application/xhtml+xml'
+        )
+
+        identifier = uuid.UUID(hashlib.sha256(f"{self.title}\n{self.author}".encode('utf-8')).hexdigest()[:32])
+        creator = f"\n    <dc:creator>{escape(self.author)}</dc:creator>" if self.author else ''
+        modified = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        manifest_items = '\n    '.join(manifest)
+        opf = f"""<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id" xml:lang="{self.language}">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="book-id">urn:uuid:{identifier}</dc:identifier>
+    <dc:title>{escape(self.title)}</dc:title>{creator}
+    <dc:language>{self.language}</dc:language>
+    <meta property="dcterms:modified">{modified}</meta>
+  </metadata>
+  <manifest>
+    {manifest_items}
+  </manifest>
+  <spine>
+    {spine}
+  </spine>
+</package>
+"""
+        self._zip.writestr('OEBPS/content.opf', opf)
+        self._zip.close()
+
+
+@traced('package.pdf')
+def write_pdf(
+    image_paths: Iterable[str],
+    output_path: str,
+    title: Optional[str] = None,
+    author: Optional[str] = None,
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None
+) -> str:
+    """
+    Package page images into a PDF, one page per image
+
+    Args:
+        image_paths: Final page images, in order (any iterable, consumed lazily)
+        output_path: Output PDF path
+        title: Document title
+        author: Document author
+        image_format: Recompression format (see PdfWriter)
+        quality: Recompression quality
+
+    Returns:
+        Path of the PDF
+    """
+    with PdfWriter(output_path, title, author, image_format=image_format, quality=quality) as pdf:
+        for path in image_paths:
+            pdf.add_page(path)
+    return output_path
+
+
+@traced('package.epub')
+def write_epub(
+    pages: Iterable[dict],
+    output_path: str,
+    title: str,
+    author: Optional[str] = None,
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None
+) -> str:
+    """
+    Package pages into an EPUB with XHTML text and image assets
+
+    Args:
+        pages: Page dictionaries with 'image_path', 'title', 'text' and 'type'
+            (any iterable, consumed lazily)
+        output_path: Output EPUB path
+        title: Book title
+        author: Book author
+        image_format: Recompression format (see EpubWriter)
+        quality: Recompression quality
+
+    Returns:
+        Path of the EPUB
+    """
+    with EpubWriter(output_path, title, author, image_format=image_format, quality=quality) as epub:
+        for page in pages:
+            epub.add_page(
+                page.get('image_path'),
+                title=page.get('title') or '',
+                text=page.get('text') or '',
+                cover=page.get('type') == 'cover'
+            )
+    return output_path
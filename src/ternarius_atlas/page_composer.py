@@ -2,9 +2,41 @@
 Page composer module to combine text and images into e-book pages
 """
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from typing import Optional, Tuple
 from .config import Config
+from .fonts import describe_font, get_font
+from .text_layout import wrap_text
+
+
+def blend_rectangle(
+    image: Image.Image,
+    box: Tuple[int, int, int, int],
+    color: Tuple[int, int, int],
+    alpha: int
+) -> Image.Image:
+    """
+    Tint a rectangle of an image with a semi-transparent color, in place
+    
+    Only the pixels inside the box are touched, with the same result as
+    alpha-compositing a full-size RGBA overlay holding the rectangle.
+    
+    Args:
+        image: RGB image to draw on
+        box: (left, top, right, bottom) of the rectangle, right/bottom exclusive
+        color: RGB fill color
+        alpha: Fill opacity (0-255)
+        
+    Returns:
+        The same image, for chaining
+    """
+    left, top, right, bottom = box
+    left, top = max(left, 0), max(top, 0)
+    right, bottom = min(right, image.width), min(bottom, image.height)
+    if right > left and bottom > top:
+        mask = Image.new('L', (right - left, bottom - top), alpha)
+        image.paste(color, (left, top, right, bottom), mask)
+    return image
 
 
 class PageComposer:
@@ -18,6 +50,27 @@ class PageComposer:
             config: Configuration object (uses default if not provided)
         """
         self.config = config or Config()
+        
+        # Fonts are shared process-wide, so composing a page never loads one
+        self.font = get_font(self.config.DEFAULT_FONT_SIZE)
+        self.title_font = get_font(self.config.DEFAULT_TITLE_FONT_SIZE, 'bold')
+    
+    def layout_fingerprint(self) -> dict:
+        """
+        Describe the layout settings and fonts that affect composed pages
+        
+        Returns:
+            Dictionary used to detect when pages must be re-rendered
+        """
+        return {
+            'font_size': self.config.DEFAULT_FONT_SIZE,
+            'title_font_size': self.config.DEFAULT_TITLE_FONT_SIZE,
+            'text_color': self.config.DEFAULT_TEXT_COLOR,
+            'background_color': self.config.DEFAULT_BACKGROUND_COLOR,
+            'padding': self.config.DEFAULT_PADDING,
+            'line_spacing': self.config.DEFAULT_LINE_SPACING,
+            'fonts': [describe_font(self.font), describe_font(self.title_font)],
+        }
     
     def create_page(
         self,
@@ -50,12 +103,8 @@ class PageComposer:
         page = Image.new('RGB', (width, height), self.config.DEFAULT_BACKGROUND_COLOR)
         draw = ImageDraw.Draw(page)
         
-        try:
-            font = ImageFont.load_default()
-            title_font = ImageFont.load_default()
-        except (OSError, IOError, ImportError):
-            font = None
-            title_font = None
+        font = self.font
+        title_font = self.title_font
         
         current_y = padding
         
@@ -136,12 +185,8 @@ class PageComposer:
         page = Image.new('RGB', (width, height), self.config.DEFAULT_BACKGROUND_COLOR)
         draw = ImageDraw.Draw(page)
         
-        try:
-            title_font = ImageFont.load_default()
-            author_font = ImageFont.load_default()
-        except (OSError, IOError, ImportError):
-            title_font = None
-            author_font = None
+        title_font = self.title_font
+        author_font = self.font
         
         # Draw decorative elements
         for i in range(3):
@@ -187,26 +232,7 @@ class PageComposer:
         Returns:
             List of text lines
         """
-        words = text.split()
-        lines = []
-        current_line = []
-        
-        for word in words:
-            test_line = ' '.join(current_line + [word])
-            bbox = draw.textbbox((0, 0), test_line, font=font)
-            line_width = bbox[2] - bbox[0]
-            
-            if line_width <= max_width:
-                current_line.append(word)
-            else:
-                if current_line:
-                    lines.append(' '.join(current_line))
-                current_line = [word]
-        
-        if current_line:
-            lines.append(' '.join(current_line))
-        
-        return lines
+        return wrap_text(text, max_width, font)
     
     def _get_line_height(self, draw: ImageDraw, font) -> int:
         """
@@ -246,6 +272,18 @@ class PageComposer:
         
         return image.resize((new_width, new_height), resample)
     
+    def _rgb_copy(self, image: Image.Image) -> Image.Image:
+        """
+        Copy an image as RGB, converting only when it isn't RGB already
+        
+        Args:
+            image: Source image
+            
+        Returns:
+            RGB copy of the image
+        """
+        return image.copy() if image.mode == 'RGB' else image.convert('RGB')
+    
     def add_text_to_cover(self, background_image: Image.Image, title: str) -> Image.Image:
         """
         Add title text to a cover image
@@ -258,32 +296,21 @@ class PageComposer:
             Image with text overlay
         """
         # Create a copy to avoid modifying original
-        result = background_image.copy()
-        draw = ImageDraw.Draw(result)
-        
+        result = self._rgb_copy(background_image)
         width, height = result.size
         
-        try:
-            # Try to use a larger font for title
-            title_font = ImageFont.load_default()
-        except:
-            title_font = None
-        
-        # Add semi-transparent overlay for text readability
-        overlay = Image.new('RGBA', result.size, (0, 0, 0, 0))
-        overlay_draw = ImageDraw.Draw(overlay)
+        title_font = self.title_font
         
-        # Draw semi-transparent rectangle
+        # Semi-transparent rectangle for text readability (only that region is blended)
         padding = 50
         rect_y = int(height * 0.3)
         rect_height = int(height * 0.4)
-        overlay_draw.rectangle(
-            [(padding, rect_y), (width - padding, rect_y + rect_height)],
-            fill=(255, 255, 255, 200)
+        blend_rectangle(
+            result,
+            (padding, rect_y, width - padding + 1, rect_y + rect_height + 1),
+            (255, 255, 255),
+            200
         )
-        
-        # Composite overlay
-        result = Image.alpha_composite(result.convert('RGBA'), overlay).convert('RGB')
         draw = ImageDraw.Draw(result)
         
         # Draw title text
@@ -322,31 +349,18 @@ class PageComposer:
             Image with text overlay
         """
         # Create a copy
-        result = background_image.copy()
+        result = self._rgb_copy(background_image)
         width, height = result.size
         
-        try:
-            font = ImageFont.load_default()
-        except:
-            font = None
-        
-        # Create semi-transparent text area at bottom
-        overlay = Image.new('RGBA', result.size, (0, 0, 0, 0))
-        overlay_draw = ImageDraw.Draw(overlay)
+        font = self.font
         
         # Calculate text area size
         padding = 30
         text_area_height = int(height * 0.35)  # Use bottom 35% for text
         text_area_y = height - text_area_height
         
-        # Draw semi-transparent background for text
-        overlay_draw.rectangle(
-            [(0, text_area_y), (width, height)],
-            fill=(255, 255, 255, 220)
-        )
-        
-        # Composite overlay
-        result = Image.alpha_composite(result.convert('RGBA'), overlay).convert('RGB')
+        # Semi-transparent background for text (only that region is blended)
+        blend_rectangle(result, (0, text_area_y, width, height), (255, 255, 255), 220)
         draw = ImageDraw.Draw(result)
         
         # Wrap and draw text
@@ -0,0 +1,134 @@
+"""
+Cache of text-encoder outputs for Stable Diffusion prompts
+
+Every image of a book is generated with the same negative prompt, and pages
+are often regenerated with the same prompt (a rejected image, a draft
+followed by the final render). CachedPromptPipeline wraps a diffusers
+pipeline, encodes prompt and negative prompt through a small LRU keyed by
+their token ids and passes prompt_embeds / negative_prompt_embeds to the
+pipeline, so a repeated text costs no CLIP forward pass.
+
+Only whole prompts are cached: CLIP attends over the full sequence, so the
+embedding of a shared style suffix depends on the words before it and can't
+be reused on its own.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from .config import Config
+from .tracing import span
+
+
+class PromptEmbeddingCache:
+    """LRU of text-encoder outputs keyed by token ids"""
+
+    def __init__(self, tokenizer, encode: Callable[[Tuple[int, ...]], object], max_entries: Optional[int] = None):
+        """
+        Initialize an empty cache
+
+        Args:
+            tokenizer: CLIP tokenizer of the pipeline
+            encode: Function turning token ids into the text encoder's output
+            max_entries: Embeddings kept (uses Config.PROMPT_EMBED_CACHE_SIZE)
+        """
+        self.tokenizer = tokenizer
+        self.encode = encode
+        self.max_entries = max_entries or Config.PROMPT_EMBED_CACHE_SIZE
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def token_ids(self, text: str) -> Tuple[int, ...]:
+        """Token ids the text encoder sees (padded and truncated like diffusers does)"""
+        tokens = self.tokenizer(
+            text,
+            padding='max_length',
+            max_length=self.tokenizer.model_max_length,
+            truncation=True
+        )
+        return tuple(tokens['input_ids'])
+
+    def get(self, text: str):
+        """
+        Embedding of a text, encoding it only on a miss
+
+        Args:
+            text: Prompt or negative prompt
+
+        Returns:
+            Text encoder output for the text
+        """
+        key = self.token_ids(text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            self.misses += 1
+
+        with span('text_encoder.encode'):
+            embedding = self.encode(key)
+
+        with self._lock:
+            self._entries[key] = embedding
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return embedding
+
+    def get_many(self, texts: Sequence[str]) -> List[object]:
+        """Embeddings of several texts, in order"""
+        return [self.get(text) for text in texts]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedPromptPipeline:
+    """Diffusers pipeline wrapper that reuses prompt embeddings"""
+
+    def __init__(self, pipe, max_entries: Optional[int] = None):
+        """
+        Wrap a pipeline
+
+        Args:
+            pipe: Diffusers text-to-image pipeline (or a wrapper of one)
+            max_entries: Embeddings kept (uses Config.PROMPT_EMBED_CACHE_SIZE)
+        """
+        self.pipe = pipe
+        self.cache = PromptEmbeddingCache(pipe.tokenizer, self._encode, max_entries)
+
+    def __getattr__(self, name):
+        # Scheduler, device, unet... come from the wrapped pipeline
+        return getattr(self.pipe, name)
+
+    def _encode(self, token_ids: Tuple[int, ...]):
+        """Run the text encoder on one sequence of token ids"""
+        import torch
+
+        text_encoder = self.pipe.text_encoder
+        input_ids = torch.tensor([token_ids], device=text_encoder.device)
+        with torch.no_grad():
+            return text_encoder(input_ids)[0]
+
+    def _embeds(self, texts: Union[str, List[str]], batch_size: int):
+        """Concatenated embeddings of a prompt or a list of prompts"""
+        import torch
+
+        if isinstance(texts, str):
+            texts = [texts] * batch_size
+        return torch.cat(self.cache.get_many(texts))
+
+    def __call__(self, prompt: Union[str, List[str]] = None, negative_prompt: Union[str, List[str]] = None, **kwargs):
+        """Run the pipeline (same arguments and result as the wrapped one)"""
+        if prompt is None or 'prompt_embeds' in kwargs:
+            return self.pipe(prompt=prompt, negative_prompt=negative_prompt, **kwargs)
+
+        batch_size = 1 if isinstance(prompt, str) else len(prompt)
+        kwargs['prompt_embeds'] = self._embeds(prompt, batch_size)
+        # Without classifier-free guidance the negative prompt is never used
+        if kwargs.get('guidance_scale', 7.5) > 1:
+            kwargs['negative_prompt_embeds'] = self._embeds(negative_prompt or "", batch_size)
+        return self.pipe(**kwargs)
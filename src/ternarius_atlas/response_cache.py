@@ -0,0 +1,188 @@
+"""
+Persistent on-disk cache for LLM responses
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of model responses stored in SQLite
+
+    Entries are keyed by a hash of (model, prompt, generation params), expire
+    after a TTL and are evicted least-recently-used first once the total size
+    exceeds the configured limit.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        read_only: bool = False
+    ):
+        """
+        Initialize the response cache
+
+        Args:
+            path: Path to the SQLite database file
+            ttl: Time to live of an entry in seconds (None = never expires)
+            max_bytes: Maximum total size of cached responses (None = unlimited)
+            read_only: Serve cached responses without ever writing, evicting or
+                expiring entries (for reproducible rebuilds)
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, params: Optional[dict] = None) -> str:
+        """
+        Build the cache key for a request
+
+        Args:
+            model: Model name
+            prompt: Prompt sent to the model
+            params: Generation parameters (temperature, config, ...)
+
+        Returns:
+            Hex digest identifying the request
+        """
+        payload = json.dumps(
+            {'model': model, 'prompt': prompt, 'params': params or {}},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            Cached response text, or None on a miss
+        """
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            response, created_at = row
+            if self.read_only:
+                return response
+
+            now = time.time()
+            if self.ttl is not None and now - created_at > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                return None
+
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return response
+
+    def set(self, key: str, response: str):
+        """
+        Store a response in the cache
+
+        Args:
+            key: Cache key from make_key()
+            response: Response text to store
+        """
+        if self.read_only:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode('utf-8')), now, now)
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def clear(self):
+        """Remove every cached response"""
+        if self.read_only:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the database on first use (None if read-only and missing)"""
+        if self._conn is not None:
+            return self._conn
+
+        if self.read_only:
+            if not os.path.exists(self.path):
+                return None
+            uri = "file:" + os.path.abspath(self.path) + "?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            return self._conn
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access)")
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop expired entries and the least recently used ones over the size limit"""
+        if self.ttl is not None:
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+
+        if self.max_bytes is None:
+            return
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
@@ -0,0 +1,166 @@
+"""
+Render profiles: scheduler, step count and guidance scale chosen together
+
+    draft     few steps, for reviewing pages in seconds (LCM-LoRA when its
+              weights are available locally, DPM++ 2M Karras otherwise)
+    standard  balanced quality and speed
+    final     full quality, for approved pages
+
+A book selects its profile with "render_profile" at the top of
+structure.json and a page can override it with its own "render_profile".
+diffusers is only imported when a profile is applied to a pipeline.
+"""
+
+import os
+import threading
+from typing import Optional
+
+from .config import Config
+
+
+# Scheduler class (from diffusers), its options, steps and guidance scale
+RENDER_PROFILES = {
+    'draft': {
+        'scheduler': 'DPMSolverMultistepScheduler',
+        'options': {'use_karras_sigmas': True},
+        'num_inference_steps': 10,
+        'guidance_scale': 5.0,
+    },
+    'standard': {
+        'scheduler': 'DPMSolverMultistepScheduler',
+        'options': {},
+        'num_inference_steps': 20,
+        'guidance_scale': 7.0,
+    },
+    'final': {
+        'scheduler': 'DPMSolverMultistepScheduler',
+        'options': {'use_karras_sigmas': True},
+        'num_inference_steps': 30,
+        'guidance_scale': 7.5,
+    },
+}
+
+# Draft settings when the LCM-LoRA is loaded (LCM needs little or no guidance)
+LCM_DRAFT_PROFILE = {
+    'scheduler': 'LCMScheduler',
+    'options': {},
+    'num_inference_steps': 4,
+    'guidance_scale': 1.0,
+}
+
+
+def get_render_profile(name: Optional[str] = None) -> dict:
+    """
+    Look up a render profile
+
+    Args:
+        name: Profile name (uses Config.RENDER_PROFILE if not provided)
+
+    Returns:
+        Profile settings
+
+    Raises:
+        ValueError: If the profile doesn't exist
+    """
+    name = name or Config.RENDER_PROFILE
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"Perfil de renderização desconhecido: {name} (use {', '.join(RENDER_PROFILES)})")
+    return RENDER_PROFILES[name]
+
+
+def page_render_profile(page: dict, structure: Optional[dict] = None, override: Optional[str] = None) -> str:
+    """
+    Profile a page is rendered with
+
+    Args:
+        page: Page entry from structure.json
+        structure: Book structure (its "render_profile" applies to every page)
+        override: Profile used instead of the book's (e.g. drafts for review);
+            a page's own "render_profile" still wins
+
+    Returns:
+        Profile name
+    """
+    return (
+        page.get('render_profile')
+        or override
+        or (structure or {}).get('render_profile')
+        or Config.RENDER_PROFILE
+    )
+
+
+def unwrap_pipeline(pipe):
+    """The diffusers pipeline inside wrappers that keep it in .pipe"""
+    while 'pipe' in vars(pipe):
+        pipe = vars(pipe)['pipe']
+    return pipe
+
+
+class SchedulerProfiles:
+    """Switch a pipeline between render profiles"""
+
+    def __init__(self, pipe, lcm_lora_path: Optional[str] = None):
+        """
+        Args:
+            pipe: Diffusers pipeline (or a wrapper of one)
+            lcm_lora_path: Local LCM-LoRA weights for the draft profile (uses
+                Config.LCM_LORA_PATH; ignored if the path doesn't exist)
+        """
+        self.pipe = unwrap_pipeline(pipe)
+        self.lcm_lora_path = lcm_lora_path or Config.LCM_LORA_PATH
+        self._base_config = self.pipe.scheduler.config
+        self._schedulers = {}
+        self._lcm_loaded = False
+        self._lcm_failed = False
+        self._lock = threading.Lock()
+
+    def _scheduler(self, settings: dict):
+        """Scheduler instance of a profile (created once)"""
+        key = (settings['scheduler'], tuple(sorted(settings['options'].items())))
+        if key not in self._schedulers:
+            import diffusers
+            scheduler_class = getattr(diffusers, settings['scheduler'])
+            self._schedulers[key] = scheduler_class.from_config(self._base_config, **settings['options'])
+        return self._schedulers[key]
+
+    def _load_lcm(self) -> bool:
+        """Load the LCM-LoRA once; False if it isn't available"""
+        if self._lcm_loaded:
+            return True
+        if self._lcm_failed or not self.lcm_lora_path or not os.path.exists(self.lcm_lora_path):
+            return False
+        try:
+            # The LCM-LoRA only changes the UNet, so cached prompt embeddings stay valid
+            self.pipe.load_lora_weights(self.lcm_lora_path, adapter_name='lcm')
+            self._lcm_loaded = True
+        except Exception as e:
+            print(f"⚠️  LCM-LoRA não carregada ({e}); rascunhos usarão DPM++")
+            self._lcm_failed = True
+        return self._lcm_loaded
+
+    def apply(self, name: Optional[str] = None) -> dict:
+        """
+        Set the profile's scheduler on the pipeline
+
+        Args:
+            name: Profile name (uses Config.RENDER_PROFILE if not provided)
+
+        Returns:
+            Pipeline arguments of the profile (num_inference_steps, guidance_scale)
+        """
+        name = name or Config.RENDER_PROFILE
+        settings = get_render_profile(name)
+        with self._lock:
+            use_lcm = name == 'draft' and self._load_lcm()
+            if use_lcm:
+                settings = LCM_DRAFT_PROFILE
+            if self._lcm_loaded:
+                if use_lcm:
+                    self.pipe.enable_lora()
+                else:
+                    self.pipe.disable_lora()
+            self.pipe.scheduler = self._scheduler(settings)
+        return {
+            'num_inference_steps': settings['num_inference_steps'],
+            'guidance_scale': settings['guidance_scale'],
+        }
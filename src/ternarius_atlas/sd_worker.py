@@ -0,0 +1,503 @@
+"""
+Long-lived image generation worker that keeps one diffusion pipeline loaded
+
+The worker loads the pipeline once and serves generation jobs over an
+authenticated local connection (multiprocessing.connection), so every script
+and re-generation request reuses the warm model instead of paying the
+from_pretrained() cost again.
+
+Requests are unpickled, so the auth key must stay private: a random key is
+created on first start in Config.SD_WORKER_AUTHKEY_FILE, readable only by
+its owner (TERNARIUS_SD_WORKER_AUTHKEY overrides it).
+
+Run it with:
+    python -m ternarius_atlas.sd_worker --factory generate_images_sd:load_pipeline
+"""
+
+import argparse
+import importlib
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Callable, Optional, Tuple
+from PIL import Image
+
+from .config import Config
+from .schedulers import SchedulerProfiles
+from .tracing import StepTimer, Tracer, span, tracer
+
+
+# Project root (holds generate_images_sd.py, the default pipeline factory)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_authkey(path: str = None) -> bytes:
+    """
+    Shared secret of the worker and its clients
+
+    Args:
+        path: Key file (uses Config.SD_WORKER_AUTHKEY_FILE); created with a
+            random key and mode 0600 if it doesn't exist
+
+    Returns:
+        Config.SD_WORKER_AUTHKEY if set, otherwise the key in the file
+    """
+    if Config.SD_WORKER_AUTHKEY:
+        return Config.SD_WORKER_AUTHKEY
+
+    path = path or Config.SD_WORKER_AUTHKEY_FILE
+    os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+    if not os.path.exists(path):
+        # The key is written to a private temporary file and linked into
+        # place: link() fails if the path exists, so when two processes start
+        # at once only one complete key is published and the other reads it
+        key = secrets.token_hex(32).encode()
+        temp_path = f"{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(key)
+            os.link(temp_path, path)
+            return key
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+
+    if os.name != 'nt' and os.stat(path).st_mode & 0o077:
+        os.chmod(path, 0o600)
+    with open(path, 'rb') as f:
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f"Chave do worker vazia em {path}; apague o arquivo para gerar outra")
+    return key
+
+
+def load_factory(spec: str) -> Callable[[], object]:
+    """
+    Resolve a pipeline factory from a "module:function" string
+
+    Args:
+        spec: Import path of a function that returns a loaded pipeline
+
+    Returns:
+        The factory function
+    """
+    module_name, _, function_name = spec.partition(':')
+    if not function_name:
+        raise ValueError(f"Factory inválida (use 'modulo:funcao'): {spec}")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class SDWorker:
+    """Serve image generation jobs from a single resident pipeline"""
+
+    def __init__(
+        self,
+        pipeline_factory: Callable[[], object],
+        address: Tuple[str, int] = None,
+        authkey: bytes = None,
+        idle_timeout: Optional[float] = None
+    ):
+        """
+        Initialize the worker
+
+        Args:
+            pipeline_factory: Callable returning a loaded diffusers-style pipeline
+            address: (host, port) to listen on (port 0 picks a free port)
+            authkey: Shared secret required from clients (uses load_authkey())
+            idle_timeout: Exit after this many seconds without jobs (None = never)
+        """
+        self.pipeline_factory = pipeline_factory
+        self.address = address or Config.SD_WORKER_ADDRESS
+        self.authkey = authkey or load_authkey()
+        self.idle_timeout = idle_timeout
+        self.pipe = None
+        self.load_error = None
+        self.jobs_done = 0
+        self._ready = threading.Event()
+        self._listening = threading.Event()
+        self._pipe_lock = threading.Lock()
+        self._profiles = None
+        self._running = False
+        self._last_job = time.monotonic()
+
+    def serve_forever(self):
+        """Start listening, load the pipeline in the background and serve jobs"""
+        listener = Listener(self.address, authkey=self.authkey)
+        self.address = listener.address
+        self._running = True
+        self._listening.set()
+
+        threading.Thread(target=self._load_pipeline, daemon=True).start()
+        if self.idle_timeout:
+            threading.Thread(target=self._watch_idle, daemon=True).start()
+
+        try:
+            while self._running:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    # Failed handshakes (wrong authkey, dropped client) are ignored
+                    continue
+                if not self._running:
+                    conn.close()
+                    break
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def wait_until_listening(self, timeout: float = None) -> bool:
+        """Block until the worker accepts connections (for in-process use)"""
+        return self._listening.wait(timeout)
+
+    def shutdown(self):
+        """Stop accepting jobs and let serve_forever() return"""
+        if not self._running:
+            return
+        self._running = False
+        # Wake up the blocking accept()
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+
+    def handle(self, request: dict) -> dict:
+        """
+        Execute one request
+
+        Args:
+            request: Message with an 'op' key ('ping', 'generate' or 'shutdown')
+
+        Returns:
+            Response message
+        """
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'ready': self._ready.is_set(), 'error': self.load_error,
+                    'jobs_done': self.jobs_done}
+        if op == 'generate':
+            return self._generate(request)
+        if op == 'shutdown':
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {'ok': True}
+        return {'ok': False, 'error': f"Operação desconhecida: {op}"}
+
+    def _load_pipeline(self):
+        """Load the pipeline once; jobs wait until it is ready"""
+        try:
+            self.pipe = self.pipeline_factory()
+            if self.pipe is None:
+                self.load_error = "A factory não retornou um pipeline"
+        except Exception as e:
+            self.load_error = f"Erro ao carregar pipeline: {e}"
+        finally:
+            self._ready.set()
+
+    def _watch_idle(self):
+        """Shut the worker down after idle_timeout seconds without jobs"""
+        while self._running:
+            time.sleep(min(self.idle_timeout, 5))
+            if time.monotonic() - self._last_job > self.idle_timeout:
+                self.shutdown()
+
+    def _serve_connection(self, conn):
+        """Answer requests on a client connection until it closes"""
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    break
+                conn.send(self.handle(request))
+        finally:
+            conn.close()
+
+    def _generate(self, request: dict) -> dict:
+        """Run the pipeline for a generation request"""
+        self._ready.wait()
+        if self.load_error:
+            return {'ok': False, 'error': self.load_error}
+
+        kwargs = {
+            key: request[key]
+            for key in ('prompt', 'negative_prompt', 'width', 'height',
+                        'num_inference_steps', 'guidance_scale')
+            if request.get(key) is not None
+        }
+
+        # The client asked for the denoising steps to be traced
+        trace = Tracer(enabled=True) if request.get('trace') else None
+        if trace is not None:
+            steps = kwargs['callback_on_step_end'] = StepTimer(trace)
+
+        try:
+            # A single pipeline can't run two jobs at once
+            with self._pipe_lock:
+                self._last_job = time.monotonic()
+                if request.get('profile'):
+                    # Explicit steps/guidance in the request win over the profile's
+                    if self._profiles is None:
+                        self._profiles = SchedulerProfiles(self.pipe)
+                    for key, value in self._profiles.apply(request['profile']).items():
+                        kwargs.setdefault(key, value)
+                if request.get('seed') is not None:
+                    kwargs['generator'] = self._make_generator(request['seed'])
+
+                start_time = time.time()
+                if trace is not None:
+                    steps.start()
+                    with trace.span('diffusion.pipeline', steps=kwargs.get('num_inference_steps'),
+                                    profile=request.get('profile')):
+                        image = self.pipe(**kwargs).images[0].convert('RGB')
+                else:
+                    image = self.pipe(**kwargs).images[0].convert('RGB')
+                elapsed = time.time() - start_time
+                self.jobs_done += 1
+                self._last_job = time.monotonic()
+        except Exception as e:
+            return {'ok': False, 'error': f"Erro ao gerar imagem: {e}"}
+
+        # Raw pixels are cheaper than encoding a PNG just to decode it again
+        response = {'ok': True, 'size': image.size, 'data': image.tobytes(), 'elapsed': elapsed}
+        if trace is not None:
+            response['trace'] = trace.take_events()
+        return response
+
+    def _make_generator(self, seed: int):
+        """Create a seeded torch generator on the pipeline's device"""
+        import torch
+        device = str(getattr(self.pipe, 'device', 'cpu'))
+        return torch.Generator(device).manual_seed(seed)
+
+
+class SDWorkerClient:
+    """Client for a running SDWorker"""
+
+    supports_profiles = True  # generate_image accepts a render profile
+
+    def __init__(self, address: Tuple[str, int] = None, authkey: bytes = None):
+        """
+        Initialize the client
+
+        Args:
+            address: Worker (host, port)
+            authkey: Shared secret configured on the worker (uses load_authkey())
+        """
+        self.address = tuple(address or Config.SD_WORKER_ADDRESS)
+        self.authkey = authkey or load_authkey()
+
+    def _request(self, message: dict) -> dict:
+        """Send one request and wait for the response"""
+        conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send(message)
+            return conn.recv()
+        finally:
+            conn.close()
+
+    def ping(self) -> Optional[dict]:
+        """
+        Check whether the worker is running
+
+        Returns:
+            Worker status, or None if no worker is listening
+
+        Raises:
+            RuntimeError: If the worker listening there uses another auth key
+        """
+        try:
+            return self._request({'op': 'ping'})
+        except AuthenticationError:
+            raise RuntimeError(
+                f"O worker de imagens em {self.address[0]}:{self.address[1]} usa outra chave: "
+                f"ela não corresponde a {Config.SD_WORKER_AUTHKEY_FILE} (nem a TERNARIUS_SD_WORKER_AUTHKEY)"
+            ) from None
+        except (OSError, EOFError):
+            return None
+
+    def generate(
+        self,
+        prompt: str,
+        negative_prompt: str = None,
+        width: int = None,
+        height: int = None,
+        num_inference_steps: int = None,
+        guidance_scale: float = None,
+        seed: int = None,
+        profile: str = None
+    ) -> Tuple[Image.Image, float]:
+        """
+        Generate an image on the worker
+
+        Args:
+            prompt: Description of the image
+            negative_prompt: Things to avoid in the image
+            width: Image width (pipeline default if None)
+            height: Image height (pipeline default if None)
+            num_inference_steps: Number of denoising steps
+            guidance_scale: Classifier-free guidance scale
+            seed: Random seed for reproducible images
+            profile: Render profile ('draft', 'standard' or 'final') setting
+                the scheduler, steps and guidance scale on the worker
+
+        Returns:
+            Tuple of (PIL Image, inference time in seconds)
+        """
+        with span('image.diffusion', worker=True):
+            response = self._request({
+                'op': 'generate',
+                'prompt': prompt,
+                'negative_prompt': negative_prompt,
+                'width': width,
+                'height': height,
+                'num_inference_steps': num_inference_steps,
+                'guidance_scale': guidance_scale,
+                'seed': seed,
+                'profile': profile,
+                'trace': tracer.enabled,
+            })
+        if not response.get('ok'):
+            raise RuntimeError(response.get('error', 'Erro desconhecido no worker'))
+        if response.get('trace'):
+            # Spans recorded in the worker process (one per denoising step)
+            tracer.add_events(response['trace'])
+
+        image = Image.frombytes('RGB', tuple(response['size']), response['data'])
+        return image, response['elapsed']
+
+    def generate_image(self, prompt: str, width: int = 512, height: int = 512, profile: str = None) -> Image.Image:
+        """
+        Generate an image (same signature as ImageGenerator.generate_image)
+
+        Args:
+            prompt: Description of the image to generate
+            width: Width of the image (rounded down to a multiple of 8)
+            height: Height of the image (rounded down to a multiple of 8)
+            profile: Render profile (the worker's current scheduler if not provided)
+
+        Returns:
+            PIL Image object
+        """
+        image, _ = self.generate(prompt, width=(width // 8) * 8, height=(height // 8) * 8, profile=profile)
+        return image
+
+    def shutdown(self):
+        """Ask the worker to exit"""
+        try:
+            self._request({'op': 'shutdown'})
+        except (OSError, EOFError):
+            pass
+
+
+def start_worker(factory: str = None, address: Tuple[str, int] = None, log_path: str = None) -> subprocess.Popen:
+    """
+    Launch a detached worker process
+
+    Args:
+        factory: Pipeline factory as "module:function"
+        address: (host, port) for the worker to listen on
+        log_path: File receiving the worker output
+
+    Returns:
+        The worker process handle
+    """
+    factory = factory or Config.SD_WORKER_FACTORY
+    host, port = address or Config.SD_WORKER_ADDRESS
+    log_path = log_path or Config.SD_WORKER_LOG
+    # The worker runs from the project root: give it the client's key file
+    key_path = os.path.abspath(Config.SD_WORKER_AUTHKEY_FILE)
+    load_authkey(key_path)
+
+    env = dict(os.environ)
+    src_dir = os.path.join(PROJECT_ROOT, 'src')
+    env['PYTHONPATH'] = os.pathsep.join(
+        path for path in (src_dir, PROJECT_ROOT, env.get('PYTHONPATH')) if path
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    log_file = open(log_path, 'a', encoding='utf-8')
+
+    kwargs = {}
+    if os.name == 'nt':
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+
+    return subprocess.Popen(
+        [sys.executable, '-m', 'ternarius_atlas.sd_worker',
+         '--factory', factory, '--host', host, '--port', str(port), '--authkey-file', key_path],
+        cwd=PROJECT_ROOT,
+        env=env,
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+        stdin=subprocess.DEVNULL,
+        **kwargs
+    )
+
+
+def ensure_worker(factory: str = None, address: Tuple[str, int] = None, timeout: float = 60) -> SDWorkerClient:
+    """
+    Connect to the worker, starting it first if it isn't running
+
+    Args:
+        factory: Pipeline factory used if a worker has to be started
+        address: Worker (host, port)
+        timeout: Seconds to wait for a new worker to accept connections
+
+    Returns:
+        Client connected to a running worker
+
+    Raises:
+        RuntimeError: If the worker doesn't start, or a worker with another
+            auth key is already listening on the address
+    """
+    client = SDWorkerClient(address)
+    if client.ping() is not None:
+        return client
+
+    print("🔧 Iniciando worker de imagens (o modelo é carregado uma única vez)...")
+    process = start_worker(factory, address)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if client.ping() is not None:
+            return client
+        if process.poll() is not None:
+            break
+        time.sleep(0.5)
+
+    raise RuntimeError(f"Worker de imagens não iniciou. Veja o log em {Config.SD_WORKER_LOG}")
+
+
+def main():
+    """Run a worker in the foreground"""
+    parser = argparse.ArgumentParser(description="Worker persistente de geração de imagens")
+    parser.add_argument('--factory', default=Config.SD_WORKER_FACTORY,
+                        help="Função que carrega o pipeline (modulo:funcao)")
+    parser.add_argument('--host', default=Config.SD_WORKER_ADDRESS[0])
+    parser.add_argument('--port', type=int, default=Config.SD_WORKER_ADDRESS[1])
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help="Encerrar após N segundos sem trabalhos")
+    parser.add_argument('--authkey-file', default=Config.SD_WORKER_AUTHKEY_FILE,
+                        help="Arquivo com a chave dos clientes (criado se não existir)")
+    args = parser.parse_args()
+
+    worker = SDWorker(
+        load_factory(args.factory),
+        address=(args.host, args.port),
+        authkey=load_authkey(args.authkey_file),
+        idle_timeout=args.idle_timeout
+    )
+    print(f"🎨 Worker de imagens ouvindo em {args.host}:{args.port}", flush=True)
+    worker.serve_forever()
+    print("👋 Worker encerrado", flush=True)
+
+
+if __name__ == "__main__":
+    main()
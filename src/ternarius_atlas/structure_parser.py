@@ -0,0 +1,177 @@
+"""
+Incremental parser for the detailed e-book structure
+
+The model answers either with JSON (structured output) or with the legacy
+text format: a header (TÍTULO, DESCRIÇÃO, TOTAL_PÁGINAS) followed by one block
+per page, each starting with a ---PÁGINA n--- marker. The parser detects the
+format from the first characters, accepts the response in arbitrary chunks
+and hands back every page as soon as it is complete, so pages can be used
+while the rest is still streaming.
+"""
+
+from typing import Dict, List, Optional
+
+from .structured_output import JsonPageScanner, normalize_structure, repair_json
+
+
+class StructureParser:
+    """Parse a streamed e-book structure response page by page"""
+
+    def __init__(self):
+        """Initialize an empty structure"""
+        self.structure = {
+            'title': '',
+            'description': '',
+            'total_pages': 0,
+            'pages': []
+        }
+        self.closed = False
+        self.format = None  # 'json' or 'text', detected from the response
+        self._json: Optional[JsonPageScanner] = None
+        self._emitted = 0
+        self._buffer = ''
+        self._current_page: Optional[Dict[str, str]] = None
+        self._current_field: Optional[str] = None
+
+    def feed(self, chunk: str) -> List[dict]:
+        """
+        Consume a piece of the response
+
+        Args:
+            chunk: Next piece of text (may end in the middle of a line)
+
+        Returns:
+            Pages completed by this chunk, in order
+        """
+        if self.format is None:
+            self._buffer += chunk
+            start = self._buffer.lstrip()
+            if not start:
+                return []
+            # JSON answers start with an object (possibly inside a code fence)
+            self.format = 'json' if start[0] in '{`' else 'text'
+            if self.format == 'json':
+                self._json = JsonPageScanner()
+                chunk, self._buffer = self._buffer, ''
+            else:
+                chunk, self._buffer = '', self._buffer
+        
+        if self.format == 'json':
+            pages = self._json.feed(chunk)
+            self._emitted += len(pages)
+            return pages
+        
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+
+        completed = []
+        for line in lines:
+            page = self._parse_line(line)
+            if page is not None:
+                completed.append(page)
+        return completed
+
+    def close(self) -> List[dict]:
+        """
+        Finish parsing once the whole response was fed
+
+        Returns:
+            Pages completed by the end of the response (usually the last one)
+        """
+        if self.format == 'json':
+            structure = normalize_structure(repair_json(self._json.text))
+            if structure is not None:
+                self.structure = structure
+                self.closed = True
+                # Pages only recovered by the repair (e.g. a truncated last page)
+                return structure['pages'][self._emitted:]
+            # Not usable JSON: fall back to the text format
+            self.format, self._buffer = 'text', ''
+            self.feed(self._json.text)
+        
+        completed = []
+        if self._buffer:
+            page = self._parse_line(self._buffer)
+            self._buffer = ''
+            if page is not None:
+                completed.append(page)
+
+        if self._current_page is not None:
+            completed.append(self._finish_page())
+
+        # Set total pages if not provided
+        if self.structure['total_pages'] == 0:
+            self.structure['total_pages'] = len(self.structure['pages'])
+
+        # Ensure we have at least a basic structure
+        if not self.structure['pages']:
+            self.structure['pages'] = [{
+                'type': 'cover',
+                'title': self.structure['title'] or 'Meu Livro',
+                'text': '',
+                'illustration_description': 'Uma capa bonita e colorida'
+            }]
+
+        self.closed = True
+        return completed
+
+    def _finish_page(self) -> dict:
+        """Store the page being parsed and return it"""
+        page = self._current_page
+        self.structure['pages'].append(page)
+        self._current_page = None
+        self._current_field = None
+        return page
+
+    def _parse_line(self, line: str) -> Optional[dict]:
+        """Parse one line, returning the previous page if this line closes it"""
+        line = line.strip()
+        page = self._current_page
+
+        # Page sections
+        if line.startswith('---PÁGINA'):
+            finished = self._finish_page() if page is not None else None
+            self._current_page = {
+                'type': 'content',
+                'title': '',
+                'text': '',
+                'illustration_description': ''
+            }
+            return finished
+
+        # Header info (only before the first page)
+        if page is None:
+            if line.startswith('TÍTULO:'):
+                self.structure['title'] = line.replace('TÍTULO:', '').strip()
+            elif line.startswith('DESCRIÇÃO:'):
+                self.structure['description'] = line.replace('DESCRIÇÃO:', '').strip()
+            elif line.startswith('TOTAL_PÁGINAS:'):
+                try:
+                    self.structure['total_pages'] = int(line.replace('TOTAL_PÁGINAS:', '').strip())
+                except ValueError:
+                    pass
+            return None
+
+        if line.startswith('TIPO:'):
+            page['type'] = line.replace('TIPO:', '').strip().lower()
+            self._current_field = None
+        elif line.startswith('TÍTULO:'):
+            page['title'] = line.replace('TÍTULO:', '').strip()
+            self._current_field = None
+        elif line.startswith('TEXTO:'):
+            text_content = line.replace('TEXTO:', '').strip()
+            if text_content:
+                page['text'] = text_content
+            self._current_field = 'text'
+        elif line.startswith('ILUSTRAÇÃO:'):
+            illust_content = line.replace('ILUSTRAÇÃO:', '').strip()
+            if illust_content:
+                page['illustration_description'] = illust_content
+            self._current_field = 'illustration'
+        elif line and self._current_field:
+            # Continue multiline content
+            if self._current_field == 'text':
+                page['text'] += ' ' + line
+            elif self._current_field == 'illustration':
+                page['illustration_description'] += ' ' + line
+        return None
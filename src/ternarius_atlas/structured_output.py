@@ -0,0 +1,382 @@
+"""
+Structured (JSON) output for e-book generation
+
+The model is asked to answer with JSON following a schema instead of the
+line-based TÍTULO/TEXTO/ILUSTRAÇÃO format. Responses are parsed with the
+standard json module; truncated or slightly malformed JSON is repaired locally
+instead of asking the model again.
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+
+PAGE_TYPES = ['cover', 'chapter', 'content']
+
+EBOOK_STRUCTURE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string'},
+        'description': {'type': 'string'},
+        'total_pages': {'type': 'integer'},
+        'pages': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'type': {'type': 'string', 'enum': PAGE_TYPES},
+                    'title': {'type': 'string'},
+                    'text': {'type': 'string'},
+                    'illustration_description': {'type': 'string'},
+                },
+                'required': ['type', 'title', 'text', 'illustration_description'],
+            },
+        },
+    },
+    'required': ['title', 'description', 'pages'],
+}
+
+CHAPTER_PAGES_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'pages': {'type': 'array', 'items': {'type': 'string'}},
+    },
+    'required': ['pages'],
+}
+
+CHAPTERS_BATCH_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'chapters': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'title': {'type': 'string'},
+                    'pages': {'type': 'array', 'items': {'type': 'string'}},
+                    'illustration_prompt': {'type': 'string'},
+                },
+                'required': ['title', 'pages', 'illustration_prompt'],
+            },
+        },
+    },
+    'required': ['chapters'],
+}
+
+# Maximum number of cut points tried when repairing a response
+_MAX_REPAIR_ATTEMPTS = 200
+
+
+def json_generation_config(schema: dict) -> dict:
+    """
+    Build the generation config asking the model for JSON matching a schema
+
+    Args:
+        schema: Response schema
+
+    Returns:
+        Value for the generation_config argument of generate_content
+    """
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+
+def _strip_fences(text: str) -> str:
+    """Drop Markdown code fences and anything before the first JSON value"""
+    starts = [i for i in (text.find('{'), text.find('[')) if i != -1]
+    if not starts:
+        return ''
+    text = text[min(starts):]
+    fence = text.rfind('```')
+    return text[:fence] if fence != -1 else text
+
+
+def repair_json(text: str, report_truncation: bool = False) -> Any:
+    """
+    Parse JSON, repairing truncated or slightly malformed responses
+
+    Handles code fences, text around the JSON value, trailing commas and
+    responses cut off in the middle (the last incomplete value is dropped or
+    its string closed, and open arrays/objects are closed).
+
+    Args:
+        text: Model response
+        report_truncation: Also report how many arrays/objects the repair
+            closed because the response was cut off (0 if it wasn't); with
+            N levels of nesting above a list's items, more than N closed
+            containers means its last item was left open
+
+    Returns:
+        Parsed value, or None if nothing could be recovered; with
+        report_truncation, a (value, closed containers) tuple
+    """
+    value, closed = _repair_json(text)
+    return (value, closed) if report_truncation else value
+
+
+def _repair_json(text: str) -> Tuple[Optional[Any], int]:
+    """Parse or repair a response, returning (value, containers closed at the cut)"""
+    text = _strip_fences(text).strip()
+    if not text:
+        return None, 0
+
+    try:
+        return json.loads(text), 0
+    except ValueError:
+        pass
+
+    # Scan once, remembering where a value ended and which containers were open
+    cuts = []  # (cut position, closers, string needs closing)
+    stack = []
+    in_string = escaped = False
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+                cuts.append((i + 1, ''.join(reversed(stack)), False))
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            cuts.append((i + 1, ''.join(reversed(stack)), False))
+        elif char == ',':
+            cuts.append((i, ''.join(reversed(stack)), False))
+
+    if in_string:
+        # Cut off inside a string: keep what was written so far
+        cuts.append((len(text) - (1 if escaped else 0), ''.join(reversed(stack)), True))
+    # Containers closed at a cut were only left open if the response ends
+    # with some still open (otherwise the cut just drops a trailing comma)
+    truncated = in_string or bool(stack)
+
+    for position, closers, close_string in reversed(cuts[-_MAX_REPAIR_ATTEMPTS:]):
+        candidate = text[:position].rstrip()
+        if close_string:
+            candidate += '"'
+        # A dangling key or comma can't be closed; the next cut point handles it
+        try:
+            return json.loads(candidate + closers), len(closers) if truncated else 0
+        except ValueError:
+            continue
+    return None, 0
+
+
+def normalize_page(page: Any) -> Optional[dict]:
+    """
+    Convert a page object from the model into the structure.json page format
+
+    Args:
+        page: Parsed page value
+
+    Returns:
+        Page dictionary, or None if the value isn't a usable page
+    """
+    if not isinstance(page, dict):
+        return None
+
+    page_type = str(page.get('type') or 'content').strip().lower()
+    normalized = {
+        'type': page_type if page_type in PAGE_TYPES else 'content',
+        'title': str(page.get('title') or '').strip(),
+        'text': str(page.get('text') or '').strip(),
+        'illustration_description': str(page.get('illustration_description') or '').strip(),
+    }
+    if not (normalized['title'] or normalized['text'] or normalized['illustration_description']):
+        return None
+    return normalized
+
+
+def normalize_structure(data: Any) -> Optional[dict]:
+    """
+    Validate a parsed structure and fill in missing fields
+
+    Args:
+        data: Parsed JSON value
+
+    Returns:
+        Structure dictionary, or None if it has no usable pages
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('pages'), list):
+        return None
+
+    pages = [page for page in map(normalize_page, data['pages']) if page is not None]
+    if not pages:
+        return None
+
+    try:
+        total_pages = int(data.get('total_pages') or 0)
+    except (TypeError, ValueError):
+        total_pages = 0
+
+    return {
+        'title': str(data.get('title') or '').strip(),
+        'description': str(data.get('description') or '').strip(),
+        'total_pages': total_pages or len(pages),
+        'pages': pages,
+    }
+
+
+def parse_chapter_pages(text: str) -> Optional[List[str]]:
+    """
+    Parse a chapter answered with CHAPTER_PAGES_SCHEMA
+
+    Args:
+        text: Model response
+
+    Returns:
+        Page texts, or None if the response isn't usable JSON
+    """
+    data = repair_json(text)
+    if isinstance(data, dict):
+        data = data.get('pages')
+    return _page_texts(data) or None
+
+
+def _page_texts(data: Any) -> List[str]:
+    """Non-empty page texts of a parsed list of pages"""
+    if not isinstance(data, list):
+        return []
+    texts = []
+    for page in data:
+        if isinstance(page, dict):
+            page = page.get('text', '')
+        page = str(page).strip()
+        if page:
+            texts.append(page)
+    return texts
+
+
+def parse_chapters_batch(text: str, chapter_titles: List[str]) -> List[Optional[dict]]:
+    """
+    Split a response answered with CHAPTERS_BATCH_SCHEMA into chapters
+
+    Chapters are matched by title, falling back to their position when the
+    model rewrote a title. When the response was cut off inside its last
+    chapter, that chapter is incomplete and is reported as missing.
+
+    Args:
+        text: Model response
+        chapter_titles: Titles of the chapters that were requested, in order
+
+    Returns:
+        One {'pages', 'illustration_prompt'} dictionary per requested
+        chapter, or None for chapters missing from the response
+    """
+    data, closed = repair_json(text, report_truncation=True)
+    depth = 1  # Containers around each chapter: the list (and the wrapping object)
+    if isinstance(data, dict):
+        data = data.get('chapters')
+        depth = 2
+    if not isinstance(data, list):
+        return [None] * len(chapter_titles)
+
+    if closed > depth:
+        # The repair closed the last chapter itself: it may be missing pages
+        data = data[:-1]
+    answers = [answer for answer in data if isinstance(answer, dict)]
+    by_title = {}
+    for answer in answers:
+        by_title.setdefault(str(answer.get('title') or '').strip().lower(), answer)
+
+    matched = [by_title.get(title.strip().lower()) for title in chapter_titles]
+    used = {id(answer) for answer in matched if answer is not None}
+    for position, answer in enumerate(matched):
+        if answer is None and position < len(answers) and id(answers[position]) not in used:
+            matched[position] = answers[position]
+            used.add(id(answers[position]))
+
+    results = []
+    for answer in matched:
+        pages = _page_texts(answer.get('pages')) if answer is not None else []
+        if not pages:
+            results.append(None)
+            continue
+        results.append({
+            'pages': pages,
+            'illustration_prompt': str(answer.get('illustration_prompt') or '').strip(),
+        })
+    return results
+
+
+class JsonPageScanner:
+    """Find complete page objects in a streamed JSON structure"""
+
+    def __init__(self):
+        self.text = ''
+        self._position = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string = None
+        self._key = None
+        self._pages_depth = None
+        self._page_start = None
+
+    def feed(self, chunk: str) -> List[dict]:
+        """
+        Consume a piece of the response
+
+        Args:
+            chunk: Next piece of text
+
+        Returns:
+            Pages whose objects were completed by this chunk
+        """
+        self.text += chunk
+        text = self.text
+        pages = []
+
+        for i in range(self._position, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i + 1]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ':':
+                self._key = self._last_string
+            elif char in '{[':
+                if char == '[' and len(self._stack) == 1 and self._key == '"pages"':
+                    self._pages_depth = len(self._stack) + 1
+                elif char == '{' and self._pages_depth is not None and len(self._stack) == self._pages_depth:
+                    self._page_start = i
+                self._stack.append(char)
+            elif char in '}]':
+                if self._stack:
+                    self._stack.pop()
+                depth = len(self._stack)
+                if char == '}' and self._page_start is not None and depth == self._pages_depth:
+                    page = self._parse_page(text[self._page_start:i + 1])
+                    self._page_start = None
+                    if page is not None:
+                        pages.append(page)
+                elif char == ']' and self._pages_depth is not None and depth == self._pages_depth - 1:
+                    self._pages_depth = None
+
+        self._position = len(text)
+        return pages
+
+    def _parse_page(self, raw: str) -> Optional[dict]:
+        """Parse one page object"""
+        try:
+            return normalize_page(json.loads(raw))
+        except ValueError:
+            return None
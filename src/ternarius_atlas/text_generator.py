@@ -2,19 +2,116 @@
 Text generation module using Google Gemini AI
 """
 
-import google.generativeai as genai
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional
 from .config import config
+from .gemini_client import GeminiClient
+from .response_cache import ResponseCache
+from .structure_parser import StructureParser
+from .structured_output import (
+    CHAPTER_PAGES_SCHEMA,
+    CHAPTERS_BATCH_SCHEMA,
+    EBOOK_STRUCTURE_SCHEMA,
+    json_generation_config,
+    parse_chapter_pages,
+    parse_chapters_batch,
+)
+from .tracing import span, traced
 
 
 class TextGenerator:
     """Generate text content for e-book using Google Gemini"""
     
-    def __init__(self):
-        """Initialize the text generator with Gemini API"""
+    def __init__(self, cache: Optional[ResponseCache] = None):
+        """
+        Initialize the text generator with Gemini API
+        
+        Args:
+            cache: Response cache to use (built from config if not provided)
+        """
+        # Imported here so the package can be used without loading the SDK
+        import google.generativeai as genai
+        
         genai.configure(api_key=config.gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model_name = 'gemini-2.5-flash'
+        # Rate limits, retries on 429/5xx and latency metrics for every call
+        self.client = GeminiClient(genai.GenerativeModel(self.model_name))
+        self.model = self.client
+        
+        if cache is None and config.RESPONSE_CACHE_ENABLED:
+            cache = ResponseCache(
+                config.RESPONSE_CACHE_PATH,
+                ttl=config.RESPONSE_CACHE_TTL,
+                max_bytes=config.RESPONSE_CACHE_MAX_BYTES,
+                read_only=config.RESPONSE_CACHE_READ_ONLY
+            )
+        self.cache = cache
+    
+    def _generate(self, prompt: str, **params) -> str:
+        """
+        Send a prompt to the model, serving identical requests from the cache
+        
+        Args:
+            prompt: Prompt to send
+            **params: Generation parameters forwarded to generate_content
+            
+        Returns:
+            Response text
+        """
+        with span('llm.call') as call:
+            key = None
+            if self.cache is not None:
+                key = ResponseCache.make_key(self.model_name, prompt, params)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    call.set(cached=True)
+                    return cached
+            
+            text = self.model.generate_content(prompt, **params).text
+            call.set(cached=False)
+            
+            if self.cache is not None:
+                self.cache.set(key, text)
+            return text
     
+    def _generate_stream(self, prompt: str, **params) -> Iterator[str]:
+        """
+        Stream a response from the model, serving identical requests from the cache
+        
+        A cached response is yielded as a single chunk; a streamed response is
+        stored in the cache once it has been received completely.
+        
+        Args:
+            prompt: Prompt to send
+            **params: Generation parameters forwarded to generate_content
+            
+        Yields:
+            Pieces of the response text
+        """
+        key = None
+        if self.cache is not None:
+            # Streaming doesn't change the response, so it shares cache entries
+            key = ResponseCache.make_key(self.model_name, prompt, params)
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        
+        parts = []
+        # The span also covers the time the consumer spends between chunks
+        with span('llm.stream'):
+            for chunk in self.model.generate_content(prompt, stream=True, **params):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text (e.g. only a finish reason)
+                    continue
+                parts.append(text)
+                yield text
+        
+        if self.cache is not None:
+            self.cache.set(key, ''.join(parts))
+    
+    @traced('llm.structure')
     def generate_ebook_structure(self, theme: str, num_chapters: int = 5) -> Dict[str, List[str]]:
         """
         Generate the structure of the e-book including title and chapter titles
@@ -45,8 +142,7 @@ class TextGenerator:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text
+            text = self._generate(prompt)
         except Exception as e:
             print(f"Erro ao gerar estrutura do e-book: {e}")
             # Return default structure on error
@@ -73,6 +169,7 @@ class TextGenerator:
             "chapters": chapters if chapters else [f"Capítulo {i+1}" for i in range(num_chapters)]
         }
     
+    @traced('llm.chapter')
     def generate_chapter_content(self, theme: str, chapter_title: str, max_pages: int = 3) -> List[str]:
         """
         Generate content for a specific chapter
@@ -95,7 +192,16 @@ class TextGenerator:
         Cada página deve ter aproximadamente 200-300 palavras.
         
         Use uma linguagem clara, envolvente e educativa.
+        """
         
+        if config.STRUCTURED_OUTPUT:
+            prompt += f"""
+        Responda em JSON: um objeto com o campo "pages", uma lista com o texto
+        de cada uma das {max_pages} páginas.
+        """
+            params = {'generation_config': json_generation_config(CHAPTER_PAGES_SCHEMA)}
+        else:
+            prompt += """
         Formato de resposta:
         [PÁGINA 1]
         [conteúdo da página 1]
@@ -105,10 +211,10 @@ class TextGenerator:
         
         ...
         """
+            params = {}
         
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text
+            text = self._generate(prompt, **params)
         except Exception as e:
             print(f"Erro ao gerar conteúdo do capítulo: {e}")
             # Return default content on error
@@ -119,6 +225,11 @@ class TextGenerator:
             
             [Conteúdo gerado com erro - verifique sua conexão e API key]"""
         
+        # Structured answers are parsed (and repaired) as JSON
+        pages = parse_chapter_pages(text) if config.STRUCTURED_OUTPUT else None
+        if pages:
+            return pages[:max_pages]
+        
         # Parse pages
         pages = []
         current_page = []
@@ -157,6 +268,94 @@ class TextGenerator:
         
         return pages[:max_pages] if pages else [text]
     
+    @staticmethod
+    def plan_chapter_batches(
+        chapter_titles: List[str],
+        pages_per_chapter: int,
+        token_budget: Optional[int] = None
+    ) -> List[List[str]]:
+        """
+        Group chapters so that each group fits in one batched request
+        
+        Args:
+            chapter_titles: Titles of all chapters, in order
+            pages_per_chapter: Number of pages per chapter
+            token_budget: Output tokens allowed per request (uses Config.BATCH_TOKEN_BUDGET)
+            
+        Returns:
+            Consecutive groups of chapter titles (a chapter larger than the
+            budget gets a group of its own)
+        """
+        token_budget = token_budget or config.BATCH_TOKEN_BUDGET
+        chapter_tokens = pages_per_chapter * config.MAX_TOKENS_PER_PAGE + config.ILLUSTRATION_PROMPT_TOKENS
+        
+        batches = []
+        current, used = [], 0
+        for title in chapter_titles:
+            if current and used + chapter_tokens > token_budget:
+                batches.append(current)
+                current, used = [], 0
+            current.append(title)
+            used += chapter_tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    @traced('llm.chapter_batch')
+    def generate_chapters_batch(self, theme: str, chapter_titles: List[str], pages_per_chapter: int = 3) -> List[dict]:
+        """
+        Generate the content and illustration prompt of several chapters in one request
+        
+        Chapters missing from the response (e.g. a truncated answer) are
+        generated one by one with generate_chapter_content.
+        
+        Args:
+            theme: The main theme of the e-book
+            chapter_titles: Titles of the chapters to write
+            pages_per_chapter: Number of pages per chapter
+            
+        Returns:
+            One {'pages', 'illustration_prompt'} dictionary per chapter, in
+            order (the illustration prompt may be empty)
+        """
+        chapter_list = '\n'.join(f"        {i}. {title}" for i, title in enumerate(chapter_titles, 1))
+        prompt = f"""
+        Você é um escritor especializado em criar e-books.
+        
+        Tema do e-book: {theme}
+        
+        Escreva o conteúdo dos seguintes capítulos:
+{chapter_list}
+        
+        Cada capítulo deve ter {pages_per_chapter} páginas de aproximadamente 200-300 palavras.
+        Use uma linguagem clara, envolvente e educativa.
+        
+        Para cada capítulo, crie também uma descrição curta (máximo 50 palavras) para
+        uma imagem ilustrativa da primeira página, adequada para geração de imagem por IA.
+        
+        Responda em JSON: um objeto com o campo "chapters", uma lista com um item por
+        capítulo, na mesma ordem, contendo "title" (o título do capítulo), "pages" (a
+        lista com o texto de cada página) e "illustration_prompt" (a descrição da imagem).
+        """
+        
+        try:
+            text = self._generate(prompt, generation_config=json_generation_config(CHAPTERS_BATCH_SCHEMA))
+            results = parse_chapters_batch(text, chapter_titles)
+        except Exception as e:
+            print(f"Erro ao gerar capítulos em lote: {e}")
+            results = [None] * len(chapter_titles)
+        
+        for i, title in enumerate(chapter_titles):
+            if results[i] is None:
+                results[i] = {
+                    'pages': self.generate_chapter_content(theme, title, pages_per_chapter),
+                    'illustration_prompt': ''
+                }
+            else:
+                results[i]['pages'] = results[i]['pages'][:pages_per_chapter]
+        return results
+    
+    @traced('llm.image_prompt')
     def generate_image_prompt(self, theme: str, chapter_title: str, page_content: str) -> str:
         """
         Generate a descriptive prompt for image generation based on the content
@@ -185,13 +384,13 @@ class TextGenerator:
         """
         
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self._generate(prompt).strip()
         except Exception as e:
             print(f"Erro ao gerar prompt de imagem: {e}")
             # Return a simple default prompt
             return f"Ilustração sobre {chapter_title} relacionada ao tema {theme}"
     
+    @traced('llm.detailed_structure')
     def generate_detailed_ebook_structure(self, theme: str) -> dict:
         """
         Generate a detailed e-book structure with all pages, texts and illustration descriptions
@@ -202,7 +401,76 @@ class TextGenerator:
         Returns:
             Dictionary with complete book structure including all pages
         """
-        prompt = f"""
+        parser = StructureParser()
+        try:
+            for _ in self.stream_detailed_ebook_structure(theme, parser):
+                pass
+        except Exception as e:
+            print(f"Erro ao gerar estrutura do e-book: {e}")
+            return self._default_detailed_structure(theme)
+        
+        return parser.structure
+    
+    def stream_detailed_ebook_structure(
+        self,
+        theme: str,
+        parser: Optional[StructureParser] = None
+    ) -> Iterator[dict]:
+        """
+        Generate a detailed e-book structure, yielding each page as soon as it is complete
+        
+        Args:
+            theme: The main theme/topic for the e-book with optional instructions
+            parser: Parser to use; pass one to read the header (title,
+                description) while pages arrive and the full structure once
+                the iterator is exhausted
+            
+        Yields:
+            Page dictionaries (type, title, text, illustration_description)
+        """
+        parser = parser or StructureParser()
+        
+        # The parser detects whether the model answered with JSON or with the
+        # text format, so both modes share this path
+        if config.STRUCTURED_OUTPUT:
+            chunks = self._generate_stream(
+                self._detailed_structure_prompt(theme, structured=True),
+                generation_config=json_generation_config(EBOOK_STRUCTURE_SCHEMA)
+            )
+        else:
+            chunks = self._generate_stream(self._detailed_structure_prompt(theme))
+        
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+        yield from parser.close()
+    
+    def _detailed_structure_prompt(self, theme: str, structured: bool = False) -> str:
+        """Build the prompt asking for the detailed e-book structure (as JSON if structured)"""
+        if structured:
+            return f"""
+        Você é um especialista em criar e-books educativos e envolventes.
+        
+        Tema/Instruções: {theme}
+        
+        Crie uma estrutura COMPLETA para um e-book e responda em JSON com os campos:
+        
+        - title: título atraente do e-book (máximo 8 palavras)
+        - description: breve descrição do livro (1-2 frases)
+        - total_pages: número total de páginas (recomendado: 6-10 páginas)
+        - pages: lista com CADA página do livro, cada uma com:
+           - type: "cover" (apenas a primeira), "chapter" ou "content"
+           - title: título da página (vazio se não se aplicar)
+           - text: texto completo da página (2-4 parágrafos curtos, linguagem simples e clara; vazio para a capa)
+           - illustration_description: descrição detalhada da ilustração (50-80 palavras, específica para geração de imagem por IA)
+        
+        IMPORTANTE:
+        - Use linguagem adequada para o público-alvo
+        - Textos devem ser concisos e claros
+        - Descrições de ilustrações devem ser específicas e visuais
+        - Inclua variedade visual nas ilustrações
+        """
+        
+        return f"""
         Você é um especialista em criar e-books educativos e envolventes.
         
         Tema/Instruções: {theme}
@@ -250,114 +518,32 @@ class TextGenerator:
         - Descrições de ilustrações devem ser específicas e visuais
         - Inclua variedade visual nas ilustrações
         """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            text = response.text
-        except Exception as e:
-            print(f"Erro ao gerar estrutura do e-book: {e}")
-            # Return a default structure
-            return {
-                'title': 'Livro sobre ' + theme[:30],
-                'description': 'Um livro gerado automaticamente',
-                'total_pages': 5,
-                'pages': [
-                    {
-                        'type': 'cover',
-                        'title': 'Livro sobre ' + theme[:30],
-                        'text': '',
-                        'illustration_description': 'Capa colorida e atraente sobre ' + theme[:50]
-                    },
-                    {
-                        'type': 'content',
-                        'title': 'Capítulo 1',
-                        'text': 'Conteúdo sobre o tema.',
-                        'illustration_description': 'Ilustração relacionada ao tema'
-                    }
-                ]
-            }
-        
-        # Parse the structured response
-        return self._parse_ebook_structure(text)
     
-    def _parse_ebook_structure(self, text: str) -> dict:
-        """Parse the AI-generated structure into a dictionary"""
-        structure = {
-            'title': '',
-            'description': '',
-            'total_pages': 0,
-            'pages': []
-        }
-        
-        lines = text.split('\n')
-        current_page = None
-        current_field = None
-        
-        for line in lines:
-            line = line.strip()
-            
-            # Parse header info
-            if line.startswith('TÍTULO:'):
-                structure['title'] = line.replace('TÍTULO:', '').strip()
-            elif line.startswith('DESCRIÇÃO:'):
-                structure['description'] = line.replace('DESCRIÇÃO:', '').strip()
-            elif line.startswith('TOTAL_PÁGINAS:'):
-                try:
-                    structure['total_pages'] = int(line.replace('TOTAL_PÁGINAS:', '').strip())
-                except:
-                    pass
-            
-            # Parse page sections
-            elif line.startswith('---PÁGINA'):
-                if current_page:
-                    structure['pages'].append(current_page)
-                current_page = {
-                    'type': 'content',
-                    'title': '',
+    def _default_detailed_structure(self, theme: str) -> dict:
+        """Structure used when the model can't be reached"""
+        return {
+            'title': 'Livro sobre ' + theme[:30],
+            'description': 'Um livro gerado automaticamente',
+            'total_pages': 5,
+            'pages': [
+                {
+                    'type': 'cover',
+                    'title': 'Livro sobre ' + theme[:30],
                     'text': '',
-                    'illustration_description': ''
+                    'illustration_description': 'Capa colorida e atraente sobre ' + theme[:50]
+                },
+                {
+                    'type': 'content',
+                    'title': 'Capítulo 1',
+                    'text': 'Conteúdo sobre o tema.',
+                    'illustration_description': 'Ilustração relacionada ao tema'
                 }
-                current_field = None
-            
-            elif current_page is not None:
-                if line.startswith('TIPO:'):
-                    current_page['type'] = line.replace('TIPO:', '').strip().lower()
-                    current_field = None
-                elif line.startswith('TÍTULO:'):
-                    current_page['title'] = line.replace('TÍTULO:', '').strip()
-                    current_field = None
-                elif line.startswith('TEXTO:'):
-                    text_content = line.replace('TEXTO:', '').strip()
-                    if text_content:
-                        current_page['text'] = text_content
-                    current_field = 'text'
-                elif line.startswith('ILUSTRAÇÃO:'):
-                    illust_content = line.replace('ILUSTRAÇÃO:', '').strip()
-                    if illust_content:
-                        current_page['illustration_description'] = illust_content
-                    current_field = 'illustration'
-                elif line and current_field:
-                    # Continue multiline content
-                    if current_field == 'text':
-                        current_page['text'] += ' ' + line
-                    elif current_field == 'illustration':
-                        current_page['illustration_description'] += ' ' + line
-        
-        # Add last page
-        if current_page:
-            structure['pages'].append(current_page)
-        
-        # Set total pages if not provided
-        if structure['total_pages'] == 0:
-            structure['total_pages'] = len(structure['pages'])
-        
-        # Ensure we have at least a basic structure
-        if not structure['pages']:
-            structure['pages'] = [{
-                'type': 'cover',
-                'title': structure['title'] or 'Meu Livro',
-                'text': '',
-                'illustration_description': 'Uma capa bonita e colorida'
-            }]
-        
-        return structure
+            ]
+        }
+    
+    def _parse_ebook_structure(self, text: str) -> dict:
+        """Parse the AI-generated structure into a dictionary"""
+        parser = StructureParser()
+        parser.feed(text)
+        parser.close()
+        return parser.structure
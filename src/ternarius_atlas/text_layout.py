@@ -0,0 +1,120 @@
+"""
+Text layout helpers shared by every module that draws wrapped text
+"""
+
+import weakref
+from typing import Dict, List, Tuple
+from PIL import ImageFont
+
+
+# Per-font cache of word metrics: word -> (left bearing, right edge, advance)
+_word_metrics: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_default_font = None
+
+# Summing word widths ignores kerning and pixel rounding between words, so a
+# candidate line whose estimated width is this close to the limit is measured
+# as a whole before deciding where to break
+EXACT_MEASURE_MARGIN = 3.0
+
+
+def get_default_font():
+    """Return the shared Pillow default font (what ImageDraw uses for font=None)"""
+    global _default_font
+    if _default_font is None:
+        _default_font = ImageFont.load_default()
+    return _default_font
+
+
+def _metrics_for(font) -> Dict[str, Tuple[float, float, float]]:
+    """Return the word metrics cache of a font, creating it on first use"""
+    try:
+        return _word_metrics[font]
+    except KeyError:
+        metrics = {}
+        _word_metrics[font] = metrics
+        return metrics
+
+
+def _measure_word(font, metrics: Dict[str, Tuple[float, float, float]], word: str) -> Tuple[float, float, float]:
+    """Measure a word once per font and remember the result"""
+    cached = metrics.get(word)
+    if cached is None:
+        bbox = font.getbbox(word)
+        cached = (bbox[0], bbox[2], font.getlength(word))
+        metrics[word] = cached
+    return cached
+
+
+def text_width(text: str, font=None) -> float:
+    """
+    Get the rendered width of a single line of text
+
+    Args:
+        text: Text to measure
+        font: Font to use (Pillow default font if None)
+
+    Returns:
+        Width in pixels, as given by the text bounding box
+    """
+    font = font or get_default_font()
+    bbox = font.getbbox(text)
+    return bbox[2] - bbox[0]
+
+
+def wrap_text(text: str, max_width: float, font=None, strict: bool = False) -> List[str]:
+    """
+    Wrap text into lines that fit within max_width
+
+    Each distinct word is measured once per font; line widths are then built
+    from the cached word widths and the space advance in a single pass. Lines
+    whose estimate falls within EXACT_MEASURE_MARGIN of the limit are measured
+    whole, so the breaks match measuring every candidate line with
+    ImageDraw.textbbox.
+
+    Args:
+        text: Text to wrap
+        max_width: Maximum line width in pixels
+        font: Font to use (Pillow default font if None)
+        strict: Lines must be narrower than max_width (instead of at most
+            max_width wide)
+
+    Returns:
+        List of text lines
+    """
+    font = font or get_default_font()
+    metrics = _metrics_for(font)
+    space_advance = _measure_word(font, metrics, ' ')[2]
+
+    lines = []
+    current_line = []
+    line_left = 0.0
+    line_advance = 0.0  # Advance of the current line including a trailing space
+
+    for word in text.split():
+        left, right, advance = _measure_word(font, metrics, word)
+
+        # Width of the candidate line: from the first word's left bearing to
+        # the right edge of the new word placed after the current advance
+        if current_line:
+            width = line_advance + right - line_left
+            if abs(width - max_width) <= EXACT_MEASURE_MARGIN:
+                width = text_width(' '.join(current_line) + ' ' + word, font)
+        else:
+            width = right - left
+
+        if width < max_width or (width == max_width and not strict):
+            if not current_line:
+                line_left = left
+            current_line.append(word)
+            line_advance += advance + space_advance
+        else:
+            if current_line:
+                lines.append(' '.join(current_line))
+            current_line = [word]
+            line_left = left
+            line_advance = advance + space_advance
+
+    if current_line:
+        lines.append(' '.join(current_line))
+
+    return lines
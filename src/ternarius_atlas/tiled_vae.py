@@ -0,0 +1,338 @@
+"""
+Memory-bounded Stable Diffusion generation for CPU-only machines
+
+At page size (800x1200) the VAE decoder's full-resolution blocks and its
+mid-block attention need several GB of activations, so decoding a whole page
+at once swaps on a typical CPU box. MemoryBoundedPipeline wraps a diffusers
+pipeline: the denoising loop runs with attention slicing and stops at the
+latents, which are then decoded tile by tile. The tile size is the largest
+one whose estimated activations fit in what is left of the memory budget, and
+decoded tiles are blended into a band of rows that is written into the output
+image as soon as no later tile touches it.
+
+torch is only imported when a pipeline is actually decoded.
+"""
+
+import os
+import types
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .config import Config
+from .tracing import span
+
+
+# Pixels of the image per latent pixel (SD 1.x/2.x VAEs)
+LATENT_SCALE = 8
+
+# fp32 activations alive at once in the decoder's full-resolution blocks
+# (128 channels, ~4 tensors), per output pixel
+VAE_DECODE_BYTES_PER_PIXEL = 2048
+
+# Tile sizes tried, largest first (pixels, multiples of LATENT_SCALE)
+TILE_SIZES = (1024, 768, 640, 512, 384, 256, 192, 128)
+
+# Kept free for the sampler, Python objects and the output image
+SAFETY_MARGIN = 256 * 1024 * 1024
+
+
+def available_memory() -> Optional[int]:
+    """
+    Free system memory
+
+    Returns:
+        Available bytes, or None if the platform doesn't report it
+    """
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def current_rss() -> Optional[int]:
+    """
+    Resident memory of the current process
+
+    Returns:
+        RSS in bytes, or None if the platform doesn't report it
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def memory_budget(budget_mb: Optional[int] = None) -> Optional[int]:
+    """
+    Peak RSS allowed for generation
+
+    Args:
+        budget_mb: Budget in MB (uses Config.SD_MEMORY_BUDGET_MB; if that is
+            not set either, 75% of the memory this process can use)
+
+    Returns:
+        Budget in bytes, or None if it can't be determined
+    """
+    budget_mb = budget_mb or Config.SD_MEMORY_BUDGET_MB
+    if budget_mb:
+        return budget_mb * 1024 * 1024
+
+    available = available_memory()
+    if available is None:
+        return None
+    return int((available + (current_rss() or 0)) * 0.75)
+
+
+def memory_bounded_enabled(device: str) -> bool:
+    """
+    Whether generation on a device should use MemoryBoundedPipeline
+
+    Args:
+        device: Torch device name ("cpu", "cuda", ...)
+
+    Returns:
+        Config.SD_MEMORY_BOUNDED: "1" always, "0" never, "auto" only on CPU
+    """
+    setting = str(Config.SD_MEMORY_BOUNDED).lower()
+    if setting == 'auto':
+        return device == 'cpu'
+    return setting in ('1', 'true', 'yes')
+
+
+def decode_memory(width: int, height: int, dtype_bytes: int = 4) -> int:
+    """
+    Estimate the activations of decoding one tile
+
+    Args:
+        width: Tile width in pixels
+        height: Tile height in pixels
+        dtype_bytes: Bytes per value of the VAE weights (4 = fp32, 2 = fp16)
+
+    Returns:
+        Estimated bytes
+    """
+    convolutions = width * height * VAE_DECODE_BYTES_PER_PIXEL * dtype_bytes // 4
+    # Single-head attention over the latent pixels in the mid block
+    tokens = (width // LATENT_SCALE) * (height // LATENT_SCALE)
+    return convolutions + tokens * tokens * dtype_bytes
+
+
+def choose_tile_size(free_bytes: Optional[int], width: int, height: int, dtype_bytes: int = 4) -> int:
+    """
+    Pick the largest tile whose decode fits in the free memory
+
+    Args:
+        free_bytes: Memory left for decoding (None = unknown, uses 512)
+        width: Image width in pixels
+        height: Image height in pixels
+        dtype_bytes: Bytes per value of the VAE weights
+
+    Returns:
+        Tile side in pixels; the image side if the whole image fits
+    """
+    whole = max(width, height)
+    if free_bytes is None:
+        return min(512, whole)
+    if decode_memory(width, height, dtype_bytes) <= free_bytes:
+        return whole
+    for size in TILE_SIZES:
+        if size < whole and decode_memory(min(size, width), min(size, height), dtype_bytes) <= free_bytes:
+            return size
+    return TILE_SIZES[-1]
+
+
+def plan_tiles(length: int, tile: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Split one axis into overlapping tiles
+
+    Args:
+        length: Axis length
+        tile: Tile length
+        overlap: Minimum overlap between neighbouring tiles
+
+    Returns:
+        (start, end) of every tile; the last one ends at the edge
+    """
+    if length <= tile:
+        return [(0, length)]
+    stride = max(1, tile - overlap)
+    starts = list(range(0, length - tile, stride)) + [length - tile]
+    return [(start, start + tile) for start in starts]
+
+
+def _ramp(length: int, overlap: int, fade_in: bool, fade_out: bool) -> np.ndarray:
+    """Blend weights along one axis of a tile (linear fade on shared edges)"""
+    weights = np.ones(length, dtype=np.float32)
+    if overlap <= 0:
+        return weights
+    fade = np.minimum(1.0, (np.arange(length, dtype=np.float32) + 1) / (overlap + 1))
+    if fade_in:
+        weights = np.minimum(weights, fade)
+    if fade_out:
+        weights = np.minimum(weights, fade[::-1])
+    return weights
+
+
+def decode_tiled(
+    decode_tile: Callable[[int, int, int, int], np.ndarray],
+    latent_height: int,
+    latent_width: int,
+    tile: int,
+    overlap: int,
+    scale: int = LATENT_SCALE
+) -> Image.Image:
+    """
+    Decode latents tile by tile into an RGB image
+
+    Tiles are processed one row at a time; rows of pixels that no later tile
+    covers are written into the output image right away, so besides the
+    output only one band of rows is kept in float precision.
+
+    Args:
+        decode_tile: Function (y0, y1, x0, x1) in latent pixels returning the
+            decoded tile as a float array (height, width, 3) in [0, 1]
+        latent_height: Latent height
+        latent_width: Latent width
+        tile: Tile side in latent pixels
+        overlap: Overlap between tiles in latent pixels
+        scale: Image pixels per latent pixel
+
+    Returns:
+        Decoded image
+    """
+    rows = plan_tiles(latent_height, tile, overlap)
+    columns = plan_tiles(latent_width, tile, overlap)
+    width, height = latent_width * scale, latent_height * scale
+    output = Image.new('RGB', (width, height))
+
+    band_top = 0
+    band = np.zeros((0, width, 3), dtype=np.float32)
+    band_weights = np.zeros((0, width, 1), dtype=np.float32)
+
+    def flush(rows_done: int):
+        pixels = band[:rows_done] / band_weights[:rows_done]
+        pixels = np.clip(pixels * 255 + 0.5, 0, 255).astype(np.uint8)
+        output.paste(Image.fromarray(pixels, 'RGB'), (0, band_top))
+
+    for row_index, (ly0, ly1) in enumerate(rows):
+        y0, y1 = ly0 * scale, ly1 * scale
+
+        # Rows above this tile row are final
+        if y0 > band_top:
+            done = y0 - band_top
+            flush(done)
+            band, band_weights = band[done:], band_weights[done:]
+            band_top = y0
+        grow = y1 - band_top - len(band)
+        if grow > 0:
+            band = np.concatenate([band, np.zeros((grow, width, 3), dtype=np.float32)])
+            band_weights = np.concatenate([band_weights, np.zeros((grow, width, 1), dtype=np.float32)])
+
+        row_weights = _ramp(y1 - y0, overlap * scale, row_index > 0, row_index < len(rows) - 1)
+        for column_index, (lx0, lx1) in enumerate(columns):
+            x0, x1 = lx0 * scale, lx1 * scale
+            with span('vae.tile', row=row_index, column=column_index):
+                pixels = decode_tile(ly0, ly1, lx0, lx1)
+            column_weights = _ramp(x1 - x0, overlap * scale, column_index > 0, column_index < len(columns) - 1)
+            weights = np.outer(row_weights, column_weights)[:, :, None]
+            band[y0 - band_top:y1 - band_top, x0:x1] += pixels * weights
+            band_weights[y0 - band_top:y1 - band_top, x0:x1] += weights
+
+    flush(len(band))
+    return output
+
+
+class MemoryBoundedPipeline:
+    """Diffusers pipeline wrapper that decodes latents in bounded memory"""
+
+    def __init__(self, pipe, budget_mb: Optional[int] = None, tile_size: Optional[int] = None,
+                 overlap: Optional[int] = None):
+        """
+        Turn on attention and VAE slicing and wrap the pipeline
+
+        Args:
+            pipe: Diffusers text-to-image pipeline
+            budget_mb: Peak RSS budget in MB (see memory_budget())
+            tile_size: Fixed tile side in pixels (None = chosen from the
+                memory left when decoding)
+            overlap: Overlap between tiles in pixels (uses Config.SD_VAE_TILE_OVERLAP)
+        """
+        self.pipe = pipe
+        self.budget = memory_budget(budget_mb)
+        self.tile_size = tile_size
+        self.overlap = Config.SD_VAE_TILE_OVERLAP if overlap is None else overlap
+
+        # One attention head at a time in the UNet, one image at a time in the VAE
+        pipe.enable_attention_slicing('max')
+        pipe.enable_vae_slicing()
+
+    def __getattr__(self, name):
+        # Scheduler, device, unet... come from the wrapped pipeline
+        return getattr(self.pipe, name)
+
+    def __call__(self, *args, **kwargs):
+        """Run the pipeline (same arguments and result as the wrapped one)"""
+        if kwargs.get('output_type', 'pil') != 'pil':
+            return self.pipe(*args, **kwargs)
+
+        kwargs['output_type'] = 'latent'
+        latents = self.pipe(*args, **kwargs).images
+        images = [self.decode(latents[i:i + 1]) for i in range(latents.shape[0])]
+        return types.SimpleNamespace(images=images, nsfw_content_detected=None)
+
+    def pick_tile_size(self, width: int, height: int, dtype_bytes: int = 4) -> int:
+        """Tile side (pixels) for an image, from the memory left in the budget"""
+        if self.tile_size:
+            return self.tile_size
+        free = None
+        if self.budget is not None:
+            free = max(0, self.budget - (current_rss() or 0) - SAFETY_MARGIN)
+        return choose_tile_size(free, width, height, dtype_bytes)
+
+    def decode(self, latents) -> Image.Image:
+        """
+        Decode one image's latents tile by tile
+
+        Args:
+            latents: Tensor (1, channels, height, width) returned by the
+                pipeline with output_type='latent'
+
+        Returns:
+            Decoded image
+        """
+        import torch
+
+        vae = self.pipe.vae
+        latents = latents / vae.config.scaling_factor
+        latent_height, latent_width = latents.shape[-2:]
+        dtype_bytes = torch.finfo(vae.dtype).bits // 8
+        tile = self.pick_tile_size(latent_width * LATENT_SCALE, latent_height * LATENT_SCALE, dtype_bytes)
+
+        def decode_tile(y0, y1, x0, x1):
+            with torch.no_grad():
+                sample = vae.decode(latents[:, :, y0:y1, x0:x1].to(vae.dtype)).sample
+            return (sample[0].float() / 2 + 0.5).clamp(0, 1).permute(1, 2, 0).cpu().numpy()
+
+        with span('vae.decode', tile=tile):
+            return decode_tiled(
+                decode_tile,
+                latent_height,
+                latent_width,
+                tile // LATENT_SCALE,
+                self.overlap // LATENT_SCALE
+            )
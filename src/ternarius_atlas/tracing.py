@@ -0,0 +1,278 @@
+"""
+Lightweight tracing of the pipeline stages
+
+Code marks the work it does with spans:
+
+    with span('llm.chapter', chapter=title):
+        ...
+
+or decorates a function with @traced('compose.page'). When tracing is off
+(the default) span() returns a shared no-op object, so instrumented code only
+pays for a function call and an attribute check. When it is on, every span is
+recorded with its thread and process and the trace can be exported to the
+Chrome trace format (chrome://tracing, Perfetto) or summarized as a table.
+
+Spans recorded in worker processes are sent back with the results and merged
+with add_events(); time.perf_counter() is system-wide, so their timestamps
+line up with the parent's.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .config import Config
+
+
+class _NullSpan:
+    """Span used while tracing is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Span being timed"""
+
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.start, duration, self.args)
+        return False
+
+    def set(self, **args):
+        """Attach extra arguments known only once the work started"""
+        self.args.update(args)
+
+
+class Tracer:
+    """Collect spans and export them"""
+
+    def __init__(self, enabled: bool = False):
+        """
+        Initialize an empty trace
+
+        Args:
+            enabled: Whether spans are recorded
+        """
+        self.enabled = enabled
+        # (name, start, duration, pid, thread id, thread name, args)
+        self.events: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **args):
+        """
+        Time a block of code
+
+        Args:
+            name: Span name (dotted, e.g. 'llm.chapter')
+            **args: Values shown with the span (must be JSON-serializable)
+
+        Returns:
+            Context manager timing the block
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name: str, start: float, duration: float, args: Optional[dict] = None):
+        """
+        Record a finished span
+
+        Args:
+            name: Span name
+            start: time.perf_counter() when the work started
+            duration: Seconds spent
+            args: Values shown with the span
+        """
+        thread = threading.current_thread()
+        event = (name, start, duration, os.getpid(), thread.ident, thread.name, args or {})
+        with self._lock:
+            self.events.append(event)
+
+    def add_events(self, events: List[tuple]):
+        """Merge spans recorded by another tracer (e.g. in a worker process)"""
+        with self._lock:
+            self.events.extend(tuple(event) for event in events)
+
+    def take_events(self) -> List[tuple]:
+        """Remove and return the recorded spans"""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def reset(self):
+        """Forget every recorded span"""
+        self.take_events()
+
+    def chrome_trace(self) -> dict:
+        """
+        Build the trace in the Chrome trace event format
+
+        Returns:
+            Dictionary ready to be written as JSON
+        """
+        with self._lock:
+            events = list(self.events)
+        origin = min((event[1] for event in events), default=0.0)
+
+        trace = []
+        threads = {}
+        for name, start, duration, pid, tid, thread_name, args in events:
+            threads[(pid, tid)] = thread_name
+            trace.append({
+                'name': name,
+                'cat': name.split('.', 1)[0],
+                'ph': 'X',
+                'ts': round((start - origin) * 1e6, 1),
+                'dur': round(duration * 1e6, 1),
+                'pid': pid,
+                'tid': tid,
+                'args': args,
+            })
+        for (pid, tid), thread_name in threads.items():
+            trace.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}})
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def export_chrome(self, path: str) -> str:
+        """
+        Write the trace as Chrome trace JSON
+
+        Args:
+            path: Output file (open it in chrome://tracing or ui.perfetto.dev)
+
+        Returns:
+            The output path
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False, default=str)
+        return path
+
+    def summary(self) -> List[Dict]:
+        """
+        Aggregate the spans by name
+
+        Returns:
+            One dictionary per span name with count, total, mean, p50, p95
+            and max in milliseconds, sorted by total time
+        """
+        with self._lock:
+            events = list(self.events)
+
+        durations: Dict[str, List[float]] = {}
+        for event in events:
+            durations.setdefault(event[0], []).append(event[2])
+
+        rows = []
+        for name, values in durations.items():
+            values.sort()
+            total = sum(values)
+            rows.append({
+                'name': name,
+                'count': len(values),
+                'total_ms': total * 1000,
+                'mean_ms': total / len(values) * 1000,
+                'p50_ms': values[int(0.50 * (len(values) - 1))] * 1000,
+                'p95_ms': values[int(0.95 * (len(values) - 1))] * 1000,
+                'max_ms': values[-1] * 1000,
+            })
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows
+
+    def format_summary(self) -> str:
+        """
+        Format the summary as a text table
+
+        Returns:
+            Table with one line per span name
+        """
+        lines = [f"{'span':32} {'count':>6} {'total ms':>11} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}"]
+        lines.append('-' * len(lines[0]))
+        for row in self.summary():
+            lines.append(
+                f"{row['name']:32} {row['count']:>6} {row['total_ms']:>11.1f} {row['mean_ms']:>10.1f} "
+                f"{row['p50_ms']:>10.1f} {row['p95_ms']:>10.1f} {row['max_ms']:>10.1f}"
+            )
+        return '\n'.join(lines)
+
+
+# Process-wide tracer used by the instrumented code
+tracer = Tracer(enabled=Config.TRACE_ENABLED)
+
+
+def span(name: str, **args):
+    """Time a block of code with the process-wide tracer (see Tracer.span)"""
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return _Span(tracer, name, args)
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorate a function so every call is recorded as a span
+
+    Args:
+        name: Span name
+
+    Returns:
+        Decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with _Span(tracer, name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StepTimer:
+    """Record one span per denoising step (diffusers' callback_on_step_end)"""
+
+    def __init__(self, trace: Tracer = None, name: str = 'diffusion.step'):
+        """
+        Args:
+            trace: Tracer receiving the spans (uses the process-wide tracer)
+            name: Span name of each step
+        """
+        self.tracer = trace or tracer
+        self.name = name
+        self._last = time.perf_counter()
+
+    def start(self):
+        """Mark the start of the first step"""
+        self._last = time.perf_counter()
+
+    def __call__(self, pipe, step: int, timestep, callback_kwargs: dict) -> dict:
+        now = time.perf_counter()
+        self.tracer.record(self.name, self._last, now - self._last, {'step': step})
+        self._last = now
+        return callback_kwargs
@@ -6,18 +6,39 @@ Gerador de imagens usando Stable Diffusion
 import torch
 from diffusers import StableDiffusionPipeline
 import os
+import sys
 from pathlib import Path
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from ternarius_atlas.config import Config
+from ternarius_atlas.tiled_vae import MemoryBoundedPipeline, available_memory, memory_bounded_enabled
+from ternarius_atlas.upscaler import Upscaler, native_size
+from ternarius_atlas.prompt_cache import CachedPromptPipeline
+from ternarius_atlas.schedulers import SchedulerProfiles
+
+# Tamanho de lote usado quando não é possível medir a memória livre
+DEFAULT_BATCH_SIZE = 2
+MAX_BATCH_SIZE = 8
+
 class StableDiffusionImageGenerator:
     """Gerador de imagens usando Stable Diffusion"""
     
-    def __init__(self, model_id="runwayml/stable-diffusion-v1-5", use_cpu=True):
+    supports_profiles = True  # generate_image aceita um perfil de renderização
+    
+    def __init__(self, model_id="runwayml/stable-diffusion-v1-5", use_cpu=True, memory_budget_mb=None,
+                 native_resolution=None, upscale_quality=None):
         """
         Inicializa o gerador Stable Diffusion
         
         Args:
             model_id: ID do modelo no Hugging Face
             use_cpu: Se True, usa CPU (mais lento mas funciona sem GPU)
+            memory_budget_mb: Pico de RAM permitido no modo de memória limitada
+                (None = TERNARIUS_SD_MEMORY_BUDGET_MB ou 75% da RAM)
+            native_resolution: Gerar na resolução nativa do modelo e ampliar
+                até o tamanho pedido (None = Config.SD_NATIVE_RESOLUTION)
+            upscale_quality: 'fast', 'balanced' ou 'quality' (None = Config.UPSCALE_QUALITY)
         """
         print(f"🔧 Carregando modelo Stable Diffusion: {model_id}")
         print("   ⚠️  Primeira execução vai baixar ~5GB de dados...")
@@ -42,14 +63,26 @@ class StableDiffusionImageGenerator:
         
         self.pipe = self.pipe.to(self.device)
         
-        # Otimizações para CPU
-        if use_cpu:
-            # Reduzir uso de memória
+        # Otimizações para CPU: attention slicing e VAE decodificado em blocos,
+        # para que páginas inteiras caibam no orçamento de memória
+        if memory_bounded_enabled(self.device):
+            self.pipe = MemoryBoundedPipeline(self.pipe, budget_mb=memory_budget_mb)
+        elif use_cpu:
             self.pipe.enable_attention_slicing()
         
+        # Negative prompt padrão e prompts repetidos não passam de novo pelo CLIP
+        self.pipe = CachedPromptPipeline(self.pipe)
+        
+        # Scheduler, steps e guidance de cada perfil (draft, standard, final)
+        self.profiles = SchedulerProfiles(self.pipe)
+        
+        self.native_resolution = Config.SD_NATIVE_RESOLUTION if native_resolution is None else native_resolution
+        self.upscaler = Upscaler(upscale_quality)
+        
         print("   ✅ Modelo carregado!")
     
-    def generate_image(self, prompt, negative_prompt="", width=512, height=512, num_inference_steps=25):
+    def generate_image(self, prompt, negative_prompt="", width=512, height=512, num_inference_steps=None,
+                       profile=None):
         """
         Gera uma imagem a partir de um prompt
         
@@ -58,7 +91,8 @@ class StableDiffusionImageGenerator:
             negative_prompt: Coisas a evitar na imagem
             width: Largura da imagem (múltiplo de 8)
             height: Altura da imagem (múltiplo de 8)
-            num_inference_steps: Número de steps (mais = melhor qualidade, mais lento)
+            num_inference_steps: Número de steps (None = o do perfil)
+            profile: 'draft', 'standard' ou 'final' (None = Config.RENDER_PROFILE)
         
         Returns:
             PIL Image
@@ -67,57 +101,190 @@ class StableDiffusionImageGenerator:
         width = (width // 8) * 8
         height = (height // 8) * 8
         
-        # Prompt otimizado para ilustrações infantis
-        enhanced_prompt = f"{prompt}, children's book illustration, soft pastel colors, cute style, watercolor, gentle, warm, friendly"
-        
-        # Negative prompt padrão
-        default_negative = "ugly, blurry, bad anatomy, dark, scary, violent, realistic photo, adult content"
-        full_negative = f"{negative_prompt}, {default_negative}" if negative_prompt else default_negative
+        enhanced_prompt = self._enhance_prompt(prompt)
+        full_negative = self._full_negative(negative_prompt)
         
         print(f"\n🎨 Gerando imagem...")
         print(f"   Prompt: {prompt[:80]}...")
-        print(f"   Tamanho: {width}x{height}")
-        print(f"   Steps: {num_inference_steps}")
+        generate_width, generate_height = self._generation_size(width, height)
+        print(f"   Tamanho: {width}x{height}"
+              + (f" (gerada em {generate_width}x{generate_height})" if generate_width != width else ""))
+        settings = self._profile_settings(profile, num_inference_steps)
+        print(f"   Perfil: {profile or Config.RENDER_PROFILE} ({settings['num_inference_steps']} steps)")
         
         # Gerar imagem
         with torch.no_grad():
             result = self.pipe(
                 enhanced_prompt,
                 negative_prompt=full_negative,
-                width=width,
-                height=height,
-                num_inference_steps=num_inference_steps,
-                guidance_scale=7.5
+                width=generate_width,
+                height=generate_height,
+                **settings
+            )
+        
+        return self.upscaler.upscale(result.images[0], (width, height))
+    
+    def _profile_settings(self, profile, num_inference_steps=None):
+        """Aplica o scheduler do perfil; steps explícitos substituem os do perfil"""
+        settings = self.profiles.apply(profile)
+        if num_inference_steps:
+            settings['num_inference_steps'] = num_inference_steps
+        return settings
+    
+    def _generation_size(self, width, height):
+        """Tamanho em que a UNet roda (nativo do modelo, ampliado depois)"""
+        if self.native_resolution:
+            return native_size(width, height)
+        return width, height
+    
+    def _enhance_prompt(self, prompt):
+        """Prompt otimizado para ilustrações infantis"""
+        return f"{prompt}, children's book illustration, soft pastel colors, cute style, watercolor, gentle, warm, friendly"
+    
+    def _full_negative(self, negative_prompt=""):
+        """Negative prompt padrão, somado ao negative prompt informado"""
+        default_negative = "ugly, blurry, bad anatomy, dark, scary, violent, realistic photo, adult content"
+        return f"{negative_prompt}, {default_negative}" if negative_prompt else default_negative
+    
+    def _available_memory(self):
+        """Memória livre (bytes) no dispositivo usado, ou None se não for possível medir"""
+        if self.device == "cuda":
+            free, _ = torch.cuda.mem_get_info()
+            return free
+        
+        return available_memory()
+    
+    def _auto_batch_size(self, width, height):
+        """
+        Estima quantas imagens cabem num único passo da UNet
+        
+        Estimativa conservadora: ~2.6 KB de ativações por pixel em fp16 (o
+        dobro em fp32), vezes 2 por causa do classifier-free guidance.
+        """
+        available = self._available_memory()
+        if available is None:
+            return DEFAULT_BATCH_SIZE
+        
+        bytes_per_pixel = 2600 * (2 if self.pipe.unet.dtype == torch.float32 else 1)
+        per_image = width * height * bytes_per_pixel * 2
+        # Deixar metade da memória livre para pesos, VAE e o resto do sistema
+        return max(1, min(MAX_BATCH_SIZE, int(available * 0.5 // per_image)))
+    
+    def _run_micro_batch(self, jobs, width, height, profile, num_inference_steps):
+        """Executa uma única chamada do pipeline para vários prompts"""
+        generators = None
+        if any(job['seed'] is not None for job in jobs):
+            generators = [
+                torch.Generator(self.device).manual_seed(
+                    job['seed'] if job['seed'] is not None else int(torch.randint(0, 2**31 - 1, (1,)))
+                )
+                for job in jobs
+            ]
+        
+        generate_width, generate_height = self._generation_size(width, height)
+        settings = self._profile_settings(profile, num_inference_steps)
+        with torch.no_grad():
+            result = self.pipe(
+                prompt=[self._enhance_prompt(job['prompt']) for job in jobs],
+                negative_prompt=[self._full_negative(job['negative_prompt']) for job in jobs],
+                width=generate_width,
+                height=generate_height,
+                generator=generators,
+                **settings
             )
         
-        return result.images[0]
+        return [self.upscaler.upscale(image, (width, height)) for image in result.images]
     
-    def generate_batch(self, prompts, output_dir, **kwargs):
+    def generate_batch(self, prompts, output_dir, batch_size=None, seeds=None, **kwargs):
         """
         Gera múltiplas imagens em lote
         
+        Prompts com mesma resolução, perfil e número de steps são agrupados
+        em micro-lotes, e cada micro-lote é uma única chamada do pipeline.
+        
         Args:
-            prompts: Lista de prompts
+            prompts: Lista de prompts (texto, ou dict com 'prompt' e opcionalmente
+                'negative_prompt', 'width', 'height', 'profile',
+                'num_inference_steps', 'seed')
             output_dir: Diretório para salvar
-            **kwargs: Argumentos para generate_image
+            batch_size: Máximo de imagens por micro-lote (None = pela memória livre)
+            seeds: Lista de sementes, uma por prompt (opcional)
+            **kwargs: Valores padrão de negative_prompt, width, height, profile
+                e num_inference_steps
+        
+        Returns:
+            Lista de caminhos das imagens, na ordem dos prompts
         """
         Path(output_dir).mkdir(parents=True, exist_ok=True)
         
-        images = []
-        for i, prompt in enumerate(prompts, 1):
-            print(f"\n📄 Imagem {i}/{len(prompts)}")
-            image = self.generate_image(prompt, **kwargs)
+        defaults = {
+            'negative_prompt': kwargs.get('negative_prompt', ""),
+            'width': kwargs.get('width', 512),
+            'height': kwargs.get('height', 512),
+            'profile': kwargs.get('profile') or Config.RENDER_PROFILE,
+            'num_inference_steps': kwargs.get('num_inference_steps'),
+        }
+        
+        # Agrupar prompts por (largura, altura, perfil, steps), preservando a ordem
+        groups = {}
+        for index, item in enumerate(prompts):
+            job = dict(defaults, seed=seeds[index] if seeds else None)
+            job.update(item if isinstance(item, dict) else {'prompt': item})
+            job['index'] = index
+            job['width'] = (job['width'] // 8) * 8
+            job['height'] = (job['height'] // 8) * 8
+            key = (job['width'], job['height'], job['profile'], job['num_inference_steps'])
+            groups.setdefault(key, []).append(job)
+        
+        images = [None] * len(prompts)
+        pending = {}
+        next_to_save = 0
+        
+        for (width, height, profile, steps), jobs in groups.items():
+            size = batch_size or self._auto_batch_size(*self._generation_size(width, height))
+            print(f"\n🎨 {len(jobs)} imagens {width}x{height}, perfil {profile}"
+                  + (f", {steps} steps" if steps else "") + f" (lotes de até {size})")
             
-            # Salvar
-            filename = f"image_{i:03d}.png"
-            filepath = os.path.join(output_dir, filename)
-            image.save(filepath)
-            images.append(filepath)
-            print(f"   ✅ Salva: {filename}")
+            start = 0
+            while start < len(jobs):
+                chunk = jobs[start:start + size]
+                try:
+                    results = self._run_micro_batch(chunk, width, height, profile, steps)
+                except (RuntimeError, MemoryError) as e:
+                    if not _is_out_of_memory(e) or size == 1:
+                        raise
+                    size = max(1, size // 2)
+                    if self.device == "cuda":
+                        torch.cuda.empty_cache()
+                    print(f"   ⚠️  Memória insuficiente, reduzindo lote para {size}")
+                    continue
+                
+                for job, image in zip(chunk, results):
+                    pending[job['index']] = image
+                start += len(chunk)
+                print(f"   ✅ {start}/{len(jobs)} imagens geradas")
+                
+                # Salvar na ordem das páginas assim que possível
+                while next_to_save in pending:
+                    image = pending.pop(next_to_save)
+                    filename = f"image_{next_to_save + 1:03d}.png"
+                    filepath = os.path.join(output_dir, filename)
+                    image.save(filepath)
+                    images[next_to_save] = filepath
+                    print(f"   💾 Salva: {filename}")
+                    next_to_save += 1
         
         return images
 
 
+def _is_out_of_memory(error):
+    """Verifica se o erro foi falta de memória (GPU ou CPU)"""
+    if isinstance(error, MemoryError):
+        return True
+    message = str(error).lower()
+    return "out of memory" in message or "can't allocate memory" in message
+
+
 def test_generator():
     """Teste rápido do gerador"""
     print("=" * 70)
@@ -135,7 +302,7 @@ def test_generator():
         test_prompt,
         width=512,
         height=512,
-        num_inference_steps=20  # Menos steps para teste rápido
+        profile="draft"  # Rascunho: poucos steps para teste rápido
     )
     
     # Salvar
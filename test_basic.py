@@ -11,6 +11,46 @@ import os
 src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
 sys.path.insert(0, src_path)
 
+
+class FakeResponse:
+    """Stand-in for a Gemini response (or a streamed chunk of one)"""
+    
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeModel:
+    """
+    Stand-in for a Gemini model answering with canned text
+    
+    reply is the answer text, or a function returning it for a prompt.
+    Every call's prompt and keyword arguments are recorded; streamed answers
+    are split into chunks of chunk_size characters.
+    """
+    
+    def __init__(self, reply, chunk_size=None):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.prompts = []
+        self.calls = []
+        self.sent = 0
+    
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.prompts.append(prompt)
+        self.calls.append(kwargs)
+        text = self.reply(prompt) if callable(self.reply) else self.reply
+        if stream:
+            return self._stream(text)
+        return FakeResponse(text)
+    
+    def _stream(self, text):
+        size = self.chunk_size or max(len(text), 1)
+        for start in range(0, len(text), size):
+            self.sent += 1
+            yield FakeResponse(text[start:start + size])
+
+
 def test_imports():
     """Test that all modules can be imported"""
     print("Testing module imports...")
@@ -80,6 +120,21 @@ def test_page_composer():
         
         print(f"✅ Content page created: {content_page.size}")
         
+        # Tinting only the band matches compositing a full-frame RGBA overlay
+        from PIL import Image, ImageDraw
+        from ternarius_atlas.page_composer import blend_rectangle
+        
+        background = Image.effect_noise((120, 90), 80).convert('RGB')
+        for box, alpha in [((10, 20, 111, 61), 200), ((0, 50, 120, 90), 220), ((-5, -5, 40, 200), 128)]:
+            overlay = Image.new('RGBA', background.size, (0, 0, 0, 0))
+            ImageDraw.Draw(overlay).rectangle([box[:2], (box[2] - 1, box[3] - 1)], fill=(255, 255, 255, alpha))
+            expected = Image.alpha_composite(background.convert('RGBA'), overlay).convert('RGB')
+            if blend_rectangle(background.copy(), box, (255, 255, 255), alpha).tobytes() != expected.tobytes():
+                print(f"❌ blend_rectangle differs from the full-frame overlay for {box}")
+                return False
+        
+        print("✅ Text band blending matches the full-frame overlay")
+        
         return True
         
     except Exception as e:
@@ -117,22 +172,2212 @@ def test_image_generator():
         return False
 
 
-def main():
-    """Run all tests"""
+def test_concurrent_chapters():
+    """Test that chapters are generated concurrently and pages stay in order"""
+    print("\nTesting concurrent chapter pipeline...")
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import tempfile
+        import threading
+        import time
+        from ternarius_atlas import EbookGenerator
+        
+        class FakeTextGenerator:
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.in_flight = 0
+                self.max_in_flight = 0
+            
+            def generate_ebook_structure(self, theme, num_chapters):
+                return {'title': 'Livro Teste', 'chapters': [f"Cap {i}" for i in range(1, num_chapters + 1)]}
+            
+            def generate_chapter_content(self, theme, chapter_title, max_pages):
+                with self.lock:
+                    self.in_flight += 1
+                    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                time.sleep(0.2)
+                with self.lock:
+                    self.in_flight -= 1
+                return [f"{chapter_title} página {i}" for i in range(1, max_pages + 1)]
+            
+            def generate_image_prompt(self, theme, chapter_title, page_content):
+                time.sleep(0.1)
+                return f"Ilustração de {chapter_title}"
+        
+        with tempfile.TemporaryDirectory() as output_dir:
+            generator = EbookGenerator(output_dir=output_dir)
+            fake = FakeTextGenerator()
+            generator.text_generator = fake
+            writers = sum(thread.name == 'image-writer' for thread in threading.enumerate())
+            
+            pages = generator.generate_ebook("Teste", num_chapters=4, pages_per_chapter=2, max_workers=4,
+                                     batch_chapters=False)
+            
+            if sum(thread.name == 'image-writer' for thread in threading.enumerate()) != writers:
+                print("❌ The image writer thread was left running")
+                return False
+            
+            names = [os.path.basename(p) for p in pages]
+            expected = ["page_000_cover.png", "page_001_title.png"] + [
+                f"page_{2 + (c - 1) * 2 + (p - 1):03d}_ch{c}_p{p}.png" for c in range(1, 5) for p in range(1, 3)
+            ]
+            if names != expected:
+                print(f"❌ Unexpected page order: {names}")
+                return False
+            
+            if fake.max_in_flight < 2:
+                print("❌ Chapters did not run concurrently")
+                return False
+        
+        print(f"✅ {len(pages)} pages generated in order ({fake.max_in_flight} chapters in flight)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Concurrent chapter test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_response_cache():
+    """Test that identical LLM requests are served from the response cache"""
+    print("\nTesting LLM response cache...")
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import tempfile
+        from ternarius_atlas.response_cache import ResponseCache
+        from ternarius_atlas.text_generator import TextGenerator
+        
+        def numbered_model():
+            # Answers "resposta N" to its N-th call
+            model = FakeModel(lambda prompt: f"resposta {len(model.calls)}")
+            return model
+        
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache_path = os.path.join(cache_dir, "responses.sqlite3")
+            
+            generator = TextGenerator(cache=ResponseCache(cache_path))
+            generator.model = numbered_model()
+            first = generator.generate_image_prompt("Tema", "Capítulo", "Conteúdo")
+            second = generator.generate_image_prompt("Tema", "Capítulo", "Conteúdo")
+            if first != second or len(generator.model.calls) != 1:
+                print(f"❌ Expected one model call, got {len(generator.model.calls)}")
+                return False
+            generator.cache.close()
+            
+            # A read-only cache serves hits but never stores misses
+            rebuild = TextGenerator(cache=ResponseCache(cache_path, read_only=True))
+            rebuild.model = numbered_model()
+            if rebuild.generate_image_prompt("Tema", "Capítulo", "Conteúdo") != first or rebuild.model.calls:
+                print("❌ Read-only cache did not serve the stored response")
+                return False
+            rebuild.generate_image_prompt("Tema", "Outro capítulo", "Conteúdo")
+            rebuild.generate_image_prompt("Tema", "Outro capítulo", "Conteúdo")
+            if len(rebuild.model.calls) != 2:
+                print("❌ Read-only cache stored a new response")
+                return False
+            rebuild.cache.close()
+            
+            # Expired entries are dropped and LRU eviction keeps the size bounded
+            expiring = ResponseCache(os.path.join(cache_dir, "ttl.sqlite3"), ttl=-1)
+            expiring.set("a", "x")
+            if expiring.get("a") is not None:
+                print("❌ Expired entry was served")
+                return False
+            expiring.close()
+            
+            bounded = ResponseCache(os.path.join(cache_dir, "lru.sqlite3"), max_bytes=10)
+            bounded.set("a", "12345")
+            bounded.set("b", "12345")
+            bounded.get("a")
+            bounded.set("c", "12345")
+            if bounded.get("b") is not None or bounded.get("a") != "12345" or bounded.get("c") != "12345":
+                print("❌ LRU eviction removed the wrong entry")
+                return False
+            bounded.close()
+        
+        print("✅ Cache hits, read-only mode, TTL and LRU eviction work")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Response cache test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_text_wrapping():
+    """Test that the shared wrapping engine matches per-line textbbox measurement"""
+    print("\nTesting text wrapping engine...")
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import random
+        from PIL import Image, ImageDraw, ImageFont
+        from ternarius_atlas.text_layout import wrap_text
+        
+        draw = ImageDraw.Draw(Image.new('RGB', (10, 10)))
+        
+        def reference_wrap(text, max_width, font, strict=False):
+            lines = []
+            current_line = []
+            for word in text.split():
+                bbox = draw.textbbox((0, 0), ' '.join(current_line + [word]), font=font)
+                line_width = bbox[2] - bbox[0]
+                if line_width < max_width or (line_width == max_width and not strict):
+                    current_line.append(word)
+                else:
+                    if current_line:
+                        lines.append(' '.join(current_line))
+                    current_line = [word]
+            if current_line:
+                lines.append(' '.join(current_line))
+            return lines
+        
+        rng = random.Random(42)
+        vocabulary = ("Era uma vez um pequeno coelho que vivia num jardim cheio de flores, "
+                      "borboletas coloridas e árvores frutíferas; todos os dias ele explorava "
+                      "novos caminhos!").split()
+        font = ImageFont.load_default()
+        
+        for max_width in (40, 120, 300, 700):
+            for _ in range(25):
+                text = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 120)))
+                if wrap_text(text, max_width, font) != reference_wrap(text, max_width, font):
+                    print(f"❌ Line breaks differ for width {max_width}")
+                    return False
+        
+        # TrueType fonts kern and round between words: summed word widths
+        # alone would break 'TT To' at exactly its measured width
+        try:
+            serif = ImageFont.truetype('DejaVuSerif.ttf', 31)
+        except OSError:
+            serif = None
+            print("⚠️  DejaVuSerif not installed, skipping the kerning cases")
+        if serif is not None:
+            if wrap_text('TT To', 92, serif) != ['TT To']:
+                print(f"❌ Kerned line was broken early: {wrap_text('TT To', 92, serif)}")
+                return False
+            kerning_words = "TT To AV Va LT Yo Wa T. V, Te Tr Av Ly Pa AVATAR Tomás Vovó Yara".split()
+            for _ in range(300):
+                text = ' '.join(rng.choice(kerning_words) for _ in range(rng.randint(1, 40)))
+                max_width = rng.randint(60, 700)
+                for strict in (False, True):
+                    if wrap_text(text, max_width, serif, strict) != reference_wrap(text, max_width, serif, strict):
+                        print(f"❌ Kerned line breaks differ for width {max_width} (strict={strict})")
+                        return False
+        
+        print("✅ Line breaks match the reference implementation")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Text wrapping test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_font_registry():
+    """Test that fonts are loaded once, shared and honour the configured sizes"""
+    print("\nTesting font registry...")
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        from ternarius_atlas.config import Config
+        from ternarius_atlas.fonts import FontRegistry, get_font
+        from ternarius_atlas.page_composer import PageComposer
+        
+        if get_font(Config.DEFAULT_FONT_SIZE) is not get_font(Config.DEFAULT_FONT_SIZE):
+            print("❌ Registry returned different instances for the same font")
+            return False
+        
+        composer = PageComposer(Config())
+        if composer.font is not get_font(Config.DEFAULT_FONT_SIZE):
+            print("❌ PageComposer does not use the shared font")
+            return False
+        
+        if getattr(composer.title_font, 'size', Config.DEFAULT_TITLE_FONT_SIZE) != Config.DEFAULT_TITLE_FONT_SIZE:
+            print(f"❌ Title font size is {composer.title_font.size}")
+            return False
+        
+        # Missing families fall back to the default font instead of failing
+        registry = FontRegistry(default_family="FamiliaInexistente", fallback_families=[], font_dirs=[])
+        if registry.get(18) is None or "default" not in registry.fingerprint():
+            print("❌ Missing family did not fall back to the default font")
+            return False
+        
+        print(f"✅ Shared fonts loaded ({get_font(Config.DEFAULT_FONT_SIZE).getname()[0]})")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Font registry test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_gradients():
+    """Test the vectorized gradient engine against per-row drawing"""
+    print("\nTesting gradient engine...")
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        from PIL import Image, ImageDraw
+        from ternarius_atlas.gradients import linear_gradient, radial_gradient
+        
+        # The Genesis pages' color pairs match per-row drawing exactly
+        width, height = 8, 1200
+        pairs = [
+            ((230, 230, 250), (255, 229, 180)),
+            ((173, 216, 230), (255, 218, 224)),
+            ((173, 216, 230), (189, 252, 201)),
+            ((173, 216, 230), (255, 229, 180)),
+            ((200, 200, 210), (173, 216, 230)),
+            ((189, 252, 201), (255, 229, 180)),
+            ((255, 218, 224), (230, 230, 250)),
+            ((230, 230, 250), (230, 230, 250)),
+        ]
+        for color1, color2 in pairs:
+            reference = Image.new('RGB', (width, height))
+            draw = ImageDraw.Draw(reference)
+            for y in range(height):
+                ratio = y / height
+                fill = tuple(int(color1[c] * (1 - ratio) + color2[c] * ratio) for c in range(3))
+                draw.line([(0, y), (width, y)], fill=fill)
+            
+            gradient = linear_gradient(width, height, [color1, color2])
+            if gradient.size != (width, height) or gradient.tobytes() != reference.tobytes():
+                print(f"❌ Linear gradient {color1} -> {color2} differs from per-row drawing")
+                return False
+        
+        stops = linear_gradient(10, 100, [(0, 0, 0), (200, 0, 0), (200, 200, 200)], positions=[0, 0.5, 1])
+        if stops.getpixel((0, 50)) != (200, 0, 0):
+            print(f"❌ Multi-stop gradient has wrong middle color {stops.getpixel((0, 50))}")
+            return False
+        
+        radial = radial_gradient(101, 101, [(255, 255, 255), (0, 0, 100)], center=(50, 50), radius=50)
+        if radial.getpixel((50, 50)) != (255, 255, 255) or radial.getpixel((0, 0)) != (0, 0, 100):
+            print("❌ Radial gradient has wrong center or edge color")
+            return False
+        
+        print("✅ Linear, multi-stop and radial gradients render correctly")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Gradient test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_sd_worker():
+    """Test the persistent image worker with a stub pipeline"""
+    print("\nTesting persistent image worker...")
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import threading
+        from PIL import Image
+        from ternarius_atlas.sd_worker import SDWorker, SDWorkerClient
+        
+        loads = []
+        
+        class StubResult:
+            def __init__(self, images):
+                self.images = images
+        
+        def stub_pipeline(prompt, width=512, height=512, **kwargs):
+            return StubResult([Image.new('RGB', (width, height), (len(prompt), 100, 200))])
+        
+        def stub_factory():
+            loads.append(1)
+            return stub_pipeline
+        
+        worker = SDWorker(stub_factory, address=('127.0.0.1', 0), authkey=b'test')
+        thread = threading.Thread(target=worker.serve_forever, daemon=True)
+        thread.start()
+        worker.wait_until_listening(5)
+        
+        client = SDWorkerClient(worker.address, authkey=b'test')
+        first, _ = client.generate("coelho", width=64, height=32)
+        second = client.generate_image("jardim florido", width=70, height=40)
+        # A worker started with another key is reported, not mistaken for a crash
+        try:
+            SDWorkerClient(worker.address, authkey=b'other').ping()
+            print("❌ A worker with another auth key was accepted")
+            return False
+        except RuntimeError:
+            pass
+        status = client.ping()
+        client.shutdown()
+        thread.join(5)
+        
+        if first.size != (64, 32) or first.getpixel((0, 0)) != (6, 100, 200):
+            print(f"❌ Unexpected image from worker: {first.size}")
+            return False
+        if second.size != (64, 40):
+            print(f"❌ Sizes were not rounded to multiples of 8: {second.size}")
+            return False
+        if len(loads) != 1 or status['jobs_done'] != 2:
+            print(f"❌ Pipeline loaded {len(loads)} times for {status['jobs_done']} jobs")
+            return False
+        if thread.is_alive():
+            print("❌ Worker did not shut down")
+            return False
+        
+        # Without an override, the key is random and private to the user
+        import stat
+        import tempfile
+        from ternarius_atlas.config import Config
+        from ternarius_atlas.sd_worker import load_authkey
+        
+        override = Config.SD_WORKER_AUTHKEY
+        Config.SD_WORKER_AUTHKEY = None
+        try:
+            with tempfile.TemporaryDirectory() as folder:
+                key_path = os.path.join(folder, '.cache', 'sd_worker.key')
+                key = load_authkey(key_path)
+                if len(key) < 32 or load_authkey(key_path) != key:
+                    print("❌ Auth key was not created once and reused")
+                    return False
+                if os.name != 'nt' and stat.S_IMODE(os.stat(key_path).st_mode) != 0o600:
+                    print(f"❌ Key file is readable by others: {oct(os.stat(key_path).st_mode)}")
+                    return False
+                if load_authkey(os.path.join(folder, 'other.key')) == key:
+                    print("❌ Auth keys are not random")
+                    return False
+                
+                # Processes starting at once all end up with the same complete key
+                shared_path = os.path.join(folder, 'shared.key')
+                keys = []
+                threads = [
+                    threading.Thread(target=lambda: keys.append(load_authkey(shared_path)))
+                    for _ in range(8)
+                ]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                with open(shared_path, 'rb') as f:
+                    published = f.read()
+                if set(keys) != {published} or len(os.listdir(folder)) != 3:
+                    print(f"❌ Concurrent starts got different keys: {set(keys)}, {os.listdir(folder)}")
+                    return False
+        finally:
+            Config.SD_WORKER_AUTHKEY = override
+        
+        print("✅ Worker served 2 jobs from a single pipeline load")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Image worker test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_build_manifest():
+    """Test that the build manifest only flags changed pages as stale"""
+    print("\n" + "=" * 60)
+    print("Testing Build Manifest")
     print("=" * 60)
-    print("🧪 Running Ternarius Atlas Tests")
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import tempfile
+        from ternarius_atlas.build_manifest import BuildManifest, hash_inputs
+        
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, 'page_001_final.png')
+            with open(output, 'wb') as f:
+                f.write(b'first render')
+            
+            inputs = hash_inputs('page', 'Título', 'Texto', 1)
+            manifest = BuildManifest(folder)
+            manifest.record('pages', 1, inputs, output)
+            manifest.save()
+            
+            # Reload from disk like a new run would
+            manifest = BuildManifest(folder)
+            if not manifest.is_current('pages', 1, inputs):
+                print("❌ Unchanged page was marked stale")
+                return False
+            if manifest.is_current('pages', 1, hash_inputs('page', 'Título', 'Texto corrigido', 1)):
+                print("❌ Page with edited text was marked current")
+                return False
+            if manifest.is_current('pages', 2, inputs):
+                print("❌ Unknown page was marked current")
+                return False
+            
+            # Same content with a new mtime is still current
+            stat = os.stat(output)
+            os.utime(output, (stat.st_atime, stat.st_mtime + 10))
+            if not manifest.is_current('pages', 1, inputs):
+                print("❌ Touched but unchanged output was marked stale")
+                return False
+            
+            with open(output, 'wb') as f:
+                f.write(b'edited by hand')
+            if manifest.is_current('pages', 1, inputs):
+                print("❌ Modified output was marked current")
+                return False
+            
+            os.remove(output)
+            if manifest.is_current('pages', 1, inputs):
+                print("❌ Missing output was marked current")
+                return False
+        
+        print("✅ Only changed pages are rebuilt")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Build manifest test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_image_profile_switch():
+    """Test that a rebuild after switching the image profile writes and uses the new files"""
+    print("\n" + "=" * 60)
+    print("Testing Image Profile Switch")
     print("=" * 60)
     
-    results = []
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import contextlib
+        import io
+        import tempfile
+        from PIL import Image
+        from main import InteractiveEbookGenerator
+        from ternarius_atlas.image_writer import ImageWriter
+        
+        class FakeImageGenerator:
+            def __init__(self):
+                self.calls = 0
+            
+            def generate_image(self, prompt, width=512, height=512):
+                self.calls += 1
+                return Image.new('RGB', (width // 4, height // 4), (180, 200, 160))
+        
+        images = FakeImageGenerator()
+        pages = [
+            {'type': 'cover', 'title': 'Livro', 'text': '', 'illustration_description': 'capa'},
+            {'type': 'content', 'title': 'Início', 'text': 'Era uma vez.', 'illustration_description': 'campo'},
+        ]
+        
+        def build(folder, profile):
+            generator = InteractiveEbookGenerator(image_generator=images, output_root=folder)
+            generator.composite_workers = 1
+            generator.image_writer = ImageWriter(profile)
+            generator.book_structure = {'title': 'Livro', 'pages': pages}
+            generator.book_title = 'Livro'
+            generator.output_folder = folder
+            with contextlib.redirect_stdout(io.StringIO()):
+                generator.generate_images(verbose=False)
+                final_pages = generator.compose_final_pages(verbose=False)
+            generator.close()
+            return generator.book_structure['images'], final_pages
+        
+        with tempfile.TemporaryDirectory() as folder:
+            build(folder, 'fast_png')
+            calls = images.calls
+            
+            # Switching the format (and editing a page) rebuilds with the new extension
+            pages[1]['text'] = 'Era uma vez, de novo.'
+            image_paths, final_pages = build(folder, 'jpeg')
+            if images.calls - calls != len(pages):
+                print(f"❌ Expected every image to be regenerated, got {images.calls - calls}")
+                return False
+            for path in image_paths + final_pages:
+                if not path.endswith('.jpg') or not os.path.exists(path):
+                    print(f"❌ Missing output after the profile switch: {path}")
+                    return False
+        
+        print("✅ Outputs recorded with another format are rebuilt")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Image profile switch test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_parallel_compositing():
+    """Test that pages composited in worker processes match in-process ones"""
+    print("\n" + "=" * 60)
+    print("Testing Parallel Page Compositing")
+    print("=" * 60)
     
-    # Test imports
-    results.append(("Import Test", test_imports()))
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import tempfile
+        from PIL import Image
+        from ternarius_atlas.compositing import compose_pages, make_page_spec
+        
+        with tempfile.TemporaryDirectory() as folder:
+            image_path = os.path.join(folder, 'image.png')
+            Image.new('RGB', (400, 600), (120, 160, 200)).save(image_path)
+            
+            pages = [{'type': 'cover', 'title': 'Livro de Teste'}] + [
+                {'type': 'content', 'title': f'Página {i}', 'text': 'Texto da página. ' * 20}
+                for i in range(2, 6)
+            ]
+            
+            outputs = {}
+            for workers in (1, 2):
+                specs = [
+                    make_page_spec(page, i, image_path, os.path.join(folder, f'w{workers}_{i}.png'))
+                    for i, page in enumerate(pages, 1)
+                ]
+                done = list(compose_pages(specs, workers=workers))
+                if len(done) != len(pages):
+                    print(f"❌ {workers} worker(s) returned {len(done)} pages")
+                    return False
+                outputs[workers] = {
+                    spec['page_number']: Image.open(path).tobytes() for spec, path in done
+                }
+            
+            if outputs[1] != outputs[2]:
+                print("❌ Pages composited in worker processes differ")
+                return False
+        
+        print(f"✅ {len(pages)} pages composited identically in worker processes")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Parallel compositing test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_lazy_import():
+    """Test that layout modules import without the API key or the Gemini SDK"""
+    print("\n" + "=" * 60)
+    print("Testing Lazy Package Import")
+    print("=" * 60)
     
-    # Test page composer
-    results.append(("Page Composer Test", test_page_composer()))
+    try:
+        import subprocess
+        import tempfile
+        
+        code = (
+            "import sys\n"
+            "from ternarius_atlas.page_composer import PageComposer\n"
+            "import ternarius_atlas\n"
+            "PageComposer()\n"
+            "assert 'google.generativeai' not in sys.modules, 'Gemini SDK was imported'\n"
+            "assert 'ternarius_atlas.ebook_generator' not in sys.modules, 'EbookGenerator was imported'\n"
+            "assert ternarius_atlas.EbookGenerator.__name__ == 'EbookGenerator'\n"
+        )
+        env = {k: v for k, v in os.environ.items() if k != 'GEMINI_API_KEY'}
+        env['PYTHONPATH'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+        
+        # Run from an empty directory so no .env file provides the key
+        with tempfile.TemporaryDirectory() as folder:
+            result = subprocess.run(
+                [sys.executable, '-c', code],
+                cwd=folder, env=env, capture_output=True, text=True, timeout=120
+            )
+        
+        if result.returncode != 0:
+            print(f"❌ Import without API key failed:\n{result.stderr}")
+            return False
+        
+        print("✅ PageComposer imports without the API key or the Gemini SDK")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Lazy import test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_streaming_structure():
+    """Test that structure pages are emitted while the response is still streaming"""
+    print("\n" + "=" * 60)
+    print("Testing Streaming Structure Generation")
+    print("=" * 60)
     
-    # Test image generator
-    results.append(("Image Generator Test", test_image_generator()))
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import tempfile
+        from ternarius_atlas.text_generator import TextGenerator
+        from ternarius_atlas.response_cache import ResponseCache
+        
+        response = (
+            "TÍTULO: O Livro das Estrelas\n"
+            "DESCRIÇÃO: Uma viagem pelo céu noturno.\n"
+            "TOTAL_PÁGINAS: 3\n\n"
+            "---PÁGINA 1---\nTIPO: cover\nTÍTULO: O Livro das Estrelas\nTEXTO:\n"
+            "ILUSTRAÇÃO: Céu estrelado\n\n"
+            "---PÁGINA 2---\nTIPO: chapter\nTÍTULO: As Constelações\n"
+            "TEXTO: Primeira linha.\nSegunda linha.\nILUSTRAÇÃO: Constelações\n\n"
+            "---PÁGINA 3---\nTIPO: content\nTÍTULO: A Lua\nTEXTO: A Lua brilha.\n"
+            "ILUSTRAÇÃO: Lua cheia\n"
+        )
+        # Canned chunks that split lines and markers at arbitrary points
+        chunk_count = (len(response) + 16) // 17
+        
+        with tempfile.TemporaryDirectory() as cache_dir:
+            generator = TextGenerator(cache=ResponseCache(os.path.join(cache_dir, "responses.sqlite3")))
+            generator.model = FakeModel(response, chunk_size=17)
+            
+            received = []
+            for page in generator.stream_detailed_ebook_structure("Estrelas"):
+                received.append((page, generator.model.sent))
+            
+            titles = [page['title'] for page, _ in received]
+            if titles != ["O Livro das Estrelas", "As Constelações", "A Lua"]:
+                print(f"❌ Unexpected pages: {titles}")
+                return False
+            if received[0][1] >= chunk_count:
+                print("❌ First page was only emitted after the whole response")
+                return False
+            if received[1][0]['text'] != "Primeira linha. Segunda linha.":
+                print(f"❌ Multiline text was not joined: {received[1][0]['text']!r}")
+                return False
+            
+            # The full structure keeps the book title; cached text goes through the same parser
+            structure = generator.generate_detailed_ebook_structure("Estrelas")
+            if len(generator.model.calls) != 1:
+                print(f"❌ Cached response was requested again ({len(generator.model.calls)} calls)")
+                return False
+            if structure['title'] != "O Livro das Estrelas" or structure['total_pages'] != 3:
+                print(f"❌ Unexpected structure header: {structure['title']!r}")
+                return False
+            if [page['title'] for page in structure['pages']] != titles:
+                print("❌ Cached structure differs from the streamed pages")
+                return False
+            generator.cache.close()
+        
+        print(f"✅ First page emitted after {received[0][1]}/{chunk_count} chunks")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Streaming structure test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_batch_mode():
+    """Test that batch mode builds several books and resumes after a failure"""
+    print("\n" + "=" * 60)
+    print("Testing Batch Mode")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import json
+        import tempfile
+        import threading
+        from PIL import Image
+        from batch import BatchRunner, load_jobs
+        
+        class FakeTextGenerator:
+            def __init__(self):
+                self.calls = []
+            
+            def stream_detailed_ebook_structure(self, theme, parser):
+                self.calls.append(theme)
+                name = theme.split('\n')[0]
+                response = (
+                    f"TÍTULO: Livro de {name}\nDESCRIÇÃO: Teste\n"
+                    f"---PÁGINA 1---\nTIPO: cover\nTÍTULO: Livro de {name}\nILUSTRAÇÃO: capa\n"
+                    f"---PÁGINA 2---\nTIPO: content\nTÍTULO: Início\nTEXTO: Era uma vez.\nILUSTRAÇÃO: {name}\n"
+                )
+                yield from parser.feed(response)
+                yield from parser.close()
+        
+        class FlakyImageGenerator:
+            def __init__(self):
+                self.calls = 0
+                self.fail_on = None
+            
+            def generate_image(self, prompt, width=512, height=512):
+                self.calls += 1
+                if prompt == self.fail_on:
+                    raise RuntimeError("falha simulada")
+                return Image.new('RGB', (width // 4, height // 4), (200, 180, 160))
+        
+        with tempfile.TemporaryDirectory() as folder:
+            themes_path = os.path.join(folder, 'temas.jsonl')
+            with open(themes_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'theme': 'Dragões'}) + "\n")
+                f.write(json.dumps({'theme': 'Piratas', 'instructions': 'para crianças'}) + "\n")
+            jobs = load_jobs(themes_path)
+            
+            output_root = os.path.join(folder, 'output')
+            text_generator = FakeTextGenerator()
+            image_generator = FlakyImageGenerator()
+            image_generator.fail_on = 'Piratas'
+            
+            def make_runner():
+                runner = BatchRunner(output_root, 2, text_generator, image_generator)
+                runner.composite_workers = 1
+                return runner
+            
+            def writer_threads():
+                return sum(thread.name == 'image-writer' for thread in threading.enumerate())
+            
+            writers = writer_threads()
+            
+            # First run: one book fails half-way (as if the process crashed)
+            if make_runner().run(jobs) != 1:
+                print("❌ Expected exactly one failed book")
+                return False
+            
+            # Every book stops its image writer, including the failed one
+            if writer_threads() != writers:
+                print(f"❌ {writer_threads() - writers} image writer threads left running")
+                return False
+            
+            image_generator.fail_on = None
+            image_calls = image_generator.calls
+            if make_runner().run(jobs) != 0:
+                print("❌ Resumed batch did not finish")
+                return False
+            
+            # The structure of the failed book is reused, and only its missing image is generated
+            if len(text_generator.calls) != 2 or image_generator.calls - image_calls != 1:
+                print(f"❌ Resume redid work: {len(text_generator.calls)} structures, "
+                      f"{image_generator.calls - image_calls} new images")
+                return False
+            
+            for name in ('livro_de_dragões', 'livro_de_piratas'):
+                final_page = os.path.join(output_root, name, 'page_002_final.png')
+                if not os.path.exists(final_page):
+                    print(f"❌ Missing final page: {final_page}")
+                    return False
+            
+            # A finished batch does nothing on a new run
+            calls = (len(text_generator.calls), image_generator.calls)
+            make_runner().run(jobs)
+            if (len(text_generator.calls), image_generator.calls) != calls:
+                print("❌ Finished books were generated again")
+                return False
+        
+        print("✅ Books built in batch and resumed after a failure")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Batch mode test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_gemini_client():
+    """Test retries, AIMD concurrency and quotas against a throttling fake model"""
+    print("\n" + "=" * 60)
+    print("Testing Rate-Limited Gemini Client")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from ternarius_atlas.gemini_client import GeminiClient, TokenBucket
+        
+        class FakeApiError(Exception):
+            def __init__(self, code):
+                super().__init__(f"HTTP {code}")
+                self.code = code
+        
+        class ThrottlingModel:
+            """Rejects requests with 429 while more than 2 are in flight"""
+            def __init__(self):
+                self.in_flight = 0
+                self.rejected = 0
+                self.lock = threading.Lock()
+            
+            def generate_content(self, prompt, **kwargs):
+                with self.lock:
+                    self.in_flight += 1
+                    overloaded = self.in_flight > 2
+                try:
+                    if overloaded:
+                        with self.lock:
+                            self.rejected += 1
+                        raise FakeApiError(429)
+                    time.sleep(0.01)
+                    return FakeResponse(prompt.upper())
+                finally:
+                    with self.lock:
+                        self.in_flight -= 1
+        
+        model = ThrottlingModel()
+        client = GeminiClient(
+            model, requests_per_minute=60000, tokens_per_minute=10 ** 9,
+            max_retries=20, backoff_base=0.005, backoff_max=0.02,
+            initial_concurrency=6, max_concurrency=8
+        )
+        limits = []
+        
+        def call(i):
+            text = client.generate_content(f"pedido {i}").text
+            limits.append(client.concurrency.limit)
+            return text
+        
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            texts = list(executor.map(call, range(24)))
+        
+        if texts != [f"PEDIDO {i}" for i in range(24)]:
+            print("❌ Some calls did not succeed")
+            return False
+        stats = client.metrics.summary()
+        if model.rejected == 0 or stats['throttled'] != model.rejected or min(limits) >= 6:
+            print(f"❌ Throttling was not handled: {stats}, min limit {min(limits)}")
+            return False
+        if stats['calls'] != 24 or stats['failures'] or 'p95' not in stats:
+            print(f"❌ Unexpected metrics: {stats}")
+            return False
+        
+        # Client errors are not retried
+        class BadRequestModel:
+            calls = 0
+            def generate_content(self, prompt, **kwargs):
+                self.calls += 1
+                raise FakeApiError(400)
+        
+        bad = BadRequestModel()
+        try:
+            GeminiClient(bad, max_retries=3, backoff_base=0.001).generate_content("x")
+            print("❌ 400 error was swallowed")
+            return False
+        except FakeApiError:
+            pass
+        if bad.calls != 1:
+            print(f"❌ 400 error was retried ({bad.calls} calls)")
+            return False
+        
+        # A stream keeps its concurrency slot until it is consumed or closed,
+        # and the tokens are settled from the final usage report
+        class FakeUsage:
+            def __init__(self, total):
+                self.total_token_count = total
+        
+        class StreamingModel:
+            def generate_content(self, prompt, stream=False, **kwargs):
+                return iter([FakeResponse("a"), FakeResponse("b"), FakeResponse("c", FakeUsage(5000))])
+        
+        streaming = GeminiClient(StreamingModel(), requests_per_minute=60000, tokens_per_minute=10 ** 6,
+                                 initial_concurrency=2, max_concurrency=2)
+        stream = streaming.generate_content("conte uma história", stream=True)
+        next(stream)
+        if streaming.concurrency.in_flight != 1:
+            print("❌ Stream released its slot before it was consumed")
+            return False
+        tokens_before = streaming.tokens.tokens
+        if ''.join(chunk.text for chunk in stream) != "bc" or streaming.concurrency.in_flight != 0:
+            print("❌ Stream slot was not released after the last chunk")
+            return False
+        settled = 5000 - streaming.estimate_tokens("conte uma história")
+        if tokens_before - streaming.tokens.tokens < settled - 100:
+            print("❌ Stream tokens were not settled from the last chunk's usage")
+            return False
+        
+        closed = streaming.generate_content("outra", stream=True)
+        next(closed)
+        closed.close()
+        if streaming.concurrency.in_flight != 0:
+            print("❌ Closed stream kept its slot")
+            return False
+        
+        # The token bucket spaces out requests beyond its burst
+        bucket = TokenBucket(per_minute=1200)  # 20 per second, burst of 1200
+        bucket.tokens = 0
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        if time.monotonic() - start < 0.15:
+            print("❌ Token bucket did not wait for refills")
+            return False
+        
+        print(f"✅ {model.rejected} throttled calls retried, concurrency limit fell to {min(limits):.1f}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Gemini client test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_structured_output():
+    """Test JSON structure parsing, local repair and the text-format fallback"""
+    print("\n" + "=" * 60)
+    print("Testing Structured JSON Output")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import json
+        import tempfile
+        from ternarius_atlas.response_cache import ResponseCache
+        from ternarius_atlas.structured_output import parse_chapters_batch, repair_json
+        from ternarius_atlas.text_generator import TextGenerator
+        
+        book = {
+            'description': 'Aventuras no mar',
+            'pages': [
+                {'type': 'cover', 'title': 'Piratas', 'text': '', 'illustration_description': 'Navio'},
+                {'type': 'chapter', 'title': 'O Mapa', 'text': 'Um "mapa" antigo.', 'illustration_description': 'Mapa'},
+                {'type': 'content', 'title': 'A Ilha', 'text': 'Terra à vista!', 'illustration_description': 'Ilha'},
+            ],
+            'title': 'Piratas do Sul',
+            'total_pages': 3,
+        }
+        response = json.dumps(book, ensure_ascii=False)
+        
+        # Code fences, trailing commas and truncated responses are repaired locally
+        if repair_json(f"```json\n{response}\n```") != book:
+            print("❌ Fenced JSON was not parsed")
+            return False
+        if repair_json('{"pages": ["um", "dois",],}') != {'pages': ['um', 'dois']}:
+            print("❌ Trailing commas were not repaired")
+            return False
+        truncated = repair_json(response[:response.index('A Ilha') + 3])
+        if [page['title'] for page in truncated['pages']] != ['Piratas', 'O Mapa', 'A I']:
+            print(f"❌ Truncated JSON was not repaired: {truncated}")
+            return False
+        
+        # Only a cut-off response drops its (possibly incomplete) last chapter
+        if repair_json('{"pages": ["um",],}', report_truncation=True) != ({'pages': ['um']}, 0):
+            print("❌ A trailing comma was reported as truncation")
+            return False
+        chapters = {'chapters': [
+            {'title': 'Um', 'pages': ['Texto um.'], 'illustration_prompt': 'Sol'},
+            {'title': 'Dois', 'pages': ['Texto dois.'], 'illustration_prompt': 'Lua'},
+        ]}
+        batch = json.dumps(chapters, ensure_ascii=False)
+        results = parse_chapters_batch(batch[:-2] + ',]}', ['Um', 'Dois'])
+        if [result and result['pages'] for result in results] != [['Texto um.'], ['Texto dois.']]:
+            print(f"❌ Last chapter of a repaired (not truncated) response was dropped: {results}")
+            return False
+        results = parse_chapters_batch(batch[:-1], ['Um', 'Dois'])
+        if [result and result['pages'] for result in results] != [['Texto um.'], ['Texto dois.']]:
+            print(f"❌ Complete last chapter of a cut-off response was dropped: {results}")
+            return False
+        results = parse_chapters_batch(batch[:batch.index('Texto dois') + 5], ['Um', 'Dois'])
+        if [result and result['pages'] for result in results] != [['Texto um.'], None]:
+            print(f"❌ Last chapter of a truncated response was kept: {results}")
+            return False
+        
+        with tempfile.TemporaryDirectory() as cache_dir:
+            generator = TextGenerator(cache=ResponseCache(os.path.join(cache_dir, "responses.sqlite3")))
+            
+            # A JSON answer is streamed page by page and keeps the book header
+            generator.model = FakeModel(response, chunk_size=11)
+            pages = list(generator.stream_detailed_ebook_structure("Piratas"))
+            config_sent = generator.model.calls[0].get('generation_config', {})
+            if config_sent.get('response_mime_type') != 'application/json':
+                print("❌ JSON output was not requested")
+                return False
+            if [page['title'] for page in pages] != ['Piratas', 'O Mapa', 'A Ilha']:
+                print(f"❌ Unexpected streamed pages: {pages}")
+                return False
+            structure = generator.generate_detailed_ebook_structure("Piratas")
+            if structure['title'] != 'Piratas do Sul' or structure['pages'][1]['text'] != 'Um "mapa" antigo.':
+                print(f"❌ Unexpected structure: {structure}")
+                return False
+            
+            # A model that ignores JSON mode still goes through the text parser
+            generator.model = FakeModel(
+                "TÍTULO: Livro Antigo\n---PÁGINA 1---\nTIPO: cover\nTÍTULO: Capa\nILUSTRAÇÃO: Céu\n",
+                chunk_size=11
+            )
+            structure = generator.generate_detailed_ebook_structure("Antigo")
+            if structure['title'] != 'Livro Antigo' or structure['pages'][0]['title'] != 'Capa':
+                print(f"❌ Text format fallback failed: {structure}")
+                return False
+            
+            # Chapter content
+            generator.model = FakeModel('{"pages": ["Primeira página.", "Segunda página."]}')
+            if generator.generate_chapter_content("Tema", "Capítulo", 2) != ["Primeira página.", "Segunda página."]:
+                print("❌ JSON chapter pages were not parsed")
+                return False
+            generator.model = FakeModel("[PÁGINA 1]\nTexto um.\n[PÁGINA 2]\nTexto dois.")
+            if generator.generate_chapter_content("Tema", "Outro Capítulo", 2) != ["Texto um.", "Texto dois."]:
+                print("❌ Text chapter fallback failed")
+                return False
+            generator.cache.close()
+        
+        print("✅ JSON responses parsed, repaired and streamed; text format still works")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Structured output test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_chapter_batching():
+    """Test that chapters are written in a few batched requests"""
+    print("\n" + "=" * 60)
+    print("Testing Batched Chapter Generation")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import json
+        import re
+        import tempfile
+        from ternarius_atlas import EbookGenerator
+        from ternarius_atlas.response_cache import ResponseCache
+        from ternarius_atlas.text_generator import TextGenerator
+        
+        def request_kind(prompt):
+            if 'Crie uma estrutura' in prompt:
+                return 'structure'
+            if 'seguintes capítulos' in prompt:
+                return 'batch'
+            if 'Capítulo:' in prompt:
+                return 'chapter'
+            return 'image_prompt'
+        
+        def answer(prompt, truncate=False):
+            kind = request_kind(prompt)
+            if kind == 'structure':
+                chapters = '\n'.join(f"CAPÍTULO {i}: Cap {i}" for i in range(1, 11))
+                return f"TÍTULO: Livro em Lote\n{chapters}"
+            if kind == 'batch':
+                titles = re.findall(r'^\s*\d+\. (.+)$', prompt, re.MULTILINE)
+                text = json.dumps({'chapters': [
+                    {'title': title, 'pages': [f"{title} página {i}" for i in (1, 2)],
+                     'illustration_prompt': f"Ilustração de {title}"}
+                    for title in titles
+                ]})
+                # A response cut off in the middle of its last chapter
+                return text[:-40] if truncate else text
+            if kind == 'chapter':
+                return json.dumps({'pages': ["Página avulsa 1", "Página avulsa 2"]})
+            return "Ilustração"
+        
+        # Chapters are packed up to the token budget
+        titles = [f"Cap {i}" for i in range(1, 11)]
+        batches = TextGenerator.plan_chapter_batches(titles, 2, token_budget=2200)
+        if [len(batch) for batch in batches] != [2, 2, 2, 2, 2]:
+            print(f"❌ Unexpected batches: {batches}")
+            return False
+        
+        with tempfile.TemporaryDirectory() as work_dir:
+            cache = ResponseCache(os.path.join(work_dir, "responses.sqlite3"))
+            generator = EbookGenerator(output_dir=os.path.join(work_dir, "output"))
+            generator.text_generator = TextGenerator(cache=cache)
+            model = FakeModel(answer)
+            generator.text_generator.model = model
+            
+            pages = generator.generate_ebook("Lote", num_chapters=10, pages_per_chapter=2, max_workers=2)
+            if len(pages) != 22:
+                print(f"❌ Expected 22 pages, got {len(pages)}")
+                return False
+            requests = [request_kind(prompt) for prompt in model.prompts]
+            if requests.count('structure') != 1 or len(requests) > 3 or 'image_prompt' in requests:
+                print(f"❌ Too many requests for 10 chapters: {requests}")
+                return False
+            
+            # A truncated batch only regenerates the chapter that was cut off
+            text_generator = TextGenerator(cache=cache)
+            text_generator.model = FakeModel(lambda prompt: answer(prompt, truncate=True))
+            results = text_generator.generate_chapters_batch("Outro tema", titles[:3], 2)
+            fallback = [request_kind(prompt) for prompt in text_generator.model.prompts]
+            if fallback != ['batch', 'chapter']:
+                print(f"❌ Unexpected fallback calls: {fallback}")
+                return False
+            if results[0]['pages'] != ["Cap 1 página 1", "Cap 1 página 2"] or \
+                    results[2]['pages'] != ["Página avulsa 1", "Página avulsa 2"]:
+                print(f"❌ Chapters were not split back correctly: {results}")
+                return False
+        
+        print(f"✅ 10 chapters written with {len(requests)} requests ({', '.join(requests)})")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chapter batching test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_packaging():
+    """Test streaming PDF/EPUB packaging with image deduplication"""
+    print("\n" + "=" * 60)
+    print("Testing PDF and EPUB Packaging")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import re
+        import tempfile
+        import tracemalloc
+        import zipfile
+        from PIL import Image
+        from ternarius_atlas.packager import write_epub, write_pdf
+        
+        with tempfile.TemporaryDirectory() as work_dir:
+            # Noise pages (incompressible) plus one page repeated three times
+            paths = []
+            for i in range(24):
+                path = os.path.join(work_dir, f"page_{i:03d}.png")
+                Image.frombytes('RGB', (300, 400), os.urandom(300 * 400 * 3)).save(path, compress_level=1)
+                paths.append(path)
+            paths += [paths[0], paths[0]]
+            page_bytes = 300 * 400 * 3
+            
+            pdf_path = os.path.join(work_dir, "livro.pdf")
+            tracemalloc.start()
+            write_pdf(iter(paths), pdf_path, title="Livro de Ação", author="Teste")
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            
+            if peak > 6 * page_bytes:
+                print(f"❌ Memory grew with the book: peak {peak} bytes for {len(paths)} pages")
+                return False
+            
+            with open(pdf_path, 'rb') as f:
+                data = f.read()
+            if not data.startswith(b'%PDF-1.4') or b'/Count 26' not in data:
+                print("❌ PDF header or page count is wrong")
+                return False
+            if data.count(b'/Subtype /Image') != 24:
+                print("❌ Identical images were not deduplicated in the PDF")
+                return False
+            
+            # Every cross-reference entry must point at its object
+            xref_offset = int(re.search(rb'startxref\n(\d+)', data).group(1))
+            entries = re.findall(rb'(\d{10}) 00000 n ', data[xref_offset:])
+            for number, offset in enumerate(entries, 1):
+                if not data[int(offset):].startswith(b'%d 0 obj' % number):
+                    print(f"❌ Broken cross-reference for object {number}")
+                    return False
+            
+            # Recompressed JPEG pages are much smaller
+            jpeg_path = write_pdf(paths[:4], os.path.join(work_dir, "jpeg.pdf"), image_format='jpeg', quality=60)
+            if b'/DCTDecode' not in open(jpeg_path, 'rb').read():
+                print("❌ JPEG recompression was not applied")
+                return False
+            
+            pages = [{'image_path': path, 'type': 'cover' if i == 0 else 'content',
+                      'title': f"Página {i} & <fim>", 'text': "Primeiro parágrafo.\n\nSegundo parágrafo."}
+                     for i, path in enumerate(paths)]
+            epub_path = write_epub(iter(pages), os.path.join(work_dir, "livro.epub"), "Livro de Ação",
+                                   author="Teste", image_format='webp')
+            
+            with zipfile.ZipFile(epub_path) as epub:
+                infos = epub.infolist()
+                if infos[0].filename != 'mimetype' or infos[0].compress_type != zipfile.ZIP_STORED:
+                    print("❌ EPUB mimetype entry must come first and uncompressed")
+                    return False
+                names = epub.namelist()
+                images = [name for name in names if name.startswith('OEBPS/images/')]
+                xhtml_pages = [name for name in names if re.match(r'OEBPS/page_\d+\.xhtml', name)]
+                if len(images) != 24 or len(xhtml_pages) != 26 or not all(n.endswith('.webp') for n in images):
+                    print(f"❌ Unexpected EPUB contents: {len(images)} images, {len(xhtml_pages)} pages")
+                    return False
+                opf = epub.read('OEBPS/content.opf').decode('utf-8')
+                page = epub.read('OEBPS/page_002.xhtml').decode('utf-8')
+                if 'cover-image' not in opf or 'Página 1 &amp; &lt;fim&gt;' not in page or page.count('<p>') != 2:
+                    print("❌ EPUB metadata or page text is wrong")
+                    return False
+        
+        print(f"✅ PDF and EPUB of 26 pages written with a peak of {peak / 1024:.0f} KB")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Packaging test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_image_writer():
+    """Test output profiles and the background image writer"""
+    print("\n" + "=" * 60)
+    print("Testing Image Writer")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import tempfile
+        import threading
+        import time
+        from PIL import Image
+        from ternarius_atlas.image_writer import ImageWriter, PROFILES, profile_path, save_image
+        
+        image = Image.new('RGBA', (120, 80), (200, 100, 50, 255))
+        
+        with tempfile.TemporaryDirectory() as work_dir:
+            # Each profile writes its own format and extension
+            for name, settings in PROFILES.items():
+                path = profile_path(os.path.join(work_dir, f"page_{name}.png"), name)
+                save_image(image, path, name)
+                with Image.open(path) as saved:
+                    if not path.endswith(settings['extension']) or saved.format != settings['format']:
+                        print(f"❌ Profile {name} wrote {saved.format} to {path}")
+                        return False
+            
+            # submit() returns before the image is encoded; callbacks run once the file exists
+            release = threading.Event()
+            recorded = []
+            
+            def record(path):
+                release.wait(5)
+                recorded.append((path, os.path.exists(path)))
+            
+            writer = ImageWriter('fast_png', max_pending=2)
+            paths = [writer.path(os.path.join(work_dir, f"async_{i}.png")) for i in range(4)]
+            start_time = time.time()
+            futures = [writer.submit(image, paths[0], callback=record), writer.submit(image, paths[1])]
+            if time.time() - start_time > 1 or futures[0].done():
+                print("❌ submit() waited for the image to be saved")
+                return False
+            
+            # The queue is bounded: a third pending image makes the caller wait
+            blocked = threading.Thread(target=lambda: [writer.submit(image, p) for p in paths[2:]])
+            blocked.start()
+            blocked.join(0.3)
+            if not blocked.is_alive():
+                print("❌ The writer queue is not bounded")
+                return False
+            release.set()
+            blocked.join(5)
+            writer.flush()
+            if recorded != [(paths[0], True)] or not all(os.path.exists(p) for p in paths):
+                print(f"❌ Images were not all saved: {recorded}")
+                return False
+            
+            # Errors surface on flush, and no temporary files are left behind
+            writer.submit(image, os.path.join(work_dir, "missing", "page.png"))
+            try:
+                writer.flush()
+                print("❌ Save error was not reported")
+                return False
+            except OSError:
+                pass
+            writer.close()
+            leftovers = [name for name in os.listdir(work_dir) if name.endswith('.tmp')]
+            if leftovers:
+                print(f"❌ Temporary files left behind: {leftovers}")
+                return False
+        
+        print(f"✅ {len(PROFILES)} profiles written; saving runs off the caller's thread with a bounded queue")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Image writer test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_benchmark_harness():
+    """Test the benchmark harness and the regression check"""
+    print("\n" + "=" * 60)
+    print("Testing Benchmark Harness")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from benchmarks.cases import CASES
+        from benchmarks.harness import compare, measure
+        
+        expected = {'composer.wrap_text', 'composer.create_page', 'composer.add_text_to_page',
+                    'image_generator.generate_image', 'image_generator.generate_cover_image',
+                    'genesis.generate_page_1_cover', 'genesis.generate_page_8_ending',
+                    'structure_parser.text', 'structure_parser.json', 'ebook.generate_ebook'}
+        if not expected <= set(CASES):
+            print(f"❌ Missing benchmark cases: {expected - set(CASES)}")
+            return False
+        
+        setup, _ = CASES['structure_parser.json']
+        function, items = setup()
+        if len(function()['pages']) != 30:
+            print("❌ Structure parser case did not parse the stub book")
+            return False
+        result = measure(function, repeat=5, warmup=1, items=items)
+        if not (0 < result['p50_ms'] <= result['p95_ms']) or result['throughput_per_s'] <= 0:
+            print(f"❌ Unexpected measurement: {result}")
+            return False
+        
+        baseline = {'benchmarks': {'case': {'p50_ms': 10.0, 'peak_rss_mb': 100.0}}}
+        slower = {'benchmarks': {'case': {'p50_ms': 12.0, 'peak_rss_mb': 105.0}}}
+        similar = {'benchmarks': {'case': {'p50_ms': 11.0, 'peak_rss_mb': 105.0}}}
+        regressions = compare(slower, baseline, tolerance=0.15, rss_tolerance=0.10)
+        if [r['metric'] for r in regressions] != ['p50_ms'] or compare(similar, baseline):
+            print(f"❌ Regression check failed: {regressions}")
+            return False
+        
+        print(f"✅ {len(CASES)} benchmark cases; parser p50 {result['p50_ms']:.2f} ms; regressions detected")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Benchmark harness test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_tracing():
+    """Test spans, the Chrome trace export and the summary table"""
+    print("\n" + "=" * 60)
+    print("Testing Tracing")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import json
+        import tempfile
+        import time
+        from PIL import Image
+        from ternarius_atlas import tracing
+        from ternarius_atlas.compositing import compose_pages, make_page_spec
+        from ternarius_atlas.image_writer import save_image
+        
+        # Disabled: nothing is recorded and a span costs almost nothing
+        tracer = tracing.Tracer(enabled=False)
+        start_time = time.perf_counter()
+        for _ in range(10000):
+            with tracer.span('noop', page=1):
+                pass
+        per_span = (time.perf_counter() - start_time) / 10000
+        if tracer.events or per_span > 20e-6:
+            print(f"❌ Disabled tracer recorded spans or is slow ({per_span * 1e6:.2f} µs/span)")
+            return False
+        
+        tracer.enabled = True
+        with tracer.span('outer'):
+            with tracer.span('inner', page=3) as inner:
+                inner.set(cached=True)
+        try:
+            with tracer.span('failing'):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+        
+        events = {event['name']: event for event in tracer.chrome_trace()['traceEvents'] if event['ph'] == 'X'}
+        outer, inner = events['outer'], events['inner']
+        if not (outer['ts'] <= inner['ts'] and inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur'] + 1):
+            print(f"❌ Spans don't nest: {outer} {inner}")
+            return False
+        if inner['args'] != {'page': 3, 'cached': True} or events['failing']['args'].get('error') != 'ValueError':
+            print(f"❌ Unexpected span arguments: {inner['args']} {events['failing']['args']}")
+            return False
+        
+        rows = {row['name']: row for row in tracer.summary()}
+        if rows['outer']['count'] != 1 or 'inner' not in tracer.format_summary():
+            print("❌ Summary is missing spans")
+            return False
+        
+        # Process-wide tracer: encoding/writing split and spans from worker processes
+        tracing.tracer.reset()
+        tracing.tracer.enabled = True
+        try:
+            with tempfile.TemporaryDirectory() as folder:
+                image_path = save_image(Image.new('RGB', (200, 300), (200, 220, 240)), os.path.join(folder, 'base.png'))
+                specs = [
+                    make_page_spec({'type': 'content', 'title': f"Página {i}", 'text': "Texto."}, i,
+                                   image_path, os.path.join(folder, f"page_{i}.png"))
+                    for i in range(1, 4)
+                ]
+                list(compose_pages(specs, workers=2))
+                
+                trace_path = tracing.tracer.export_chrome(os.path.join(folder, 'trace.json'))
+                with open(trace_path, 'r', encoding='utf-8') as f:
+                    trace = json.load(f)
+        finally:
+            tracing.tracer.enabled = False
+        
+        spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        names = {event['name'] for event in spans}
+        pids = {event['pid'] for event in spans if event['name'] == 'compose.page'}
+        if not {'compose.page', 'image.encode', 'image.write'} <= names:
+            print(f"❌ Missing pipeline spans: {names}")
+            return False
+        if len([e for e in spans if e['name'] == 'compose.page']) != 3 or os.getpid() in pids:
+            print("❌ Spans from the compositing processes were not merged")
+            return False
+        if not any(event['ph'] == 'M' for event in trace['traceEvents']):
+            print("❌ Thread names are missing from the trace")
+            return False
+        tracing.tracer.reset()
+        
+        print(f"✅ Disabled span {per_span * 1e6:.2f} µs; {len(spans)} spans exported from {len(pids) + 1} processes")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Tracing test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_tiled_vae_decode():
+    """Test memory-bounded tile planning and streamed tile blending"""
+    print("\n" + "=" * 60)
+    print("Testing Tiled VAE Decode")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import numpy as np
+        from ternarius_atlas.tiled_vae import (
+            MemoryBoundedPipeline,
+            choose_tile_size,
+            decode_memory,
+            decode_tiled,
+            plan_tiles,
+        )
+        
+        # Tiles cover the axis, overlap and end at the edge
+        tiles = plan_tiles(150, 64, 8)
+        if tiles[0][0] != 0 or tiles[-1][1] != 150 or any(b[0] >= a[1] - 7 for a, b in zip(tiles, tiles[1:])):
+            print(f"❌ Bad tile plan: {tiles}")
+            return False
+        
+        # A smaller budget never picks a larger tile; a page fits whole in a big one
+        sizes = [choose_tile_size(mb * 1024 * 1024, 800, 1200) for mb in (64, 256, 1024, 8192)]
+        if sizes != sorted(sizes) or sizes[-1] != 1200 or decode_memory(sizes[1], sizes[1]) > 256 * 1024 * 1024:
+            print(f"❌ Unexpected tile sizes for growing budgets: {sizes}")
+            return False
+        
+        # Fake VAE: every latent pixel becomes an 8x8 block of its first 3 channels
+        rng = np.random.default_rng(0)
+        latents = rng.random((150, 100, 4), dtype=np.float32)
+        calls = []
+        
+        def decode_tile(y0, y1, x0, x1):
+            calls.append((y0, y1, x0, x1))
+            block = latents[y0:y1, x0:x1, :3]
+            return np.repeat(np.repeat(block, 8, axis=0), 8, axis=1)
+        
+        expected = np.clip(np.repeat(np.repeat(latents[:, :, :3], 8, 0), 8, 1) * 255 + 0.5, 0, 255).astype(np.uint8)
+        whole = np.asarray(decode_tiled(decode_tile, 150, 100, 150, 8))
+        tiled = np.asarray(decode_tiled(decode_tile, 150, 100, 32, 8))
+        if len(calls) <= 2 or whole.shape != (1200, 800, 3):
+            print(f"❌ Unexpected decode calls: {len(calls)}")
+            return False
+        if np.abs(tiled.astype(int) - expected).max() > 1 or np.abs(whole.astype(int) - expected).max() > 1:
+            print("❌ Tiled decode differs from the whole-image decode")
+            return False
+        
+        # The wrapper delegates to the pipeline and enables slicing
+        class FakePipe:
+            device = 'cpu'
+            def __init__(self):
+                self.enabled = []
+            def enable_attention_slicing(self, size=None):
+                self.enabled.append(('attention', size))
+            def enable_vae_slicing(self):
+                self.enabled.append(('vae', None))
+        
+        pipe = MemoryBoundedPipeline(FakePipe(), budget_mb=2048)
+        if pipe.device != 'cpu' or ('attention', 'max') not in pipe.enabled or pipe.budget != 2048 * 1024 * 1024:
+            print("❌ Memory-bounded wrapper did not configure the pipeline")
+            return False
+        
+        print(f"✅ Tile sizes {sizes} for 64 MB..8 GB; {len(calls) - 1} tiles blend to the exact image")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Tiled VAE decode test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_upscaler():
+    """Test native-resolution sizes and the upscaler quality profiles"""
+    print("\n" + "=" * 60)
+    print("Testing Upscaler")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        from PIL import Image, ImageDraw
+        from ternarius_atlas import tracing
+        from ternarius_atlas.upscaler import QUALITY_PROFILES, Upscaler, native_size
+        
+        if native_size(800, 1200) != (512, 768) or native_size(1200, 800) != (768, 512):
+            print(f"❌ Unexpected native size: {native_size(800, 1200)}")
+            return False
+        if native_size(400, 300) != (400, 296):
+            print(f"❌ Small pages must not be upscaled: {native_size(400, 300)}")
+            return False
+        
+        image = Image.new('RGB', (512, 768), (230, 220, 250))
+        ImageDraw.Draw(image).rectangle([100, 100, 300, 400], fill=(90, 60, 140))
+        
+        tracing.tracer.reset()
+        tracing.tracer.enabled = True
+        try:
+            results = {quality: Upscaler(quality).upscale(image, (800, 1200)) for quality in QUALITY_PROFILES}
+        finally:
+            tracing.tracer.enabled = False
+        names = {row['name'] for row in tracing.tracer.summary()}
+        tracing.tracer.reset()
+        
+        if any(result.size != (800, 1200) for result in results.values()):
+            print("❌ Upscaled image has the wrong size")
+            return False
+        if results['fast'].tobytes() == results['balanced'].tobytes():
+            print("❌ Quality profiles produced the same image")
+            return False
+        if not {'upscale.resize', 'upscale.sharpen'} <= names:
+            print(f"❌ Upscale stages were not timed: {names}")
+            return False
+        if Upscaler('fast').upscale(results['fast'], (800, 1200)) is not results['fast']:
+            print("❌ Image already at the target size was resized")
+            return False
+        
+        try:
+            Upscaler('ultra')
+            print("❌ Unknown quality profile accepted")
+            return False
+        except ValueError:
+            pass
+        
+        print(f"✅ 800x1200 pages generated at {native_size(800, 1200)}; {len(results)} quality profiles")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Upscaler test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_prompt_embedding_cache():
+    """Test the LRU of text-encoder outputs"""
+    print("\n" + "=" * 60)
+    print("Testing Prompt Embedding Cache")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        from ternarius_atlas.prompt_cache import PromptEmbeddingCache
+        
+        class WordTokenizer:
+            """One token per word, padded/truncated like the CLIP tokenizer"""
+            model_max_length = 8
+            
+            def __call__(self, text, padding, max_length, truncation):
+                ids = [sum(map(ord, word)) for word in text.split()][:max_length]
+                return {'input_ids': ids + [0] * (max_length - len(ids))}
+        
+        encoded = []
+        
+        def encode(token_ids):
+            encoded.append(token_ids)
+            return ('embedding', token_ids)
+        
+        cache = PromptEmbeddingCache(WordTokenizer(), encode, max_entries=2)
+        negative = "ugly, blurry, low quality"
+        
+        first = cache.get(negative)
+        for page in range(3):
+            cache.get(f"a rabbit on page {page}")
+            if cache.get(negative) is not first:
+                print("❌ Negative prompt was encoded again")
+                return False
+        
+        if len(encoded) != 4 or cache.hits != 3 or cache.misses != 4 or len(cache) != 2:
+            print(f"❌ Unexpected cache stats: {len(encoded)} encodes, {cache.hits} hits, {len(cache)} entries")
+            return False
+        
+        # Texts the encoder sees identically (after truncation) share an entry
+        cache.get("one two three four five six seven eight nine")
+        cache.get("one two three four five six seven eight ten")
+        if len(encoded) != 5:
+            print("❌ Cache key is not the tokenized text")
+            return False
+        
+        # The least recently used entry was evicted
+        cache.get("a rabbit on page 2")
+        if len(encoded) != 6:
+            print("❌ LRU eviction kept an old entry")
+            return False
+        
+        print(f"✅ {cache.hits} hits, {cache.misses} text-encoder passes for {cache.hits + cache.misses} prompts")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Prompt embedding cache test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_render_profiles():
+    """Test render profile lookup and per-page selection"""
+    print("\n" + "=" * 60)
+    print("Testing Render Profiles")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import tempfile
+        import types
+        from ternarius_atlas.config import Config
+        from ternarius_atlas.schedulers import (
+            LCM_DRAFT_PROFILE, RENDER_PROFILES, SchedulerProfiles, get_render_profile,
+            page_render_profile, unwrap_pipeline
+        )
+        
+        steps = [RENDER_PROFILES[name]['num_inference_steps'] for name in ('draft', 'standard', 'final')]
+        if steps != sorted(steps) or get_render_profile('draft') is not RENDER_PROFILES['draft']:
+            print(f"❌ Unexpected profile steps: {steps}")
+            return False
+        
+        try:
+            get_render_profile('ultra')
+            print("❌ Unknown profile was accepted")
+            return False
+        except ValueError:
+            pass
+        
+        # Page > override > book > Config
+        structure = {'render_profile': 'standard', 'pages': []}
+        cases = [
+            (page_render_profile({}), Config.RENDER_PROFILE),
+            (page_render_profile({}, structure), 'standard'),
+            (page_render_profile({}, structure, 'draft'), 'draft'),
+            (page_render_profile({'render_profile': 'final'}, structure, 'draft'), 'final'),
+        ]
+        for actual, expected in cases:
+            if actual != expected:
+                print(f"❌ Expected profile {expected}, got {actual}")
+                return False
+        
+        # Profiles are applied to the diffusers pipeline inside the wrappers
+        class Wrapper:
+            def __init__(self, pipe):
+                self.pipe = pipe
+            
+            def __getattr__(self, name):
+                return getattr(self.pipe, name)
+        
+        class FakePipeline:
+            scheduler = 'base'
+        
+        pipe = FakePipeline()
+        if unwrap_pipeline(Wrapper(Wrapper(pipe))) is not pipe or unwrap_pipeline(pipe) is not pipe:
+            print("❌ unwrap_pipeline didn't reach the wrapped pipeline")
+            return False
+        
+        # Schedulers come from diffusers; a fake module records what was built
+        class FakeScheduler:
+            def __init__(self, config, **options):
+                self.config = config
+                self.options = options
+            
+            @classmethod
+            def from_config(cls, config, **options):
+                return cls(config, **options)
+        
+        fake_diffusers = types.ModuleType('diffusers')
+        fake_diffusers.DPMSolverMultistepScheduler = type('DPMSolverMultistepScheduler', (FakeScheduler,), {})
+        fake_diffusers.LCMScheduler = type('LCMScheduler', (FakeScheduler,), {})
+        
+        class LoraPipeline:
+            def __init__(self):
+                self.scheduler = FakeScheduler({'num_train_timesteps': 1000})
+                self.loras = []
+                self.lora_enabled = None
+            
+            def load_lora_weights(self, path, adapter_name=None):
+                self.loras.append((path, adapter_name))
+            
+            def enable_lora(self):
+                self.lora_enabled = True
+            
+            def disable_lora(self):
+                self.lora_enabled = False
+        
+        saved_diffusers = sys.modules.get('diffusers')
+        sys.modules['diffusers'] = fake_diffusers
+        try:
+            # Without LCM-LoRA weights every profile uses DPM++ and LoRAs are never touched
+            pipe = LoraPipeline()
+            base_config = pipe.scheduler.config
+            profiles = SchedulerProfiles(Wrapper(pipe), lcm_lora_path=os.path.join(tempfile.gettempdir(), 'missing.safetensors'))
+            for name in ('draft', 'standard', 'final'):
+                settings = profiles.apply(name)
+                expected = RENDER_PROFILES[name]
+                if (type(pipe.scheduler).__name__ != expected['scheduler']
+                        or pipe.scheduler.options != expected['options']
+                        or pipe.scheduler.config is not base_config
+                        or settings['num_inference_steps'] != expected['num_inference_steps']):
+                    print(f"❌ Profile {name} set {type(pipe.scheduler).__name__} {pipe.scheduler.options}, {settings}")
+                    return False
+            final_scheduler = pipe.scheduler
+            profiles.apply('draft')
+            profiles.apply('final')
+            if pipe.scheduler is not final_scheduler or pipe.loras or pipe.lora_enabled is not None:
+                print("❌ Schedulers were rebuilt or LoRAs touched without LCM weights")
+                return False
+            
+            # With the weights, drafts switch to LCM and the LoRA follows the profile
+            with tempfile.TemporaryDirectory() as folder:
+                lora_path = os.path.join(folder, 'lcm_lora.safetensors')
+                with open(lora_path, 'wb') as f:
+                    f.write(b'weights')
+                pipe = LoraPipeline()
+                profiles = SchedulerProfiles(pipe, lcm_lora_path=lora_path)
+                draft = profiles.apply('draft')
+                if (type(pipe.scheduler).__name__ != 'LCMScheduler' or pipe.lora_enabled is not True
+                        or draft != {'num_inference_steps': LCM_DRAFT_PROFILE['num_inference_steps'],
+                                     'guidance_scale': LCM_DRAFT_PROFILE['guidance_scale']}):
+                    print(f"❌ LCM draft not applied: {type(pipe.scheduler).__name__}, {draft}")
+                    return False
+                profiles.apply('final')
+                if type(pipe.scheduler).__name__ != 'DPMSolverMultistepScheduler' or pipe.lora_enabled is not False:
+                    print("❌ LCM-LoRA still enabled for the final profile")
+                    return False
+                profiles.apply('draft')
+                if pipe.lora_enabled is not True or pipe.loras != [(lora_path, 'lcm')]:
+                    print(f"❌ LCM-LoRA not re-enabled or loaded more than once: {pipe.loras}")
+                    return False
+        finally:
+            if saved_diffusers is None:
+                sys.modules.pop('diffusers', None)
+            else:
+                sys.modules['diffusers'] = saved_diffusers
+        
+        print(f"✅ Profiles {', '.join(RENDER_PROFILES)} with {steps} steps")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Render profiles test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_draft_review():
+    """Test that draft images are replaced by final renders after approval"""
+    print("\n" + "=" * 60)
+    print("Testing Draft Review Flow")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import contextlib
+        import io
+        import tempfile
+        from unittest import mock
+        from PIL import Image
+        from main import InteractiveEbookGenerator
+        from ternarius_atlas.build_manifest import BuildManifest
+        from ternarius_atlas.config import Config
+        
+        class ProfileImageGenerator:
+            supports_profiles = True
+            
+            def __init__(self):
+                self.calls = []
+            
+            def generate_image(self, prompt, width=512, height=512, profile=None):
+                self.calls.append((prompt, profile))
+                return Image.new('RGB', (width // 4, height // 4), (200, 180, 160))
+        
+        images = ProfileImageGenerator()
+        with tempfile.TemporaryDirectory() as folder:
+            generator = InteractiveEbookGenerator(image_generator=images, output_root=folder)
+            generator.book_structure = {'title': 'Livro', 'render_profile': 'final', 'pages': [
+                {'type': 'cover', 'title': 'Livro', 'text': '', 'illustration_description': 'capa'},
+                {'type': 'content', 'title': 'Início', 'text': 'Era uma vez.',
+                 'illustration_description': 'campo', 'render_profile': 'standard'},
+            ]}
+            generator.book_title = 'Livro'
+            generator.output_folder = folder
+            
+            # Pages are reviewed as drafts, then approved pages are rendered in full;
+            # the profile is part of the image hash, so the drafts aren't reused
+            with mock.patch('builtins.input', return_value='boas'), contextlib.redirect_stdout(io.StringIO()):
+                approved = generator.step2_generate_images()
+            expected = [
+                ('capa', Config.REVIEW_RENDER_PROFILE), ('campo', 'standard'),
+                ('capa', 'final'),
+            ]
+            if not approved or images.calls != expected:
+                print(f"❌ Unexpected renders: {images.calls}")
+                return False
+            
+            manifest = BuildManifest(folder)
+            cover = generator.book_structure['pages'][0]
+            if not manifest.is_current('images', 1, generator._image_inputs(cover, 'final'), generator._image_path(1)):
+                print("❌ The final render of the cover was not recorded")
+                return False
+            
+            # The final renders are up to date on the next run
+            with contextlib.redirect_stdout(io.StringIO()):
+                generator.generate_images(verbose=False)
+            generator.close()
+            if len(images.calls) != len(expected):
+                print(f"❌ Final renders were regenerated: {images.calls[len(expected):]}")
+                return False
+        
+        print("✅ Drafts reviewed, then replaced by final renders once")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Draft review test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_image_backends():
+    """Test the image backend registry, adapters and async methods"""
+    print("\n" + "=" * 60)
+    print("Testing Image Backends")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        import asyncio
+        from PIL import Image
+        from ternarius_atlas.image_backends import (
+            ImageBackend, WorkerBackend, as_backend, available_backends, create_backend
+        )
+        
+        if not {'placeholder', 'diffusers', 'worker'} <= set(available_backends()):
+            print(f"❌ Missing backends: {available_backends()}")
+            return False
+        
+        try:
+            create_backend('imagen')
+            print("❌ Unknown backend was accepted")
+            return False
+        except ValueError:
+            pass
+        
+        try:
+            ImageBackend()
+            print("❌ ImageBackend without generate() was instantiated")
+            return False
+        except TypeError:
+            pass
+        
+        # Manifests keep hashing the generator class names used before backends
+        from ternarius_atlas.image_generator import ImageGenerator
+        from ternarius_atlas.sd_worker import SDWorkerClient
+        if (create_backend('placeholder').fingerprint != as_backend(ImageGenerator()).fingerprint
+                or WorkerBackend(client=SDWorkerClient()).fingerprint != 'SDWorkerClient'):
+            print("❌ Backend fingerprints changed the image hashes")
+            return False
+        
+        placeholder = create_backend('placeholder')
+        if placeholder.capabilities.batching or placeholder.capabilities.profiles:
+            print(f"❌ Unexpected placeholder capabilities: {placeholder.capabilities}")
+            return False
+        images = placeholder.generate_many(["um dragão", {'prompt': "um castelo", 'width': 64, 'height': 48}])
+        if [image.size for image in images] != [(512, 512), (64, 48)]:
+            print(f"❌ Unexpected image sizes: {[image.size for image in images]}")
+            return False
+        
+        image = asyncio.run(placeholder.agenerate("uma floresta", 40, 30))
+        if image.size != (40, 30):
+            print("❌ agenerate returned the wrong size")
+            return False
+        
+        # Generators with the older generate_image() API are adapted
+        class LegacyGenerator:
+            supports_profiles = True
+            
+            def __init__(self):
+                self.profiles = []
+            
+            def generate_image(self, prompt, width=512, height=512, profile=None):
+                self.profiles.append(profile)
+                return Image.new('RGB', (width, height))
+        
+        legacy = LegacyGenerator()
+        backend = as_backend(legacy)
+        if not isinstance(backend, ImageBackend) or as_backend(backend) is not backend:
+            print("❌ as_backend didn't wrap the generator once")
+            return False
+        asyncio.run(backend.agenerate_many([{'prompt': "a", 'profile': 'draft'}, "b"]))
+        if legacy.profiles != ['draft', None] or backend.name != 'LegacyGenerator':
+            print(f"❌ Adapter passed profiles {legacy.profiles}")
+            return False
+        
+        # The worker backend generates at native size and upscales to the page
+        class FakeClient:
+            def __init__(self):
+                self.requests = []
+            
+            def generate(self, prompt, negative_prompt=None, width=None, height=None, seed=None, profile=None):
+                self.requests.append((width, height, seed, profile, negative_prompt))
+                return Image.new('RGB', (width, height), (120, 140, 160)), 0.0
+        
+        client = FakeClient()
+        worker = WorkerBackend(client=client, native_resolution=True, negative_prompt="feio")
+        page = worker.generate("um jardim", 800, 1200, seed=7, profile='draft')
+        if page.size != (800, 1200) or client.requests != [(512, 768, 7, 'draft', "feio")]:
+            print(f"❌ Unexpected worker request: {client.requests}, image {page.size}")
+            return False
+        
+        try:
+            worker.generate("enorme", 4096, 4096)
+            print("❌ Size above max_size was accepted")
+            return False
+        except ValueError:
+            pass
+        
+        # Chapters asking for the client at once start the worker only once
+        import threading
+        import time
+        from ternarius_atlas import sd_worker
+        
+        starts = []
+        
+        def slow_ensure_worker(factory=None):
+            starts.append(factory)
+            time.sleep(0.1)
+            return client
+        
+        original_ensure_worker = sd_worker.ensure_worker
+        sd_worker.ensure_worker = slow_ensure_worker
+        try:
+            lazy = WorkerBackend()
+            clients = []
+            threads = [threading.Thread(target=lambda: clients.append(lazy.client)) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sd_worker.ensure_worker = original_ensure_worker
+        if len(starts) != 1 or len(clients) != 6 or any(c is not client for c in clients):
+            print(f"❌ The worker was started {len(starts)} times")
+            return False
+        
+        print(f"✅ Backends {', '.join(available_backends())} share one interface")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Image backends test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_sd_generate_batch():
+    """Test micro-batch grouping, page-order saving and OOM halving of generate_batch"""
+    print("\n" + "=" * 60)
+    print("Testing Stable Diffusion Batch Generation")
+    print("=" * 60)
+    
+    try:
+        os.environ['GEMINI_API_KEY'] = 'test_key_not_used'
+        
+        try:
+            import stable_diffusion_generator as sdg
+        except ImportError as e:
+            print(f"⚠️  torch/diffusers not installed, skipping ({e})")
+            return True
+        
+        import contextlib
+        import io
+        import tempfile
+        from types import SimpleNamespace
+        from PIL import Image
+        from ternarius_atlas.upscaler import Upscaler
+        
+        class FakePipeline:
+            """Runs out of memory above max_prompts prompts per call"""
+            def __init__(self, max_prompts):
+                self.max_prompts = max_prompts
+                self.calls = []
+            
+            def __call__(self, prompt, negative_prompt, width, height, generator=None, **settings):
+                self.calls.append(len(prompt))
+                if len(prompt) > self.max_prompts:
+                    raise RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")
+                # The page number is encoded in the red channel
+                return SimpleNamespace(images=[
+                    Image.new('RGB', (width, height), (int(text.split(',')[0][1:]), 0, 0)) for text in prompt
+                ])
+        
+        class FakeProfiles:
+            def apply(self, name):
+                return {'num_inference_steps': 2, 'guidance_scale': 1.0}
+        
+        # The model is never loaded: only the batching logic runs
+        generator = sdg.StableDiffusionImageGenerator.__new__(sdg.StableDiffusionImageGenerator)
+        generator.device = 'cpu'
+        generator.pipe = FakePipeline(max_prompts=2)
+        generator.profiles = FakeProfiles()
+        generator.native_resolution = False
+        generator.upscaler = Upscaler('fast')
+        
+        # Two sizes, interleaved: the second group finishes pages held back by the first
+        small = {'width': 32, 'height': 32}
+        prompts = ['p0', dict(small, prompt='p1'), 'p2', 'p3', dict(small, prompt='p4'), 'p5', 'p6']
+        
+        with tempfile.TemporaryDirectory() as folder:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                paths = generator.generate_batch(prompts, folder, batch_size=4, width=64, height=48)
+            
+            expected = [os.path.join(folder, f"image_{i:03d}.png") for i in range(1, len(prompts) + 1)]
+            saved = [line.split()[-1] for line in output.getvalue().splitlines() if 'Salva:' in line]
+            if paths != expected or saved != [os.path.basename(path) for path in expected]:
+                print(f"❌ Images not saved in page order: {saved}")
+                return False
+            
+            for index, path in enumerate(paths):
+                with Image.open(path) as image:
+                    size = (32, 32) if index in (1, 4) else (64, 48)
+                    if image.size != size or image.getpixel((0, 0))[0] != index:
+                        print(f"❌ {os.path.basename(path)} holds the wrong image ({image.size})")
+                        return False
+        
+        # The first call of 4 ran out of memory, every later call used 2 or fewer
+        calls = generator.pipe.calls
+        if calls[0] != 4 or max(calls[1:]) > 2 or 'reduzindo lote para 2' not in output.getvalue():
+            print(f"❌ Batch size was not halved after OOM: {calls}")
+            return False
+        
+        print(f"✅ {len(prompts)} images saved in order; pipeline calls {calls}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ SD batch generation test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("🧪 Running Ternarius Atlas Tests")
+    print("=" * 60)
+    
+    results = []
+    
+    # Test imports
+    results.append(("Import Test", test_imports()))
+    
+    # Test page composer
+    results.append(("Page Composer Test", test_page_composer()))
+    
+    # Test image generator
+    results.append(("Image Generator Test", test_image_generator()))
+    
+    # Test concurrent chapter pipeline
+    results.append(("Concurrent Chapters Test", test_concurrent_chapters()))
+    
+    # Test LLM response cache
+    results.append(("Response Cache Test", test_response_cache()))
+    
+    # Test text wrapping engine
+    results.append(("Text Wrapping Test", test_text_wrapping()))
+    
+    # Test font registry
+    results.append(("Font Registry Test", test_font_registry()))
+    
+    # Test gradient engine
+    results.append(("Gradient Test", test_gradients()))
+    
+    # Test persistent image worker
+    results.append(("Image Worker Test", test_sd_worker()))
+    
+    # Test incremental build manifest
+    results.append(("Build Manifest Test", test_build_manifest()))
+    
+    # Test rebuilding after the image format changed
+    results.append(("Image Profile Switch Test", test_image_profile_switch()))
+    
+    # Test process-pool page compositing
+    results.append(("Parallel Compositing Test", test_parallel_compositing()))
+    
+    # Test side-effect-free package import
+    results.append(("Lazy Import Test", test_lazy_import()))
+    
+    # Test streaming structure generation
+    results.append(("Streaming Structure Test", test_streaming_structure()))
+    
+    # Test non-interactive batch mode
+    results.append(("Batch Mode Test", test_batch_mode()))
+    
+    # Test rate-limited Gemini client
+    results.append(("Gemini Client Test", test_gemini_client()))
+    
+    # Test structured JSON output
+    results.append(("Structured Output Test", test_structured_output()))
+    
+    # Test batched chapter generation
+    results.append(("Chapter Batching Test", test_chapter_batching()))
+    
+    # Test PDF and EPUB packaging
+    results.append(("Packaging Test", test_packaging()))
+    
+    # Test image output profiles and the background writer
+    results.append(("Image Writer Test", test_image_writer()))
+    
+    # Test the benchmark harness
+    results.append(("Benchmark Harness Test", test_benchmark_harness()))
+    
+    # Test per-stage tracing
+    results.append(("Tracing Test", test_tracing()))
+    
+    # Test memory-bounded tiled VAE decoding
+    results.append(("Tiled VAE Decode Test", test_tiled_vae_decode()))
+    
+    # Test native-resolution upscaling
+    results.append(("Upscaler Test", test_upscaler()))
+    
+    # Test the prompt-embedding cache
+    results.append(("Prompt Embedding Cache Test", test_prompt_embedding_cache()))
+    
+    # Test render profile selection
+    results.append(("Render Profiles Test", test_render_profiles()))
+    
+    # Test draft review followed by final renders in main.py
+    results.append(("Draft Review Test", test_draft_review()))
+    
+    # Test the pluggable image backends
+    results.append(("Image Backends Test", test_image_backends()))
+    
+    # Test micro-batching in the Stable Diffusion generator
+    results.append(("SD Batch Generation Test", test_sd_generate_batch()))
     
     # Summary
     print("\n" + "=" * 60)